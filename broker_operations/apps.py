@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class BrokerOperationsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'broker_operations'
+
+    def ready(self):
+        from . import checks, documents, metrics, signals  # noqa: F401
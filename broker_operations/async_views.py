@@ -0,0 +1,141 @@
+"""
+Async dashboard views for ASGI deployments.
+
+Under ASGI every DRF view runs in a worker thread for its whole duration.
+These views run on the event loop instead: authentication (with the same
+cached user check as ``StatelessJWTAuthentication``), cache and ORM
+calls are awaited (``aget``, ``afirst``, ``aiterator``), and independent
+queries are started together with ``asyncio.gather``. Responses are
+rendered with ``FastJSONRenderer`` from the same serializers (through the
+``fast_read`` path), so bodies and error payloads match the sync views.
+
+``urls.py`` routes the dashboard URLs here when ``DASHBOARD_ASYNC_VIEWS`` is
+set; only JWT authentication is supported.
+"""
+import asyncio
+import functools
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework import exceptions, status
+from rest_framework.views import exception_handler
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .authentication import USER_CACHE_TIMEOUT, StatelessJWTAuthentication, lazy_user, token_user_id, user_cache_key
+from .dashboard import aget_summary
+from .fast_read import FastJSONRenderer, aserialize
+from .models import Application, Reminder, Task
+from .serializers import ApplicationSerializer, ReminderSerializer, TaskSerializer
+
+
+class AsyncJWTAuthentication(StatelessJWTAuthentication):
+    async def aauthenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        """
+        ``get_user`` with the cache and user lookup awaited.
+        """
+        user_id = token_user_id(validated_token)
+        if user_id is not None and await cache.aget(user_cache_key(user_id)):
+            return lazy_user(user_id)
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken('Token contained no recognizable user identification') from e
+        user_model = get_user_model()
+        try:
+            user = await user_model.objects.aget(**{api_settings.USER_ID_FIELD: user_id})
+        except user_model.DoesNotExist as e:
+            raise exceptions.AuthenticationFailed('User not found', code='user_not_found') from e
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise exceptions.AuthenticationFailed('User is inactive', code='user_inactive')
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise exceptions.AuthenticationFailed(
+                    "The user's password has been changed.", code='password_changed'
+                )
+        if user_id is not None:
+            await cache.aset(user_cache_key(user_id), True, USER_CACHE_TIMEOUT)
+        return user
+
+
+authentication = AsyncJWTAuthentication()
+
+
+def render(data, status_code=status.HTTP_200_OK, headers=None):
+    return HttpResponse(
+        FastJSONRenderer().render(data), status=status_code, headers=headers, content_type='application/json',
+    )
+
+
+def async_api_view(view):
+    """
+    An authenticated GET-only async view returning serializable data, with
+    errors rendered the way DRF renders them.
+    """
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            if request.method not in ('GET', 'HEAD'):
+                raise exceptions.MethodNotAllowed(request.method)
+            try:
+                result = await authentication.aauthenticate(request)
+            except exceptions.AuthenticationFailed as exc:
+                exc.auth_header = authentication.authenticate_header(request)
+                raise
+            if result is None:
+                exc = exceptions.NotAuthenticated()
+                exc.auth_header = authentication.authenticate_header(request)
+                raise exc
+            request.user, request.auth = result
+            return await view(request, *args, **kwargs)
+        except exceptions.APIException as exc:
+            response = exception_handler(exc, {})
+            headers = {name: value for name, value in response.items() if name != 'Content-Type'}
+            return render(response.data, response.status_code, headers)
+    return wrapper
+
+
+@async_api_view
+async def dashboard_summary(request):
+    summary, hit = await aget_summary(request.user.id)
+    return render(summary, headers={'X-Cache': 'HIT' if hit else 'MISS'})
+
+
+@async_api_view
+async def dashboard_activity(request):
+    user = request.user
+    applications, tasks = await asyncio.gather(
+        aserialize(ApplicationSerializer, Application.objects.filter(broker=user).order_by('-created_at')[:5]),
+        aserialize(TaskSerializer, Task.objects.filter(broker=user).order_by('-created_at')[:5]),
+    )
+    return render({'recent_applications': applications, 'recent_tasks': tasks})
+
+
+@async_api_view
+async def dashboard_reminders(request):
+    return render(await aserialize(ReminderSerializer, Reminder.objects.filter(
+        broker=request.user,
+        is_completed=False,
+        due_date__gte=timezone.now()
+    ).order_by('due_date')))
+
+
+@async_api_view
+async def dashboard_tasks(request):
+    return render(await aserialize(TaskSerializer, Task.objects.filter(
+        broker=request.user,
+        status__in=['pending', 'in_progress']
+    ).order_by('due_date')))
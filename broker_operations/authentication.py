@@ -0,0 +1,68 @@
+"""
+JWT authentication without a user query per request.
+
+``StatelessJWTAuthentication`` returns a ``LazyUser`` built from the token's
+user id claim, so views that only filter by ``broker=request.user`` never
+read the user row. Whether the user still exists and is active is checked
+against the database at most once per ``JWT_USER_CACHE_TIMEOUT`` seconds
+per user; deactivating or deleting a user drops the cached entry (see
+``signals.py``). With a per-process cache, other processes notice within
+the timeout.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import router
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import LazyUser
+
+USER_CACHE_TIMEOUT = getattr(settings, 'JWT_USER_CACHE_TIMEOUT', 30)
+
+
+def user_cache_key(user_id):
+    return f'jwt_user_active:{user_id}'
+
+
+def forget_user(user_id):
+    cache.delete(user_cache_key(user_id))
+
+
+def is_stateless():
+    """
+    Revocation on password change needs the stored password hash, and
+    lookups on another field need the row, so both use the simplejwt path.
+    """
+    return api_settings.USER_ID_FIELD in ('id', 'pk') and not api_settings.CHECK_REVOKE_TOKEN
+
+
+def token_user_id(validated_token):
+    """
+    The user id claim as a primary key, or None when the simplejwt path
+    should handle the token (and report what is wrong with it).
+    """
+    if not is_stateless():
+        return None
+    try:
+        return LazyUser._meta.pk.to_python(validated_token[api_settings.USER_ID_CLAIM])
+    except (KeyError, ValidationError):
+        return None
+
+
+def lazy_user(user_id):
+    return LazyUser.from_id(user_id, router.db_for_read(LazyUser))
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        user_id = token_user_id(validated_token)
+        if user_id is None:
+            return super().get_user(validated_token)
+        key = user_cache_key(user_id)
+        if cache.get(key):
+            return lazy_user(user_id)
+        # Not checked recently: the full check, whose user is then loaded.
+        user = super().get_user(validated_token)
+        cache.set(key, True, USER_CACHE_TIMEOUT)
+        return user
@@ -0,0 +1,199 @@
+"""
+List payloads for broker-owned viewsets.
+
+``POST`` of a list to the collection (or to ``batch/``) creates every valid
+item with one ``bulk_create``; ``PATCH batch/`` applies ``{"id": ..., ...}``
+partial updates with one filtered ``update()`` when every item sets the
+same values and one ``bulk_update`` otherwise; ``DELETE batch/`` removes a
+list of ids (or ``{"ids": [...]}``) with one ``DELETE``.
+
+Each batch runs in one transaction with the per-row signals suppressed.
+The stats counters, summary cache and push event are updated once for the
+whole batch. Responses list a result per item: 2xx for items that were
+applied, 400 or 404 with errors for those that were skipped.
+"""
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers, status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from . import publishers, signals, stats
+from .bulk import bulk_insert
+from .dashboard import invalidate_summary
+from .serializers import BrokerOwnedField
+
+
+def _to_pk(model, value):
+    if isinstance(value, bool):
+        return None
+    try:
+        return model._meta.pk.to_python(value)
+    except DjangoValidationError:
+        return None
+
+
+def _batch_status(results, success):
+    applied = sum(1 for result in results if result['status'] < 300)
+    if applied == len(results):
+        return success
+    return status.HTTP_207_MULTI_STATUS if applied else status.HTTP_400_BAD_REQUEST
+
+
+class BatchWriteMixin:
+    batch_max_items = getattr(settings, 'BATCH_WRITE_MAX_ITEMS', 500)
+
+    def create(self, request, *args, **kwargs):
+        if isinstance(request.data, list):
+            return self.batch(request)
+        return super().create(request, *args, **kwargs)
+
+    @action(detail=False, methods=['post', 'patch', 'delete'])
+    def batch(self, request):
+        items = request.data
+        if request.method == 'DELETE' and isinstance(items, dict):
+            items = items.get('ids')
+        if not isinstance(items, list):
+            return Response({'non_field_errors': ['Expected a list of items.']}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > self.batch_max_items:
+            return Response(
+                {'non_field_errors': [f'At most {self.batch_max_items} items per batch.']},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        handler = {'POST': self.batch_create, 'PATCH': self.batch_update, 'DELETE': self.batch_delete}
+        return handler[request.method](items)
+
+    def get_batch_context(self, items):
+        """
+        Serializer context with every broker-owned row the items refer to,
+        loaded with one query per related model.
+        """
+        context = self.get_serializer_context()
+        related_rows = {}
+        for name, field in self.get_serializer_class()().fields.items():
+            if not isinstance(field, BrokerOwnedField):
+                continue
+            model = field.queryset.model
+            pks = {_to_pk(model, item.get(name)) for item in items if isinstance(item, dict)} - {None}
+            related_rows[model] = model.objects.filter(broker=self.request.user).in_bulk(pks) if pks else {}
+        context['related_rows'] = related_rows
+        return context
+
+    def record_batch(self, changes, diffs):
+        model = self.get_queryset().model
+        broker_id = self.request.user.id
+        stats.record_changes(model, changes)
+        invalidate_summary(broker_id)
+        publishers.publish_batch(model, broker_id, diffs)
+
+    def batch_create(self, items):
+        model = self.get_queryset().model
+        serializer_class = self.get_serializer_class()
+        context = self.get_batch_context(items)
+        validator = serializer_class(context=context)
+        results = [None] * len(items)
+        instances, positions = [], []
+        for index, item in enumerate(items):
+            try:
+                data = validator.run_validation(item)
+            except serializers.ValidationError as exc:
+                results[index] = {'index': index, 'status': 400, 'errors': exc.detail}
+                continue
+            instances.append(model(broker=self.request.user, **data))
+            positions.append(index)
+
+        if instances:
+            with transaction.atomic(), signals.suppressed():
+                bulk_insert(model, instances)
+                data = serializer_class(instances, many=True, context=context).data
+                self.record_batch(
+                    [(None, stats.current_state(instance)) for instance in instances],
+                    [{'op': 'created', 'id': row['id'], 'fields': dict(row)} for row in data],
+                )
+            for index, row in zip(positions, data):
+                results[index] = {'index': index, 'status': 201, 'data': row}
+        return Response({'results': results}, status=_batch_status(results, status.HTTP_201_CREATED))
+
+    def batch_update(self, items):
+        model = self.get_queryset().model
+        serializer_class = self.get_serializer_class()
+        context = self.get_batch_context(items)
+        validator = serializer_class(context=context, partial=True)
+        pks = [_to_pk(model, item.get('id')) if isinstance(item, dict) else None for item in items]
+        found = self.get_queryset().in_bulk([pk for pk in pks if pk is not None])
+        before = {pk: stats.current_state(instance) for pk, instance in found.items()}
+
+        results, applied, changed, updates = [], [], {}, []
+        for index, (item, pk) in enumerate(zip(items, pks)):
+            if pk is None:
+                results.append({'index': index, 'status': 400, 'errors': {'id': ['A valid id is required.']}})
+                continue
+            if pk not in found:
+                results.append({'index': index, 'id': pk, 'status': 404, 'errors': {'detail': 'Not found.'}})
+                continue
+            item = {name: value for name, value in item.items() if name != 'id'}
+            try:
+                data = validator.run_validation(item)
+            except serializers.ValidationError as exc:
+                results.append({'index': index, 'id': pk, 'status': 400, 'errors': exc.detail})
+                continue
+            instance = found[pk]
+            for name, value in data.items():
+                field = model._meta.get_field(name)
+                new = value.pk if field.is_relation and value is not None else value
+                if getattr(instance, field.attname) != new:
+                    changed.setdefault(pk, set()).add(name)
+                setattr(instance, name, value)
+            updates.append(data)
+            applied.append(len(results))
+            results.append({'index': index, 'id': pk, 'status': 200})
+
+        with transaction.atomic(), signals.suppressed():
+            if changed:
+                now = timezone.now()
+                fields = set().union(*changed.values())
+                for pk in changed:
+                    found[pk].updated_at = now
+                queryset = model.objects.filter(pk__in=list(changed), broker=self.request.user)
+                if all(data == updates[0] for data in updates):
+                    queryset.update(updated_at=now, **updates[0])
+                else:
+                    model.objects.bulk_update([found[pk] for pk in changed], sorted(fields) + ['updated_at'])
+            rows = serializer_class([found[results[i]['id']] for i in applied], many=True, context=context).data
+            if changed:
+                serialized = {row['id']: row for row in rows}
+                self.record_batch(
+                    [(before[pk], stats.current_state(found[pk])) for pk in changed],
+                    [
+                        {'op': 'updated', 'id': pk, 'fields': {
+                            name: serialized[pk][name] for name in names | {'updated_at'}
+                        }}
+                        for pk, names in changed.items()
+                    ],
+                )
+        for i, row in zip(applied, rows):
+            results[i]['data'] = row
+        return Response({'results': results}, status=_batch_status(results, status.HTTP_200_OK))
+
+    def batch_delete(self, ids):
+        model = self.get_queryset().model
+        pks = [_to_pk(model, value) for value in ids]
+        found = self.get_queryset().in_bulk([pk for pk in pks if pk is not None])
+        results = []
+        for index, pk in enumerate(pks):
+            if pk is None:
+                results.append({'index': index, 'status': 400, 'errors': {'id': ['A valid id is required.']}})
+            elif pk not in found:
+                results.append({'index': index, 'id': pk, 'status': 404, 'errors': {'detail': 'Not found.'}})
+            else:
+                results.append({'index': index, 'id': pk, 'status': 204})
+        if found:
+            with transaction.atomic(), signals.suppressed():
+                model.objects.filter(pk__in=list(found), broker=self.request.user).delete()
+                self.record_batch(
+                    [(stats.current_state(instance), None) for instance in found.values()],
+                    [{'op': 'deleted', 'id': pk, 'fields': {}} for pk in found],
+                )
+        return Response({'results': results}, status=_batch_status(results, status.HTTP_200_OK))
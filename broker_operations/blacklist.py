@@ -0,0 +1,215 @@
+"""
+Revoked refresh tokens without a database query per refresh.
+
+simplejwt's ``token_blacklist`` app looks every refresh token up in the
+database. Here revocations are recorded in ``RevokedToken`` and each process
+also keeps the revoked JTIs in bloom filters, one per slice of expiry time
+(``REFRESH_TOKEN_LIFETIME`` split into ``TOKEN_BLACKLIST_BUCKETS``). A filter
+hit is confirmed in the cache, then the database. A token the filters have
+never seen is only checked in the cache, where another process's
+revocation appears as soon as it commits, so no check queries the
+database for a token that is not revoked. Slices whose tokens have all
+expired are dropped whole, and their rows deleted, so the filters and
+table hold only what can still be presented.
+
+Every revocation bumps a generation counter in the cache. A process that
+sees a new generation loads the rows created since shortly before its last
+load (``TOKEN_BLACKLIST_LOAD_MARGIN`` seconds, which covers transactions
+that commit out of order), and every ``TOKEN_BLACKLIST_SYNC_INTERVAL``
+seconds it reloads everything, which covers a lost cache. Checks only read
+the cache to see whether a reload is due. The one that finds it due does
+the reload while concurrent checks carry on with the current filters; only
+a process's first load makes them wait.
+"""
+import hashlib
+import math
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from .models import RevokedToken
+
+GENERATION_KEY = 'token_blacklist:generation'
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def jti_key(jti):
+    return f'token_blacklist:jti:{jti}'
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = capacity
+        self.count = 0
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'big'), int.from_bytes(digest[8:], 'big') | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, item):
+        self.count += 1
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class TokenBlacklist:
+    def __init__(self):
+        lifetime = api_settings.REFRESH_TOKEN_LIFETIME.total_seconds()
+        self.slice_seconds = max(1.0, lifetime / _setting('TOKEN_BLACKLIST_BUCKETS', 8))
+        self.capacity = _setting('TOKEN_BLACKLIST_BLOOM_CAPACITY', 10000)
+        self.sync_interval = _setting('TOKEN_BLACKLIST_SYNC_INTERVAL', 5 * 60)
+        self.load_margin = timedelta(seconds=_setting('TOKEN_BLACKLIST_LOAD_MARGIN', 60))
+        self.lock = threading.Lock()
+        self.filters = {}
+        self.loaded_since = None
+        self.generation = None
+        self.loaded_at = None
+        self.pruned_slice = None
+
+    def _slice(self, exp):
+        return int(exp // self.slice_seconds)
+
+    def _add(self, filters, jti, exp, expected=0):
+        index = self._slice(exp)
+        if index not in filters:
+            filters[index] = BloomFilter(max(self.capacity, expected * 2))
+        bloom = filters[index]
+        if jti in bloom:
+            # Loads overlap, so the same row can be seen twice.
+            return
+        bloom.add(jti)
+        if bloom.count > bloom.capacity:
+            # Overfull filters answer "maybe" too often; rebuild them larger.
+            self.loaded_at = None
+
+    def prune(self, now):
+        """
+        Drop the filters of slices that have fully expired and, once per
+        slice, the rows behind them.
+        """
+        current = self._slice(now)
+        for index in [index for index in self.filters if index < current]:
+            del self.filters[index]
+        if current != self.pruned_slice:
+            self.pruned_slice = current
+            RevokedToken.objects.filter(expires_at__lt=datetime_from_epoch(current * self.slice_seconds)).delete()
+
+    def _load(self, now, full):
+        rows = RevokedToken.objects.filter(expires_at__gt=datetime_from_epoch(now))
+        # A full load builds new filters, so checks meanwhile use the old ones.
+        filters = {} if full else self.filters
+        if not full:
+            # Not pk__gt: a revocation can commit after one with a higher pk.
+            rows = rows.filter(created_at__gte=self.loaded_since)
+        self.loaded_since = timezone.now() - self.load_margin
+        slices = {}
+        for jti, expires_at in rows.values_list('jti', 'expires_at').iterator():
+            exp = expires_at.timestamp()
+            slices.setdefault(self._slice(exp), []).append((jti, exp))
+        for entries in slices.values():
+            for jti, exp in entries:
+                self._add(filters, jti, exp, len(entries))
+        self.filters = filters
+
+    def _due(self, now, generation):
+        full = self.loaded_at is None or now - self.loaded_at >= self.sync_interval
+        return full, full or generation != self.generation
+
+    def sync(self, now=None, wait=True):
+        """
+        Reload the filters if a revocation or the sync interval has passed
+        since the last load. With `wait=False` this returns at once when
+        another thread is already reloading, unless nothing is loaded yet.
+        """
+        now = time.time() if now is None else now
+        generation = cache.get(GENERATION_KEY)
+        if not self._due(now, generation)[1]:
+            return
+        if not self.lock.acquire(blocking=wait or self.loaded_since is None):
+            return
+        try:
+            full, due = self._due(now, generation)
+            if due:
+                # Read before loading: a revocation during the load is
+                # picked up on the next check.
+                self.generation = generation
+                if full:
+                    self.loaded_at = now
+                self._load(now, full)
+                if full:
+                    self.prune(now)
+        finally:
+            self.lock.release()
+
+    def is_revoked(self, jti, exp):
+        self.sync(wait=False)
+        bloom = self.filters.get(self._slice(exp))
+        if cache.get(jti_key(jti)):
+            return True
+        if bloom is None or jti not in bloom:
+            return False
+        return RevokedToken.objects.filter(jti=jti).exists()
+
+    def revoke(self, jti, exp):
+        RevokedToken.objects.get_or_create(jti=jti, defaults={'expires_at': datetime_from_epoch(exp)})
+        remaining = max(1, math.ceil(exp - timezone.now().timestamp()))
+
+        def publish():
+            cache.set(jti_key(jti), True, remaining)
+            try:
+                cache.incr(GENERATION_KEY)
+            except ValueError:
+                cache.add(GENERATION_KEY, 1, timeout=None)
+        transaction.on_commit(publish)
+        with self.lock:
+            self._add(self.filters, jti, exp)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def registry():
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = TokenBlacklist()
+        return _registry
+
+
+class RevocableRefreshToken(RefreshToken):
+    """
+    A refresh token checked against, and revocable through, the blacklist
+    above.
+    """
+
+    def verify(self, *args, **kwargs):
+        super().verify(*args, **kwargs)
+        if registry().is_revoked(self.payload[api_settings.JTI_CLAIM], self.payload['exp']):
+            raise TokenError('Token is blacklisted')
+
+    def blacklist(self):
+        registry().revoke(self.payload[api_settings.JTI_CLAIM], self.payload['exp'])
+
+    def outstand(self):
+        # Rotation calls this; outstanding tokens are not tracked.
+        return None
@@ -0,0 +1,34 @@
+from django.db import connections, router, transaction
+
+
+def bulk_insert(model, objs):
+    """
+    ``bulk_create`` that always leaves ``objs`` with their primary keys, in
+    one INSERT on every backend.
+
+    MySQL does not return keys from a multi-row INSERT. There the rows go in
+    as a single statement, and the keys are taken from ``LAST_INSERT_ID()``,
+    the first key of that statement. InnoDB gives a multi-row ``VALUES``
+    insert consecutive keys, ``@@auto_increment_increment`` apart, in every
+    ``innodb_autoinc_lock_mode``. Other backends without key returning
+    insert row by row.
+    """
+    if not objs:
+        return objs
+    using = router.db_for_write(model)
+    connection = connections[using]
+    if connection.features.can_return_rows_from_bulk_insert:
+        return model.objects.using(using).bulk_create(objs)
+    with transaction.atomic(using):
+        if connection.vendor != 'mysql':
+            for obj in objs:
+                obj.save(force_insert=True, using=using)
+            return objs
+        # No batch_size: the MySQL backend sends every row in one statement.
+        model.objects.using(using).bulk_create(objs)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT LAST_INSERT_ID(), @@auto_increment_increment')
+            first, step = cursor.fetchone()
+    for index, obj in enumerate(objs):
+        obj.pk = first + index * step
+    return objs
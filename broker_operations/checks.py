@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+PER_PROCESS_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register()
+def shared_cache_check(app_configs, **kwargs):
+    """
+    Cache invalidation, rate limits and revocations only reach other worker
+    processes through a shared cache.
+    """
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if settings.DEBUG or backend not in PER_PROCESS_CACHES:
+        return []
+    return [Warning(
+        'The default cache is per-process.',
+        hint='Configure a shared cache (e.g. RedisCache on REDIS_URL); otherwise workers serve stale '
+             'summaries and scripts and accept refresh tokens revoked in another worker.',
+        id='broker_operations.W001',
+    )]
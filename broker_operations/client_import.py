@@ -0,0 +1,178 @@
+"""
+Bulk client import from CSV or NDJSON.
+
+Rows are read lazily from the file and validated with
+``ClientImportSerializer`` in batches. Each batch runs in its own
+transaction. Emails the broker already owns are locked and upserted with
+``bulk_create(update_conflicts=True)``, overwriting only the columns the
+rows give (one statement per set of columns). New emails go in with a plain
+``bulk_create``, so a row that another broker inserted in the meantime
+fails the batch instead of being overwritten. The batch is then retried
+once against fresh owners. Invalid rows are reported by line number and
+skipped; they never abort the import.
+
+``bulk_create`` sends no model signals, so each batch adjusts the broker
+stats counter and invalidates the search indexes and dashboard summary
+itself.
+"""
+import csv
+import io
+import json
+import os
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from rest_framework import serializers
+
+from . import search, stats, typeahead
+from .dashboard import invalidate_summary
+from .models import Client
+from .serializers import ClientImportSerializer
+
+FORMATS = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+# Columns an import may overwrite, when the row gives them, and the ones
+# every upsert rewrites.
+IMPORT_FIELDS = ['first_name', 'last_name', 'phone', 'address', 'notes']
+DERIVED_FIELDS = ['search_text', 'phone_digits', 'updated_at']
+
+
+def detect_format(filename, default=None):
+    return FORMATS.get(os.path.splitext(filename or '')[1].lower(), default)
+
+
+def read_rows(stream, file_format):
+    """
+    Yield `(line_number, row, error)` for every record of a binary stream.
+    Exactly one of `row` and `error` is set.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if file_format == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            # Short rows pad with None and long rows collect under None.
+            row = {key: value for key, value in row.items() if key is not None and value is not None}
+            yield reader.line_num, row, None
+    elif file_format == 'ndjson':
+        for line_number, line in enumerate(text, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as exc:
+                yield line_number, None, {'non_field_errors': [f'Invalid JSON: {exc}']}
+                continue
+            if not isinstance(row, dict):
+                yield line_number, None, {'non_field_errors': ['Expected a JSON object.']}
+                continue
+            yield line_number, row, None
+    else:
+        raise ValueError(f'Unsupported import format: {file_format!r}')
+
+
+class ClientImporter:
+    def __init__(self, broker, batch_size=None, max_errors=None):
+        self.broker = broker
+        self.batch_size = batch_size or getattr(settings, 'CLIENT_IMPORT_BATCH_SIZE', 1000)
+        self.max_errors = max_errors or getattr(settings, 'CLIENT_IMPORT_MAX_ERRORS', 1000)
+        self.result = {'rows': 0, 'created': 0, 'updated': 0, 'error_count': 0, 'errors': []}
+
+    def add_error(self, line, errors):
+        self.result['error_count'] += 1
+        if len(self.result['errors']) < self.max_errors:
+            self.result['errors'].append({'line': line, 'errors': errors})
+
+    def run(self, rows):
+        """
+        Import `(line_number, row, error)` tuples from `read_rows` and return
+        the counts and per-row errors.
+        """
+        batch = []
+        for line, row, error in rows:
+            self.result['rows'] += 1
+            if error is not None:
+                self.add_error(line, error)
+                continue
+            batch.append((line, row))
+            if len(batch) >= self.batch_size:
+                self.import_batch(batch)
+                batch = []
+        if batch:
+            self.import_batch(batch)
+        return self.result
+
+    def validate(self, batch):
+        serializer = ClientImportSerializer()
+        valid = {}
+        for line, row in batch:
+            try:
+                data = serializer.run_validation(row)
+            except serializers.ValidationError as exc:
+                self.add_error(line, exc.detail)
+                continue
+            previous = valid.pop(data['email'], None)
+            if previous is not None:
+                self.add_error(previous[0], {'email': [f'Duplicate email, replaced by line {line}.']})
+            valid[data['email']] = (line, data)
+        return valid
+
+    def import_batch(self, batch):
+        valid = self.validate(batch)
+        if not valid:
+            return
+        try:
+            errors, created, updated = self.write_batch(valid)
+        except IntegrityError:
+            # Another broker inserted one of the new emails after the owners
+            # were read.
+            errors, created, updated = self.write_batch(valid)
+        for line, error in errors:
+            self.add_error(line, error)
+        self.result['created'] += created
+        self.result['updated'] += updated
+
+    def write_batch(self, valid):
+        """
+        Return `(errors, created, updated)` for one batch of validated rows.
+        """
+        broker_id = self.broker.id
+        errors, new = [], []
+        # Upserts grouped by the columns their rows give, so a column left
+        # out of the file keeps its stored value.
+        existing = {}
+        with transaction.atomic():
+            owners = dict(
+                Client.objects.select_for_update().filter(email__in=list(valid)).values_list('email', 'broker_id')
+            )
+            for email, (line, data) in valid.items():
+                if owners.get(email, broker_id) != broker_id:
+                    errors.append((line, {'email': ['client with this email already exists.']}))
+                    continue
+                client = Client(broker=self.broker, **data)
+                client.update_search_fields()
+                if email in owners:
+                    existing.setdefault(tuple(name for name in IMPORT_FIELDS if name in data), []).append(client)
+                else:
+                    new.append(client)
+            unique_fields = ['email'] if connection.features.supports_update_conflicts_with_target else None
+            for fields, clients in existing.items():
+                Client.objects.bulk_create(
+                    clients, update_conflicts=True, unique_fields=unique_fields,
+                    update_fields=[*fields, *DERIVED_FIELDS],
+                )
+            if new:
+                Client.objects.bulk_create(new)
+                stats.apply_delta(broker_id, 'total_clients', len(new))
+            if existing or new:
+                transaction.on_commit(lambda: self.invalidate(broker_id))
+        return errors, len(new), sum(len(clients) for clients in existing.values())
+
+    @staticmethod
+    def invalidate(broker_id):
+        invalidate_summary(broker_id)
+        search.invalidate_broker(broker_id)
+        if typeahead.enabled():
+            typeahead.registry.invalidate(broker_id)
+
+
+def import_clients(broker, stream, file_format, batch_size=None):
+    return ClientImporter(broker, batch_size).run(read_rows(stream, file_format))
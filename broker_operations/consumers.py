@@ -1,8 +1,30 @@
 import json
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
 from .models import Application, Task, Reminder
+from . import publishers
+from .encodings import negotiate, event_cache
+
+SUBSCRIPTIONS = {
+    suffix: (model, event_type)
+    for model, (event_type, suffix, _) in publishers.PUBLISHED_MODELS.items()
+}
+
+
+def _sequence(value):
+    """
+    A client's `since` as a sequence number, or None when it is not one.
+    """
+    if isinstance(value, bool):
+        return None
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    return value if value >= 0 else None
+
 
 class BrokerConsumer(AsyncWebsocketConsumer):
     async def connect(self):
@@ -12,24 +34,32 @@ class BrokerConsumer(AsyncWebsocketConsumer):
 
         self.user = self.scope["user"]
         self.room_group_name = f"broker_{self.user.id}"
+        self.encoding, subprotocol = negotiate(self.scope)
 
         # Join room group
         await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name
         )
+        await database_sync_to_async(publishers.listener_connected)(self.user.id)
 
-        await self.accept()
+        await self.accept(subprotocol)
 
     async def disconnect(self, close_code):
+        if not hasattr(self, 'room_group_name'):
+            return
         # Leave room group
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
+        await database_sync_to_async(publishers.listener_disconnected)(self.user.id)
 
-    async def receive(self, text_data):
-        text_data_json = json.loads(text_data)
+    async def receive(self, text_data=None, bytes_data=None):
+        if bytes_data is not None:
+            text_data_json = self.encoding.decode(bytes_data)
+        else:
+            text_data_json = json.loads(text_data)
         message_type = text_data_json.get('type')
 
         if message_type == 'subscribe':
@@ -40,50 +70,115 @@ class BrokerConsumer(AsyncWebsocketConsumer):
             await self.handle_unsubscription(text_data_json)
 
     async def handle_subscription(self, data):
+        """
+        Join the subscription group, then bring the client up to date: replay
+        the events missed since `since` when the replay log still covers
+        them, otherwise stream a full snapshot.
+        """
         subscription_type = data.get('subscription_type')
-        if subscription_type in ['applications', 'tasks', 'reminders']:
+        if subscription_type in SUBSCRIPTIONS:
+            # Join before reading so no event falls between snapshot and stream.
             await self.channel_layer.group_add(
                 f"{self.room_group_name}_{subscription_type}",
                 self.channel_name
             )
+            since = _sequence(data.get('since'))
+            if since is not None:
+                events = await self.get_events_since(since, subscription_type)
+                if events is not None:
+                    for event in events:
+                        await self.send_event(event)
+                    return
+            await self.send_snapshot(subscription_type)
 
     async def handle_unsubscription(self, data):
         subscription_type = data.get('subscription_type')
-        if subscription_type in ['applications', 'tasks', 'reminders']:
+        if subscription_type in SUBSCRIPTIONS:
             await self.channel_layer.group_discard(
                 f"{self.room_group_name}_{subscription_type}",
                 self.channel_name
             )
 
+    async def send_snapshot(self, subscription_type):
+        """
+        Stream the broker's rows in id order, one chunk per message. `seq` is
+        the sequence number the snapshot is consistent with; the client can
+        resume from it with `since`.
+        """
+        model, _ = SUBSCRIPTIONS[subscription_type]
+        chunk_size = getattr(settings, 'BROKER_SNAPSHOT_CHUNK_SIZE', 200)
+        seq = await self.get_current_sequence()
+        after_id = 0
+        while True:
+            rows = await self.get_snapshot_chunk(model, after_id, chunk_size)
+            final = len(rows) < chunk_size
+            await self.send_message({
+                'type': 'snapshot',
+                'subscription_type': subscription_type,
+                'seq': seq,
+                'data': rows,
+                'final': final,
+            })
+            if final:
+                return
+            after_id = rows[-1]['id']
+
+    async def send_message(self, message, cache_key=None):
+        """
+        Send a message in the encoding negotiated at connect, as a binary
+        frame for binary encodings.
+        """
+        payload = event_cache.encode(self.encoding, cache_key, message)
+        if self.encoding.binary:
+            await self.send(bytes_data=payload)
+        else:
+            await self.send(text_data=payload)
+
+    async def send_event(self, event):
+        event_id = event.get('event_id')
+        await self.send_message({
+            'type': event['type'],
+            'seq': event.get('seq'),
+            'data': event['data']
+        }, cache_key=(event_id,) if event_id else None)
+
     async def application_update(self, event):
         # Send application update to WebSocket
-        await self.send(text_data=json.dumps({
-            'type': 'application_update',
-            'data': event['data']
-        }))
+        await self.send_event(event)
 
     async def task_update(self, event):
         # Send task update to WebSocket
-        await self.send(text_data=json.dumps({
-            'type': 'task_update',
-            'data': event['data']
-        }))
+        await self.send_event(event)
 
     async def reminder_update(self, event):
         # Send reminder update to WebSocket
-        await self.send(text_data=json.dumps({
-            'type': 'reminder_update',
-            'data': event['data']
-        }))
+        await self.send_event(event)
 
     @database_sync_to_async
-    def get_user_applications(self):
-        return list(Application.objects.filter(broker=self.user).values())
+    def get_current_sequence(self):
+        return publishers.current_sequence(self.user.id)
 
     @database_sync_to_async
-    def get_user_tasks(self):
-        return list(Task.objects.filter(broker=self.user).values())
+    def get_events_since(self, since, subscription_type):
+        _, event_type = SUBSCRIPTIONS[subscription_type]
+        return publishers.events_since(self.user.id, since, [event_type])
 
     @database_sync_to_async
-    def get_user_reminders(self):
-        return list(Reminder.objects.filter(broker=self.user).values()) 
\ No newline at end of file
+    def get_snapshot_chunk(self, model, after_id, limit=200):
+        """
+        One keyset-paginated chunk of the broker's rows, serialized the same
+        way as pushed updates. Each chunk is a short indexed query, so memory
+        stays bounded and no cursor is held open between sends.
+        """
+        _, _, serializer_class = publishers.PUBLISHED_MODELS[model]
+        rows = model.objects.filter(broker=self.user, id__gt=after_id).order_by('id')[:limit]
+        return serializer_class(rows, many=True).data
+
+    def get_user_applications(self, after_id=0):
+        return self.get_snapshot_chunk(Application, after_id)
+
+    def get_user_tasks(self, after_id=0):
+        return self.get_snapshot_chunk(Task, after_id)
+
+    def get_user_reminders(self, after_id=0):
+        return self.get_snapshot_chunk(Reminder, after_id)
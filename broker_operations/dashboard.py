@@ -0,0 +1,251 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, DateTimeField, IntegerField, Max, Min, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from rest_framework import serializers
+
+from .fast_read import serialize
+from .models import Client, Application, Task, Reminder, BrokerStats
+from .serializers import ApplicationSerializer, ReminderSerializer, TaskSerializer
+
+SUMMARY_CACHE_TIMEOUT = getattr(settings, 'DASHBOARD_SUMMARY_CACHE_TIMEOUT', 60)
+SUMMARY_HITS_KEY = 'dashboard_summary:hits'
+SUMMARY_MISSES_KEY = 'dashboard_summary:misses'
+
+
+def summary_cache_key(broker_id):
+    return f'dashboard_summary:{broker_id}'
+
+
+# Sections of the combined dashboard, and the tables each one reads.
+SECTION_MODELS = {
+    'summary': [Client, Application, Task, Reminder],
+    'activity': [Application, Task],
+    'reminders': [Reminder],
+    'tasks': [Task],
+}
+SECTIONS = list(SECTION_MODELS)
+
+
+def _aggregate_for_broker(queryset, aggregate, output_field):
+    """
+    Correlated aggregate over ``queryset`` for the outer broker row.
+    """
+    values = (
+        queryset.filter(broker=OuterRef('pk'))
+        .order_by()
+        .values('broker')
+        .annotate(value=aggregate)
+        .values('value')
+    )
+    return Subquery(values, output_field=output_field)
+
+
+def _count_for_broker(queryset):
+    return Coalesce(_aggregate_for_broker(queryset, Count('*'), IntegerField()), Value(0))
+
+
+EMPTY_SUMMARY = {
+    'total_clients': 0,
+    'active_applications': 0,
+    'pending_tasks': 0,
+    'upcoming_reminders': 0,
+}
+STATS_FIELDS = ['total_clients', 'active_applications', 'pending_tasks', 'open_reminders']
+
+
+def _summary_counts(broker_id):
+    return User.objects.filter(pk=broker_id).values(
+        total_clients=_count_for_broker(Client.objects.all()),
+        active_applications=_count_for_broker(
+            Application.objects.filter(status__in=Application.ACTIVE_STATUSES)
+        ),
+        pending_tasks=_count_for_broker(Task.objects.filter(status='pending')),
+        upcoming_reminders=_count_for_broker(Reminder.objects.filter(is_completed=False)),
+    )
+
+
+def _stats_defaults(summary):
+    return {
+        'total_clients': summary['total_clients'],
+        'active_applications': summary['active_applications'],
+        'pending_tasks': summary['pending_tasks'],
+        'open_reminders': summary['upcoming_reminders'],
+    }
+
+
+def count_summary(broker_id):
+    """
+    Count all dashboard counters from the base tables in a single round trip.
+    """
+    return _summary_counts(broker_id).first() or dict(EMPTY_SUMMARY)
+
+
+def compute_summary(broker_id):
+    """
+    Read the summary from the broker's materialized counters, counting the
+    base tables once to seed them if the broker has no stats row yet.
+    """
+    row = BrokerStats.objects.filter(broker_id=broker_id).values(*STATS_FIELDS).first()
+    if row is not None:
+        row['upcoming_reminders'] = row.pop('open_reminders')
+        return row
+    summary = count_summary(broker_id)
+    BrokerStats.objects.get_or_create(broker_id=broker_id, defaults=_stats_defaults(summary))
+    return summary
+
+
+async def acompute_summary(broker_id):
+    row = await BrokerStats.objects.filter(broker_id=broker_id).values(*STATS_FIELDS).afirst()
+    if row is not None:
+        row['upcoming_reminders'] = row.pop('open_reminders')
+        return row
+    summary = await _summary_counts(broker_id).afirst() or dict(EMPTY_SUMMARY)
+    await BrokerStats.objects.aget_or_create(broker_id=broker_id, defaults=_stats_defaults(summary))
+    return summary
+
+
+def _incr(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key)
+
+
+def get_summary(broker_id):
+    """
+    Return the dashboard summary for a broker, served from the cache when
+    possible. Returns a ``(summary, hit)`` tuple.
+    """
+    key = summary_cache_key(broker_id)
+    summary = cache.get(key)
+    if summary is not None:
+        _incr(SUMMARY_HITS_KEY)
+        return summary, True
+    _incr(SUMMARY_MISSES_KEY)
+    summary = compute_summary(broker_id)
+    cache.set(key, summary, SUMMARY_CACHE_TIMEOUT)
+    return summary, False
+
+
+async def _aincr(key):
+    try:
+        await cache.aincr(key)
+    except ValueError:
+        await cache.aadd(key, 0, timeout=None)
+        await cache.aincr(key)
+
+
+async def aget_summary(broker_id):
+    """
+    Async ``get_summary`` for the ASGI dashboard views.
+    """
+    key = summary_cache_key(broker_id)
+    summary = await cache.aget(key)
+    if summary is not None:
+        await _aincr(SUMMARY_HITS_KEY)
+        return summary, True
+    await _aincr(SUMMARY_MISSES_KEY)
+    summary = await acompute_summary(broker_id)
+    await cache.aset(key, summary, SUMMARY_CACHE_TIMEOUT)
+    return summary, False
+
+
+def invalidate_summary(broker_id):
+    """
+    Drop the cached summary once the current transaction commits; deleting
+    it earlier lets a concurrent reader cache the pre-commit counts again.
+    """
+    key = summary_cache_key(broker_id)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def summary_cache_stats():
+    hits = cache.get(SUMMARY_HITS_KEY, 0)
+    misses = cache.get(SUMMARY_MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': hits / total if total else 0.0,
+    }
+
+
+def parse_sections(value):
+    """
+    Sections named in a comma-separated `sections` parameter, in canonical
+    order; all of them when the parameter is missing or empty.
+    """
+    names = {name.strip() for name in (value or '').split(',') if name.strip()}
+    unknown = names - set(SECTIONS)
+    if unknown:
+        raise serializers.ValidationError({'sections': [f'Unknown section: {name}' for name in sorted(unknown)]})
+    return [name for name in SECTIONS if name in names] if names else list(SECTIONS)
+
+
+def dashboard_etag(broker_id, sections, now):
+    """
+    ETag for the combined dashboard, from one query: the latest
+    `updated_at` and row count of every table the sections read (the count
+    catches deletes), plus the next open reminder due time, since the
+    reminders section drops reminders once they are past.
+    """
+    columns = {}
+    for model in dict.fromkeys(model for name in sections for model in SECTION_MODELS[name]):
+        name = model._meta.model_name
+        columns[f'{name}_count'] = _count_for_broker(model.objects.all())
+        columns[f'{name}_updated'] = _aggregate_for_broker(
+            model.objects.all(), Max('updated_at'), DateTimeField()
+        )
+    if 'reminders' in sections:
+        columns['next_reminder_due'] = _aggregate_for_broker(
+            Reminder.objects.filter(is_completed=False, due_date__gte=now), Min('due_date'), DateTimeField()
+        )
+    row = User.objects.filter(pk=broker_id).values(**columns).first() or {}
+    version = ':'.join([','.join(sections)] + [f'{key}={value}' for key, value in sorted(row.items())])
+    return f'"{hashlib.sha256(version.encode()).hexdigest()[:32]}"'
+
+
+def activity_section(user):
+    return {
+        'recent_applications': serialize(
+            ApplicationSerializer,
+            Application.objects.filter(broker=user).order_by('-created_at')[:5],
+        ),
+        'recent_tasks': serialize(
+            TaskSerializer,
+            Task.objects.filter(broker=user).order_by('-created_at')[:5],
+        ),
+    }
+
+
+def reminders_section(user, now):
+    reminders = Reminder.objects.filter(
+        broker=user,
+        is_completed=False,
+        due_date__gte=now
+    ).order_by('due_date')
+    return serialize(ReminderSerializer, reminders)
+
+
+def tasks_section(user):
+    tasks = Task.objects.filter(
+        broker=user,
+        status__in=['pending', 'in_progress']
+    ).order_by('due_date')
+    return serialize(TaskSerializer, tasks)
+
+
+def build_dashboard(user, sections, now):
+    builders = {
+        'summary': lambda: get_summary(user.id)[0],
+        'activity': lambda: activity_section(user),
+        'reminders': lambda: reminders_section(user, now),
+        'tasks': lambda: tasks_section(user),
+    }
+    return {name: builders[name]() for name in sections}
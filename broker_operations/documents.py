@@ -0,0 +1,285 @@
+"""
+Resumable document uploads and ranged downloads.
+
+An upload is declared first (``DocumentUpload``), then its bytes arrive in
+any number of ``PATCH`` requests, each carrying the ``Upload-Offset`` it
+starts at. Chunks are copied from the request stream to a partial file in
+``DOCUMENT_UPLOAD_TEMP_DIR`` in fixed-size blocks, so memory per request
+stays bounded whatever the file size; the offset stored on the row tells a
+client where to resume after a dropped connection. The partial directory
+must be shared by every worker that can receive a chunk.
+
+Completing an upload hashes the partial file with SHA-256 and either
+reuses the client's existing document with the same content or moves the
+file into the document storage. Anything slower (page counts, scans,
+extraction) runs later in the ``document.process`` job, through the
+processors listed in ``DOCUMENT_PROCESSORS``.
+"""
+import hashlib
+import mimetypes
+import os
+import re
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework import serializers, status
+from rest_framework.exceptions import APIException
+
+from . import jobs
+from .models import Client, Document, DocumentUpload
+
+BLOCK_SIZE = 64 * 1024
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+PDF_PAGE_RE = re.compile(rb'/Type\s*/Page(?![A-Za-z])')
+DEFAULT_PROCESSORS = [
+    'broker_operations.documents.record_digest',
+    'broker_operations.documents.record_page_count',
+]
+
+
+class OffsetConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'Upload-Offset does not match the bytes received so far.'
+    default_code = 'offset_conflict'
+
+
+class ChunkTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Chunk is larger than allowed.'
+    default_code = 'chunk_too_large'
+
+
+class LengthRequired(APIException):
+    status_code = status.HTTP_411_LENGTH_REQUIRED
+    default_detail = 'Content-Length is required.'
+    default_code = 'length_required'
+
+
+def max_chunk_size():
+    return getattr(settings, 'DOCUMENT_UPLOAD_MAX_CHUNK_SIZE', 16 * 1024 * 1024)
+
+
+def max_file_size():
+    return getattr(settings, 'DOCUMENT_UPLOAD_MAX_SIZE', 100 * 1024 * 1024)
+
+
+def partial_path(upload):
+    directory = getattr(settings, 'DOCUMENT_UPLOAD_TEMP_DIR', None) or os.path.join(
+        settings.MEDIA_ROOT, 'uploads', 'partial'
+    )
+    return os.path.join(directory, f'{upload.pk}.part')
+
+
+class PartialFile(File):
+    """
+    A completed partial file. File system storage moves it into place
+    instead of copying it.
+    """
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def append_chunk(upload, offset, stream, length):
+    """
+    Copy `length` bytes from `stream` into the upload at `offset` and return
+    the new offset. The chunk is read into a local temporary file first, so
+    no lock is held while a slow client sends it. Claiming the range (the
+    conditional offset UPDATE) and copying it into the partial file then
+    share one short transaction: a concurrent chunk for the same offset
+    waits on the row and conflicts without writing. A chunk that ends early
+    is dropped before anything is claimed, so the client resends it.
+    """
+    if offset != upload.offset:
+        raise OffsetConflict()
+    if length > max_chunk_size() or offset + length > upload.size:
+        raise ChunkTooLarge()
+    path = partial_path(upload)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with tempfile.TemporaryFile() as chunk:
+        written = 0
+        while written < length:
+            block = stream.read(min(BLOCK_SIZE, length - written))
+            if not block:
+                break
+            chunk.write(block)
+            written += len(block)
+        if written != length:
+            raise serializers.ValidationError({'detail': 'Chunk ended before Content-Length bytes were received.'})
+        chunk.seek(0)
+        with transaction.atomic():
+            claimed = DocumentUpload.objects.filter(pk=upload.pk, offset=offset).update(
+                offset=offset + length, updated_at=timezone.now()
+            )
+            if not claimed:
+                raise OffsetConflict()
+            with open(path, 'r+b' if os.path.exists(path) else 'wb') as part:
+                part.seek(offset)
+                shutil.copyfileobj(chunk, part, BLOCK_SIZE)
+    upload.offset = offset + length
+    return upload.offset
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as part:
+        for block in iter(lambda: part.read(BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def discard_upload(upload):
+    try:
+        os.remove(partial_path(upload))
+    except FileNotFoundError:
+        pass
+    upload.delete()
+
+
+def complete_upload(upload):
+    """
+    Turn a fully received upload into a Document. Returns
+    `(document, created)`; `created` is False when the client already has a
+    document with the same SHA-256.
+    """
+    if upload.offset != upload.size:
+        raise serializers.ValidationError({'detail': f'Upload has {upload.offset} of {upload.size} bytes.'})
+    path = partial_path(upload)
+    if upload.size == 0:
+        open(path, 'ab').close()
+    with open(path, 'r+b') as part:
+        part.truncate(upload.size)
+    digest = file_sha256(path)
+    if upload.sha256 and upload.sha256 != digest:
+        discard_upload(upload)
+        raise serializers.ValidationError({'sha256': ['Uploaded content does not match the declared SHA-256.']})
+
+    with transaction.atomic():
+        # Serialize completions per client so the duplicate check holds.
+        Client.objects.select_for_update().filter(pk=upload.client_id).first()
+        document = Document.objects.filter(client_id=upload.client_id, sha256=digest).first()
+        created = document is None
+        if created:
+            document = Document(
+                client_id=upload.client_id,
+                title=upload.title,
+                document_type=upload.document_type,
+                notes=upload.notes,
+                sha256=digest,
+                size=upload.size,
+            )
+            with open(path, 'rb') as part:
+                document.file.save(upload.filename, PartialFile(part), save=False)
+            document.save()
+            enqueue_processing(document)
+        discard_upload(upload)
+    return document, created
+
+
+def enqueue_processing(document):
+    return jobs.enqueue('document.process', {'document_id': document.pk})
+
+
+def record_digest(document):
+    if document.sha256 and document.size is not None:
+        return
+    digest, size = hashlib.sha256(), 0
+    with document.file.open('rb') as stored:
+        for block in iter(lambda: stored.read(BLOCK_SIZE), b''):
+            digest.update(block)
+            size += len(block)
+    document.sha256, document.size = digest.hexdigest(), size
+
+
+def count_pdf_pages(fileobj):
+    """
+    Count page objects in a PDF without loading it. PDFs that keep their
+    objects in compressed streams report 0.
+    """
+    count, tail = 0, b''
+    for block in iter(lambda: fileobj.read(BLOCK_SIZE), b''):
+        buffer = tail + block
+        # Matches starting in the last bytes may continue in the next block.
+        boundary = len(buffer) - 32
+        count += sum(1 for match in PDF_PAGE_RE.finditer(buffer) if match.start() < boundary)
+        tail = buffer[max(boundary, 0):]
+    return count + len(PDF_PAGE_RE.findall(tail))
+
+
+def record_page_count(document):
+    if content_type_for(document.file.name) != 'application/pdf':
+        return
+    with document.file.open('rb') as stored:
+        document.page_count = count_pdf_pages(stored) or None
+
+
+@jobs.handler('document.process')
+def process_document(document_id):
+    document = Document.objects.filter(pk=document_id).first()
+    if document is None:
+        return
+    for path in getattr(settings, 'DOCUMENT_PROCESSORS', DEFAULT_PROCESSORS):
+        import_string(path)(document)
+    document.processed_at = timezone.now()
+    document.save(update_fields=['sha256', 'size', 'page_count', 'processed_at'])
+
+
+def purge_stale_uploads(max_age=timedelta(days=1)):
+    """
+    Discard uploads that have not received a chunk for `max_age`.
+    """
+    stale = DocumentUpload.objects.filter(updated_at__lt=timezone.now() - max_age)
+    count = 0
+    for upload in stale.iterator():
+        discard_upload(upload)
+        count += 1
+    return count
+
+
+def parse_range(header, size):
+    """
+    `(start, end)` inclusive for a single `bytes=` range, or None to send
+    the whole file (no header, an invalid one, or several ranges). Raises
+    ValueError when the range cannot be satisfied.
+    """
+    match = RANGE_RE.match(header or '')
+    if not match or size == 0:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        suffix = int(last)
+        if suffix == 0:
+            raise ValueError(header)
+        return max(0, size - suffix), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError(header)
+    end = int(last) if last else size - 1
+    return start, min(end, size - 1)
+
+
+def stream_file(fileobj, start, length):
+    try:
+        fileobj.seek(start)
+        while length > 0:
+            block = fileobj.read(min(BLOCK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+    finally:
+        fileobj.close()
+
+
+def content_type_for(name):
+    return mimetypes.guess_type(name)[0] or 'application/octet-stream'
@@ -0,0 +1,124 @@
+import json
+import threading
+from collections import OrderedDict
+from urllib.parse import parse_qs
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - msgpack ships with channels_redis
+    msgpack = None
+
+SUBPROTOCOL_PREFIX = 'mortgauge.'
+
+
+def to_columns(rows):
+    """
+    Convert a list of row dicts into column groups, one per distinct set of
+    keys: ``[{'columns': [...], 'rows': [[...], ...]}]``. Update diffs are
+    flattened first, so ``{'op', 'id', 'fields': {...}}`` becomes one row.
+    """
+    groups = OrderedDict()
+    for row in rows:
+        if 'fields' in row and 'op' in row:
+            row = dict(row['fields'], op=row['op'], id=row['id'])
+        columns = tuple(row)
+        groups.setdefault(columns, []).append([row[column] for column in columns])
+    return [{'columns': list(columns), 'rows': values} for columns, values in groups.items()]
+
+
+def from_columns(groups):
+    return [dict(zip(group['columns'], values)) for group in groups for values in group['rows']]
+
+
+class JSONEncoding:
+    name = 'json'
+    binary = False
+
+    def prepare(self, message):
+        return message
+
+    def encode(self, message):
+        return json.dumps(self.prepare(message), separators=(',', ':'))
+
+    def decode(self, data):
+        return json.loads(data)
+
+
+class ColumnarJSONEncoding(JSONEncoding):
+    """
+    JSON with batched `data` lists sent column-wise, so repeated field names
+    are written once per batch instead of once per row.
+    """
+    name = 'columnar'
+
+    def prepare(self, message):
+        if isinstance(message.get('data'), list):
+            message = dict(message, data=to_columns(message['data']), layout='columnar')
+        return message
+
+
+class MessagePackEncoding(ColumnarJSONEncoding):
+    name = 'msgpack'
+    binary = True
+
+    def encode(self, message):
+        return msgpack.packb(self.prepare(message), use_bin_type=True)
+
+    def decode(self, data):
+        return msgpack.unpackb(data, raw=False)
+
+
+ENCODINGS = OrderedDict((encoding.name, encoding) for encoding in [
+    JSONEncoding(),
+    ColumnarJSONEncoding(),
+    *([MessagePackEncoding()] if msgpack is not None else []),
+])
+DEFAULT_ENCODING = ENCODINGS['json']
+
+
+def negotiate(scope):
+    """
+    Pick the encoding for a WebSocket connection. A `mortgauge.<encoding>`
+    subprotocol takes precedence (the first one offered that we support),
+    then an `?encoding=` query parameter. Returns `(encoding, subprotocol)`;
+    the subprotocol must be echoed back in the accept.
+    """
+    for subprotocol in scope.get('subprotocols') or []:
+        if subprotocol.startswith(SUBPROTOCOL_PREFIX):
+            encoding = ENCODINGS.get(subprotocol[len(SUBPROTOCOL_PREFIX):])
+            if encoding is not None:
+                return encoding, subprotocol
+    query = parse_qs(scope.get('query_string', b'').decode())
+    name = (query.get('encoding') or [DEFAULT_ENCODING.name])[0]
+    return ENCODINGS.get(name, DEFAULT_ENCODING), None
+
+
+class EncodedEventCache:
+    """
+    Small LRU of encoded group events. A batched update fans out to every
+    consumer of a broker's group in this process; they share one encoding
+    pass per format instead of each re-encoding the same event.
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def encode(self, encoding, key, message):
+        if key is None:
+            return encoding.encode(message)
+        key = key + (encoding.name,)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        payload = encoding.encode(message)
+        with self._lock:
+            self._entries[key] = payload
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return payload
+
+
+event_cache = EncodedEventCache()
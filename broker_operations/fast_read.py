@@ -0,0 +1,262 @@
+"""
+Read-only fast path for list payloads.
+
+``ModelSerializer`` builds a field tree per serializer instance and calls
+``to_representation`` field by field for every row, which dominates CPU
+time for the unpaginated dashboard lists. ``reader(serializer_class)``
+compiles a serializer's readable fields once into the columns to fetch
+with ``values_list()`` and a converter per column, then turns rows into the
+same dicts ``serializer.data`` would hold. Datetimes and decimals go
+through converters equivalent to DRF's; char, choice, integer, boolean and
+primary key fields need none. Any other field type falls back to its own
+``to_representation``.
+
+Rows from a fully compiled reader come back as ``FastRows``, which
+``FastJSONRenderer`` encodes with orjson when it is installed, producing
+the same bytes as ``JSONRenderer``. ``FAST_READ_SERIALIZERS = False``
+switches both back to DRF.
+"""
+import decimal
+import threading
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import fields, relations
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.settings import ISO_8601, api_settings
+
+from . import metrics
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - falls back to JSONRenderer
+    orjson = None
+
+# Field classes whose to_representation returns the value Django loads for
+# them unchanged.
+IDENTITY_FIELDS = (fields.CharField, fields.IntegerField, fields.BooleanField)
+
+
+def enabled():
+    return getattr(settings, 'FAST_READ_SERIALIZERS', True)
+
+
+class FastRows(list):
+    """
+    Serialized rows holding only strings, ints, bools and None.
+    """
+
+
+def _datetime_converter(field):
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    if output_format is None or output_format.lower() != ISO_8601:
+        return None
+
+    def bind():
+        # Resolved per call, like DRF: the current timezone can change.
+        tz = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+        if tz is None:
+            return field.to_representation
+
+        def convert(value):
+            if value.tzinfo is None:
+                return field.to_representation(value)
+            text = value.astimezone(tz).isoformat()
+            return text[:-6] + 'Z' if text.endswith('+00:00') else text
+        return convert
+    return bind
+
+
+def _decimal_converter(field):
+    coerce_to_string = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+    if not coerce_to_string or field.localize or field.normalize_output or field.decimal_places is None:
+        return None
+    quantum = decimal.Decimal('.1') ** field.decimal_places
+    rounding = field.rounding
+
+    def bind():
+        context = decimal.getcontext().copy()
+        if field.max_digits is not None:
+            context.prec = field.max_digits
+
+        def convert(value):
+            if not isinstance(value, decimal.Decimal):
+                value = decimal.Decimal(str(value).strip())
+            return f'{value.quantize(quantum, rounding=rounding, context=context):f}'
+        return convert
+    return bind
+
+
+def _fallback(field):
+    return lambda: field.to_representation
+
+
+def _compile_field(field):
+    """
+    `(binder, native)`: `binder` returns the value converter for one call,
+    None when values pass through unchanged; `native` is False when the
+    output may hold types ``FastRows`` promises not to.
+    """
+    field_class = type(field)
+    if isinstance(field, relations.PrimaryKeyRelatedField):
+        if field_class.to_representation is not relations.PrimaryKeyRelatedField.to_representation:
+            return _fallback(field), False
+        if field.pk_field is not None:
+            return lambda: field.pk_field.to_representation, False
+        return None, True
+    if field_class is fields.DateTimeField:
+        binder = _datetime_converter(field)
+        return (binder, True) if binder else (_fallback(field), False)
+    if field_class is fields.DecimalField:
+        binder = _decimal_converter(field)
+        return (binder, True) if binder else (_fallback(field), False)
+    if field_class is getattr(fields, 'BigIntegerField', None):
+        # DRF 3.15+; primary keys of BigAutoField models.
+        if getattr(field, 'coerce_to_string', api_settings.COERCE_BIGINT_TO_STRING):
+            return (lambda: str), True
+        return None, True
+    if field_class is fields.ChoiceField:
+        if all(isinstance(key, str) for key in field.choices):
+            return None, True
+        return _fallback(field), False
+    for base in IDENTITY_FIELDS:
+        if isinstance(field, base) and field_class.to_representation is base.to_representation:
+            return None, True
+    return _fallback(field), False
+
+
+class Reader:
+    def __init__(self, serializer_class):
+        serializer = serializer_class()
+        opts = serializer.Meta.model._meta
+        self.keys, self.columns, self.binders = [], [], []
+        self.native = True
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if field.source == '*' or '.' in field.source or isinstance(field, relations.ManyRelatedField):
+                raise ImproperlyConfigured(f'{serializer_class.__name__}.{name} has no single column to read.')
+            model_field = opts.get_field(field.source)
+            if model_field.is_relation and not isinstance(field, relations.PrimaryKeyRelatedField):
+                raise ImproperlyConfigured(f'{serializer_class.__name__}.{name} is not a primary key field.')
+            binder, native = _compile_field(field)
+            self.keys.append(name)
+            self.columns.append(model_field.attname)
+            if binder is not None:
+                self.binders.append((len(self.keys) - 1, binder))
+            self.native = self.native and native
+        self.getter = itemgetter(*self.columns) if len(self.columns) > 1 else lambda row: (row[self.columns[0]],)
+
+    def values(self, queryset):
+        """
+        `queryset` as dicts of the raw column values, for paginators that read
+        the ordering columns from each row.
+        """
+        return queryset.values(*self.columns)
+
+    def rows(self, tuples):
+        converters = [(index, binder()) for index, binder in self.binders]
+        keys = self.keys
+        result = FastRows() if self.native else []
+        append = result.append
+        with metrics.serializing():
+            for values in tuples:
+                if converters:
+                    values = list(values)
+                    for index, convert in converters:
+                        value = values[index]
+                        if value is not None:
+                            values[index] = convert(value)
+                append(dict(zip(keys, values)))
+        return result
+
+    def rows_from_values(self, dicts):
+        return self.rows(map(self.getter, dicts))
+
+    def data(self, queryset):
+        """
+        What ``serializer_class(queryset, many=True).data`` would hold.
+        """
+        return self.rows(queryset.values_list(*self.columns))
+
+    async def adata(self, queryset):
+        # values(): values_list() runs its query on the event loop thread.
+        return self.rows_from_values([row async for row in self.values(queryset).aiterator()])
+
+
+_readers = {}
+_readers_lock = threading.Lock()
+
+
+def reader(serializer_class):
+    found = _readers.get(serializer_class)
+    if found is None:
+        with _readers_lock:
+            found = _readers.setdefault(serializer_class, Reader(serializer_class))
+    return found
+
+
+def serialize(serializer_class, queryset):
+    """
+    ``serializer_class(queryset, many=True).data`` through the reader when
+    the fast path is enabled.
+    """
+    if not enabled():
+        return serializer_class(queryset, many=True).data
+    return reader(serializer_class).data(queryset)
+
+
+async def aserialize(serializer_class, queryset):
+    if not enabled():
+        return serializer_class([row async for row in queryset.aiterator()], many=True).data
+    return await reader(serializer_class).adata(queryset)
+
+
+class FastListMixin:
+    """
+    ``list`` for a viewset whose serializer ``reader`` can compile: the
+    filtered queryset is paginated as column dicts and serialized by the
+    reader.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if not enabled():
+            return super().list(request, *args, **kwargs)
+        rows = reader(self.get_serializer_class())
+        queryset = rows.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(rows.rows_from_values(page))
+        return Response(rows.rows_from_values(queryset))
+
+
+def _native(data):
+    if isinstance(data, FastRows):
+        return True
+    if isinstance(data, dict):
+        return all(_native(value) for value in data.values())
+    return data is None or type(data) in (str, int, bool)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    ``JSONRenderer`` that hands compact payloads made of ``FastRows`` and
+    plain dicts of scalars to orjson. Anything else, or an indented
+    rendering, goes through ``JSONRenderer``.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None or data is None or not enabled() or self.ensure_ascii or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+            or not _native(data)
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # JSONRenderer escapes these so the output is valid JavaScript.
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
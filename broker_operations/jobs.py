@@ -0,0 +1,209 @@
+"""
+Database-backed background jobs.
+
+``enqueue()`` inserts a ``Job`` row in the caller's transaction, so a job
+exists exactly when the data it refers to was committed. ``run_jobs``
+workers claim due jobs in batches; on backends with ``SKIP LOCKED``
+(PostgreSQL, MySQL 8) concurrent workers skip each other's rows instead of
+waiting on them, and a conditional UPDATE makes claiming safe everywhere
+else. Failed jobs are retried with exponential backoff up to
+``max_attempts``; jobs whose worker died are requeued after
+``JOB_LOCK_TIMEOUT`` seconds. Finished jobs are deleted once they are older
+than ``JOB_RETENTION`` seconds (``JOB_FAILED_RETENTION`` for failed ones).
+
+Handlers are registered by name with ``@handler('name')`` and called with
+the job payload as keyword arguments.
+"""
+import logging
+import random
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Min, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}
+
+
+def handler(name):
+    def register(function):
+        HANDLERS[name] = function
+        return function
+    return register
+
+
+def enqueue(name, payload=None, run_at=None, max_attempts=None):
+    if name not in HANDLERS:
+        raise KeyError(f'No job handler registered as {name!r}')
+    return Job.objects.create(
+        name=name,
+        payload=payload or {},
+        run_at=run_at or timezone.now(),
+        max_attempts=max_attempts or getattr(settings, 'JOB_MAX_ATTEMPTS', 5),
+    )
+
+
+def backoff(attempts):
+    """
+    Delay before retry number `attempts`: exponential from
+    JOB_RETRY_BASE_DELAY seconds, capped at JOB_RETRY_MAX_DELAY, with up to
+    10% jitter so failed batches do not retry in lockstep.
+    """
+    base = getattr(settings, 'JOB_RETRY_BASE_DELAY', 5)
+    delay = min(base * 2 ** (attempts - 1), getattr(settings, 'JOB_RETRY_MAX_DELAY', 3600))
+    return timedelta(seconds=delay * (1 + random.random() / 10))
+
+
+def claim(worker_id, limit=10):
+    """
+    Lock up to `limit` due jobs for this worker and return them.
+    """
+    now = timezone.now()
+    due = Job.objects.filter(status='queued', run_at__lte=now).order_by('run_at', 'id')
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        candidates = list(due.values_list('pk', flat=True)[:limit])
+        if not candidates:
+            return []
+        # Without SKIP LOCKED two workers can pick the same candidates; the
+        # status condition lets only one of them take each job.
+        Job.objects.filter(pk__in=candidates, status='queued').update(
+            status='running', locked_by=worker_id, locked_at=now, attempts=F('attempts') + 1,
+        )
+    return list(Job.objects.filter(pk__in=candidates, status='running', locked_by=worker_id, locked_at=now))
+
+
+def requeue_stale(timeout=None):
+    """
+    Return jobs locked longer than JOB_LOCK_TIMEOUT seconds, whose worker
+    presumably died, to the queue.
+    """
+    timeout = timeout or getattr(settings, 'JOB_LOCK_TIMEOUT', 15 * 60)
+    cutoff = timezone.now() - timedelta(seconds=timeout)
+    return Job.objects.filter(status='running', locked_at__lt=cutoff).update(
+        status='queued', locked_by='', locked_at=None,
+    )
+
+
+def purge_finished(batch_size=1000):
+    """
+    Delete finished jobs past their retention, `batch_size` rows per DELETE
+    so no statement holds locks for long. Returns the number deleted.
+    """
+    now = timezone.now()
+    retention = {
+        'succeeded': getattr(settings, 'JOB_RETENTION', 7 * 24 * 60 * 60),
+        'failed': getattr(settings, 'JOB_FAILED_RETENTION', 30 * 24 * 60 * 60),
+    }
+    deleted = 0
+    for status, seconds in retention.items():
+        expired = Job.objects.filter(status=status, finished_at__lt=now - timedelta(seconds=seconds))
+        while True:
+            pks = list(expired.values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                break
+            deleted += Job.objects.filter(pk__in=pks).delete()[0]
+    return deleted
+
+
+def run(job):
+    """
+    Run one claimed job and record the outcome. Returns True on success.
+    """
+    started = timezone.now()
+    try:
+        function = HANDLERS[job.name]
+        function(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning('Job %s (%s) failed on attempt %s', job.pk, job.name, job.attempts, exc_info=True)
+        now = timezone.now()
+        fields = {'locked_by': '', 'locked_at': None, 'started_at': started, 'last_error': error}
+        if job.attempts < job.max_attempts:
+            fields.update(status='queued', run_at=now + backoff(job.attempts))
+        else:
+            fields.update(status='failed', finished_at=now)
+        Job.objects.filter(pk=job.pk).update(**fields)
+        return False
+    Job.objects.filter(pk=job.pk).update(
+        status='succeeded', started_at=started, finished_at=timezone.now(), locked_by='', locked_at=None,
+        last_error='',
+    )
+    return True
+
+
+def queue_stats(window=timedelta(minutes=5)):
+    """
+    Queue depth per status, age of the oldest due job, and throughput and
+    mean run time over the last `window`.
+    """
+    now = timezone.now()
+    since = now - window
+    by_status = dict(Job.objects.order_by().values_list('status').annotate(count=Count('pk')))
+    oldest = Job.objects.filter(status='queued', run_at__lte=now).aggregate(oldest=Min('run_at'))['oldest']
+    recent = Job.objects.filter(status__in=['succeeded', 'failed'], finished_at__gte=since).aggregate(
+        succeeded=Count('pk', filter=Q(status='succeeded')),
+        failed=Count('pk', filter=Q(status='failed')),
+        mean_run=Avg(ExpressionWrapper(F('finished_at') - F('started_at'), output_field=DurationField())),
+    )
+    finished = recent['succeeded'] + recent['failed']
+    return {
+        'queued': by_status.get('queued', 0),
+        'running': by_status.get('running', 0),
+        'succeeded': by_status.get('succeeded', 0),
+        'failed': by_status.get('failed', 0),
+        'oldest_due_seconds': round((now - oldest).total_seconds(), 1) if oldest else 0,
+        'window_seconds': window.total_seconds(),
+        'finished_per_second': round(finished / window.total_seconds(), 3),
+        'failed_in_window': recent['failed'],
+        'mean_run_ms': round(recent['mean_run'].total_seconds() * 1000, 1) if recent['mean_run'] else None,
+    }
+
+
+class Worker:
+    """
+    One claim-and-run step at a time for the run_jobs command, with
+    per-process throughput counters.
+    """
+
+    def __init__(self, worker_id, batch_size=10):
+        self.worker_id = worker_id
+        self.batch_size = batch_size
+        self.stopping = False
+        self.started = time.monotonic()
+        self.succeeded = 0
+        self.failed = 0
+        self.last_purge = None
+
+    def metrics(self):
+        elapsed = time.monotonic() - self.started
+        processed = self.succeeded + self.failed
+        return {
+            'worker': self.worker_id,
+            'processed': processed,
+            'succeeded': self.succeeded,
+            'failed': self.failed,
+            'jobs_per_second': round(processed / elapsed, 2) if elapsed else 0.0,
+        }
+
+    def run_once(self):
+        requeue_stale()
+        interval = getattr(settings, 'JOB_PURGE_INTERVAL', 60 * 60)
+        if self.last_purge is None or time.monotonic() - self.last_purge >= interval:
+            purge_finished()
+            self.last_purge = time.monotonic()
+        jobs = claim(self.worker_id, self.batch_size)
+        for job in jobs:
+            if run(job):
+                self.succeeded += 1
+            else:
+                self.failed += 1
+        return len(jobs)
@@ -0,0 +1,124 @@
+import json
+import platform
+import random
+import statistics
+import time
+
+import django
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client as HttpClient
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
+
+from broker_operations.management.commands.bench_client_search import LAST_NAMES, percentile
+from broker_operations.models import Application, Client, Document, InterviewScript, Reminder, Task
+
+# name -> (URL name, query string); `{script}` is a synthetic script id and
+# `{term}` a client name prefix.
+ENDPOINTS = {
+    'dashboard': ('dashboard', ''),
+    'dashboard-summary': ('dashboard-summary', ''),
+    'dashboard-activity': ('dashboard-activity', ''),
+    'dashboard-reminders': ('dashboard-reminders', ''),
+    'dashboard-tasks': ('dashboard-tasks', ''),
+    'client-list': ('client-list', ''),
+    'client-search': ('client-search', 'q={term}'),
+    'application-list': ('application-list', ''),
+    'task-list': ('task-list', ''),
+    'reminder-list': ('reminder-list', ''),
+    'document-list': ('document-list', ''),
+    'script-list': ('script-list', ''),
+    'script-detail': ('script-detail', ''),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive the dashboard, list, search and script endpoints in process through the '
+        'Django test client, rotating over the brokers made by generate_synthetic_data, '
+        'and report throughput, latency percentiles and queries per request as JSON. '
+        'Requests are deterministic for a given seed, so runs on different commits or '
+        'databases compare like for like.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='synthetic', help='Prefix given to generate_synthetic_data.')
+        parser.add_argument('--requests', type=int, default=200, help='Measured requests per endpoint.')
+        parser.add_argument('--warmup', type=int, default=10, help='Unmeasured requests per endpoint first.')
+        parser.add_argument('--endpoints', nargs='+', choices=list(ENDPOINTS), default=list(ENDPOINTS))
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--label', default='', help='Recorded in the output, e.g. a commit id.')
+        parser.add_argument('--output', help='Also write the JSON report to this file.')
+
+    def handle(self, *args, prefix, requests, warmup, endpoints, seed, label, output, **options):
+        brokers = list(User.objects.filter(username__startswith=f'{prefix}-').order_by('pk'))
+        scripts = list(InterviewScript.objects.filter(version=prefix).order_by('pk').values_list('pk', flat=True))
+        if not brokers:
+            raise CommandError(f'No brokers named {prefix}-*; run generate_synthetic_data first.')
+        cache.clear()
+        rng = random.Random(seed)
+        clients = [
+            HttpClient(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(broker)}', HTTP_HOST='localhost')
+            for broker in brokers
+        ]
+        results = {}
+        for name in endpoints:
+            plan = [self.request(name, rng, clients, scripts) for _ in range(warmup + requests)]
+            results[name] = self.run_endpoint(plan[:warmup], plan[warmup:])
+        report = {
+            'label': label,
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'rows': {
+                model.__name__: model.objects.count()
+                for model in (User, Client, Application, Task, Reminder, Document, InterviewScript)
+            },
+            'brokers': len(brokers),
+            'requests_per_endpoint': requests,
+            'endpoints': results,
+        }
+        text = json.dumps(report, indent=2)
+        if output:
+            with open(output, 'w') as f:
+                f.write(text + '\n')
+        self.stdout.write(text)
+
+    def request(self, name, rng, clients, scripts):
+        url_name, query = ENDPOINTS[name]
+        if name == 'script-detail':
+            if not scripts:
+                raise CommandError('script-detail needs synthetic scripts.')
+            url = reverse(url_name, args=[rng.choice(scripts)])
+        else:
+            url = reverse(url_name)
+        if query:
+            url += '?' + query.format(term=rng.choice(LAST_NAMES)[:rng.randint(2, 4)])
+        return rng.choice(clients), url
+
+    def run_endpoint(self, warmup, plan):
+        for http, url in warmup:
+            http.get(url)
+        samples, errors = [], 0
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            for http, url in plan:
+                start = time.perf_counter()
+                response = http.get(url)
+                samples.append((time.perf_counter() - start) * 1000)
+                errors += response.status_code != 200
+            elapsed = time.perf_counter() - started
+        return {
+            'requests_per_second': round(len(plan) / elapsed, 1),
+            'p50_ms': round(percentile(samples, 0.5), 3),
+            'p90_ms': round(percentile(samples, 0.9), 3),
+            'p99_ms': round(percentile(samples, 0.99), 3),
+            'mean_ms': round(statistics.mean(samples), 3),
+            'max_ms': round(max(samples), 3),
+            'queries_per_request': round(len(queries) / len(plan), 2),
+            'errors': errors,
+        }
@@ -0,0 +1,111 @@
+import json
+import random
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from broker_operations.models import Client
+from broker_operations.search import search_clients
+from broker_operations.typeahead import TypeaheadRegistry
+
+FIRST_NAMES = ['james', 'mary', 'robert', 'patricia', 'john', 'jennifer', 'michael', 'linda',
+               'william', 'elizabeth', 'david', 'barbara', 'richard', 'susan', 'joseph', 'jessica']
+LAST_NAMES = ['smith', 'johnson', 'williams', 'brown', 'jones', 'garcia', 'miller', 'davis',
+              'rodriguez', 'martinez', 'hernandez', 'lopez', 'gonzalez', 'wilson', 'anderson', 'nguyen']
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def timed(run, queries):
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        run(query)
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        'p50_ms': round(percentile(samples, 0.5), 3),
+        'p99_ms': round(percentile(samples, 0.99), 3),
+        'mean_ms': round(statistics.mean(samples), 3),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare client search latency for the typeahead index, the database search '
+        'backend and the legacy icontains scan. Data is generated inside a transaction '
+        'that is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--limit', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, sizes, queries, limit, seed, **options):
+        results = []
+        for size in sizes:
+            with transaction.atomic():
+                results.append(self.run_size(size, queries, limit, random.Random(seed)))
+                transaction.set_rollback(True)
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def run_size(self, size, query_count, limit, rng):
+        broker = User.objects.create(username=f'bench-search-{size}')
+        clients = []
+        for i in range(size):
+            client = Client(
+                broker=broker,
+                first_name=rng.choice(FIRST_NAMES).title(),
+                last_name=rng.choice(LAST_NAMES).title(),
+                email=f'bench{size}-{i}@example.com',
+                phone=f'04{rng.randrange(10 ** 8):08d}',
+                address='1 Bench St',
+            )
+            client.update_search_fields()
+            clients.append(client)
+        Client.objects.bulk_create(clients, batch_size=1000)
+
+        queries = []
+        for _ in range(query_count):
+            kind = rng.random()
+            if kind < 0.6:
+                queries.append(rng.choice(LAST_NAMES)[:rng.randint(1, 4)])
+            elif kind < 0.9:
+                queries.append(f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)[:2]}')
+            else:
+                queries.append(f'04{rng.randrange(100):02d}')
+
+        base = Client.objects.filter(broker=broker)
+        registry = TypeaheadRegistry()
+        start = time.perf_counter()
+        registry.get(broker.id)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        def legacy(query):
+            list(base.filter(
+                Q(first_name__icontains=query) | Q(last_name__icontains=query) |
+                Q(email__icontains=query) | Q(phone__icontains=query)
+            ).values_list('pk', flat=True)[:limit])
+
+        def database(query):
+            list(search_clients(base, query, broker.id, limit).values_list('pk', flat=True))
+
+        def index(query):
+            registry.search(broker.id, query, limit)
+
+        return {
+            'clients': size,
+            'typeahead_build_ms': round(build_ms, 1),
+            'typeahead_memory_bytes': registry.memory_used(),
+            'typeahead': timed(index, queries),
+            'database': timed(database, queries),
+            'legacy_icontains': timed(legacy, queries),
+        }
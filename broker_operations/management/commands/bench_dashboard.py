@@ -0,0 +1,104 @@
+import asyncio
+import json
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from broker_operations.management.commands.bench_client_search import percentile
+
+PATHS = ['summary', 'activity', 'reminders', 'tasks']
+
+
+async def fetch(reader, writer, request):
+    writer.write(request)
+    await writer.drain()
+    status_line = await reader.readline()
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    await reader.readexactly(length)
+    return int(status_line.split()[1])
+
+
+async def client(host, port, requests, deadline, samples, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while time.monotonic() < deadline:
+            path, request = requests[len(samples[None]) % len(requests)]
+            start = time.perf_counter()
+            status = await fetch(reader, writer, request)
+            elapsed = (time.perf_counter() - start) * 1000
+            samples[None].append(elapsed)
+            samples[path].append(elapsed)
+            if status != 200:
+                errors[status] = errors.get(status, 0) + 1
+    finally:
+        writer.close()
+
+
+def summarize(values):
+    return {
+        'requests': len(values),
+        'p50_ms': round(percentile(values, 0.5), 2),
+        'p99_ms': round(percentile(values, 0.99), 2),
+        'mean_ms': round(statistics.mean(values), 2),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Load test the dashboard endpoints of a running server (e.g. daphne or uvicorn, '
+        'started with and without DASHBOARD_ASYNC_VIEWS) over keep-alive connections.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000/dashboard/')
+        parser.add_argument('--username', required=True, help='Broker whose dashboard is requested.')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 50])
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds per concurrency level.')
+        parser.add_argument('--paths', nargs='+', default=PATHS, choices=PATHS)
+
+    def handle(self, *args, url, username, concurrency, duration, paths, **options):
+        broker = User.objects.filter(username=username).first()
+        if broker is None:
+            raise CommandError(f'No user named {username!r}.')
+        parts = urlsplit(url)
+        token = AccessToken.for_user(broker)
+        requests = [
+            (path, (
+                f'GET {parts.path.rstrip("/")}/{path}/ HTTP/1.1\r\n'
+                f'Host: {parts.netloc}\r\nAuthorization: Bearer {token}\r\n\r\n'
+            ).encode())
+            for path in paths
+        ]
+        results = [
+            asyncio.run(self.run_level(parts.hostname, parts.port or 80, requests, level, duration))
+            for level in concurrency
+        ]
+        self.stdout.write(json.dumps(results, indent=2))
+
+    async def run_level(self, host, port, requests, level, duration):
+        samples = {None: []}
+        samples.update((path, []) for path, _ in requests)
+        errors = {}
+        start = time.monotonic()
+        await asyncio.gather(*(
+            client(host, port, requests, start + duration, samples, errors) for _ in range(level)
+        ))
+        elapsed = time.monotonic() - start
+        return {
+            'concurrency': level,
+            'requests_per_second': round(len(samples[None]) / elapsed, 1),
+            'errors': errors,
+            'all': summarize(samples[None]),
+            'paths': {path: summarize(values) for path, values in samples.items() if path and values},
+        }
@@ -0,0 +1,88 @@
+import json
+import statistics
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client as HttpClient
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+
+from broker_operations.authentication import StatelessJWTAuthentication
+from broker_operations.management.commands.bench_client_search import percentile
+from broker_operations.models import Application, Client, Reminder, Task
+
+ENDPOINTS = ['dashboard-summary', 'dashboard-activity', 'dashboard-reminders', 'dashboard-tasks', 'dashboard']
+AUTHENTICATORS = {'simplejwt': JWTAuthentication, 'stateless': StatelessJWTAuthentication}
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare queries and latency per dashboard request with the simplejwt '
+        'authentication class and StatelessJWTAuthentication, in process. Data is '
+        'generated inside a transaction that is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Requests per endpoint and class.')
+
+    def handle(self, *args, requests, **options):
+        with transaction.atomic():
+            broker = self.make_data()
+            http = HttpClient(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(broker)}', HTTP_HOST='localhost')
+            results = {name: self.run_class(authenticator, http, requests) for name, authenticator in AUTHENTICATORS.items()}
+            transaction.set_rollback(True)
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def make_data(self):
+        broker = User.objects.create(username='bench-jwt-auth')
+        client = Client.objects.create(
+            broker=broker, email='bench-jwt-auth@example.com', first_name='Bench', last_name='Client',
+            phone='0400000000', address='1 Bench St',
+        )
+        due = timezone.now() + timedelta(days=1)
+        for i in range(10):
+            Application.objects.create(
+                client=client, broker=broker, status='submitted', loan_amount='400000.00', property_value='500000.00',
+            )
+        Task.objects.bulk_create(
+            Task(title=f'Task {i}', description='', broker=broker, due_date=due + timedelta(hours=i))
+            for i in range(20)
+        )
+        Reminder.objects.bulk_create(
+            Reminder(title=f'Reminder {i}', description='', broker=broker, due_date=due + timedelta(hours=i))
+            for i in range(20)
+        )
+        return broker
+
+    def run_class(self, authenticator, http, requests):
+        cache.clear()
+        original = APIView.get_authenticators
+        APIView.get_authenticators = lambda view: [authenticator()]
+        try:
+            results = {}
+            for name in ENDPOINTS:
+                url = reverse(name)
+                http.get(url)
+                samples = []
+                with CaptureQueriesContext(connection) as queries:
+                    for _ in range(requests):
+                        start = time.perf_counter()
+                        response = http.get(url)
+                        samples.append((time.perf_counter() - start) * 1000)
+                        assert response.status_code == 200, response.status_code
+                results[name] = {
+                    'queries_per_request': round(len(queries) / requests, 2),
+                    'p50_ms': round(percentile(samples, 0.5), 3),
+                    'mean_ms': round(statistics.mean(samples), 3),
+                }
+            return results
+        finally:
+            APIView.get_authenticators = original
@@ -0,0 +1,87 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.test import RequestFactory, override_settings
+
+from broker_operations import passwords
+from broker_operations.views import login
+
+USERNAME = 'bench-login'
+PASSWORD = 'bench-login-password'
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure login throughput through the login view, hashing inline and on the '
+        'process pool, and the cost of attempts rejected by the failed-login limiter. '
+        'Creates and then deletes one user.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=40, help='Logins per mode.')
+        parser.add_argument('--threads', type=int, default=4, help='Concurrent request threads.')
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 2], help='Pool sizes to measure.')
+
+    def handle(self, *args, logins, threads, workers, **options):
+        User.objects.filter(username=USERNAME).delete()
+        User.objects.create_user(USERNAME, password=PASSWORD)
+        try:
+            results = [self.run_mode('inline', 0, logins, threads)]
+            for size in workers:
+                results.append(self.run_mode('pool', size, logins, threads))
+            results.append(self.run_rejected(logins * 50))
+        finally:
+            passwords.shutdown()
+            User.objects.filter(username=USERNAME).delete()
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def request(self, password=PASSWORD):
+        request = RequestFactory().post(
+            '/auth/login/', {'username': USERNAME, 'password': password}, content_type='application/json',
+        )
+        try:
+            return login(request).status_code
+        finally:
+            close_old_connections()
+
+    def run_mode(self, mode, workers, logins, threads):
+        cache.clear()
+        with override_settings(LOGIN_HASH_WORKERS=workers):
+            passwords.shutdown()
+            # Warm up: start the pool and its processes.
+            for _ in range(max(workers, 1)):
+                self.request()
+            start = time.perf_counter()
+            with ThreadPoolExecutor(threads) as executor:
+                statuses = list(executor.map(lambda _: self.request(), range(logins)))
+            elapsed = time.perf_counter() - start
+        cores = min(os.cpu_count() or 1, workers or threads)
+        return {
+            'mode': mode,
+            'workers': workers,
+            'threads': threads,
+            'ok': statuses.count(200),
+            'logins_per_second': round(logins / elapsed, 2),
+            'cores': cores,
+            'logins_per_second_per_core': round(logins / elapsed / cores, 2),
+        }
+
+    def run_rejected(self, attempts):
+        cache.clear()
+        with override_settings(LOGIN_HASH_WORKERS=0):
+            while self.request('wrong') != 429:
+                pass
+            start = time.perf_counter()
+            statuses = [self.request('wrong') for _ in range(attempts)]
+            elapsed = time.perf_counter() - start
+        return {
+            'mode': 'rejected',
+            'rejected': statuses.count(429),
+            'attempts_per_second': round(attempts / elapsed, 1),
+        }
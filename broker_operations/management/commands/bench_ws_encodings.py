@@ -0,0 +1,66 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from broker_operations.encodings import ENCODINGS, EncodedEventCache
+
+
+def sample_event(rows):
+    """
+    A batched task_update shaped like TaskSerializer output, e.g. what a bulk
+    status change publishes.
+    """
+    return {
+        'type': 'task_update',
+        'seq': 1,
+        'data': [
+            {
+                'op': 'updated',
+                'id': 1000 + i,
+                'fields': {
+                    'status': 'completed',
+                    'priority': 'medium',
+                    'due_date': '2026-10-18T09:30:00Z',
+                    'updated_at': '2026-10-18T09:31:12.123456Z',
+                },
+            }
+            for i in range(rows)
+        ],
+    }
+
+
+class Command(BaseCommand):
+    help = 'Micro-benchmark the WebSocket encodings on a batched update event.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200, help='Rows per batched event.')
+        parser.add_argument('--consumers', type=int, default=300, help='Open dashboards receiving the event.')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, rows=200, consumers=300, repeat=20, **options):
+        event = sample_event(rows)
+        results = {'rows': rows, 'consumers': consumers, 'encodings': {}}
+        for name, encoding in ENCODINGS.items():
+            payload = encoding.encode(event)
+
+            start = time.perf_counter()
+            for _ in range(repeat):
+                encoding.encode(event)
+            encode_seconds = (time.perf_counter() - start) / repeat
+
+            # Fan-out with one shared encoding pass per event, as consumers do.
+            start = time.perf_counter()
+            for i in range(repeat):
+                shared = EncodedEventCache()
+                for _ in range(consumers):
+                    shared.encode(encoding, (i,), event)
+            fanout_seconds = (time.perf_counter() - start) / repeat
+
+            results['encodings'][name] = {
+                'bytes': len(payload),
+                'encode_us': round(encode_seconds * 1e6, 1),
+                'fanout_naive_ms': round(encode_seconds * consumers * 1e3, 2),
+                'fanout_shared_ms': round(fanout_seconds * 1e3, 2),
+            }
+        self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,34 @@
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from broker_operations.models import Client
+from broker_operations.serializers import ClientSerializer
+from broker_operations.streaming import csv_lines, ndjson_lines
+
+
+class Command(BaseCommand):
+    help = 'Stream a broker\'s clients as CSV or NDJSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--broker', required=True, help='Username of the owning broker.')
+        parser.add_argument('--format', dest='file_format', choices=['csv', 'ndjson'], default='csv')
+        parser.add_argument('--output', help='Defaults to stdout.')
+
+    def handle(self, *args, broker, file_format='csv', output=None, **options):
+        try:
+            broker = User.objects.get(username=broker)
+        except User.DoesNotExist:
+            raise CommandError(f'Unknown broker {broker!r}')
+        queryset = Client.objects.filter(broker=broker).order_by('pk')
+        lines = (csv_lines if file_format == 'csv' else ndjson_lines)(queryset, ClientSerializer)
+        stream = open(output, 'wb') if output else sys.stdout.buffer
+        try:
+            for chunk in lines:
+                stream.write(chunk)
+        finally:
+            if output:
+                stream.close()
+            else:
+                stream.flush()
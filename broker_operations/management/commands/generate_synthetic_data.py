@@ -0,0 +1,205 @@
+import json
+import random
+import time
+from datetime import datetime, time as day_start, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from broker_operations import script_cache, signals
+from broker_operations.management.commands.bench_client_search import FIRST_NAMES, LAST_NAMES
+from broker_operations.models import (
+    Application, BrokerStats, Client, Document, InterviewScript, Reminder, ScriptSection, Task,
+)
+from broker_operations.stats import count_for_brokers
+
+PASSWORD = 'synthetic-pass-123'
+STREETS = ['High St', 'Station Rd', 'Church Ln', 'Park Ave', 'Mill Rd', 'King St', 'Queen St', 'Bridge Rd']
+
+
+def bulk_insert(model, rows, queryset, batch_size):
+    """
+    Insert `rows` and make sure they have primary keys. Backends that do not
+    return keys from bulk inserts (MySQL) get them from `queryset`, the
+    newest ``len(rows)`` rows matching it, which were inserted in order.
+    """
+    model.objects.bulk_create(rows, batch_size=batch_size)
+    if rows and rows[0].pk is None:
+        pks = list(queryset.order_by('-pk').values_list('pk', flat=True)[:len(rows)])
+        for row, pk in zip(rows, reversed(pks)):
+            row.pk = pk
+    return rows
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate deterministic synthetic brokers with clients, applications, tasks, '
+        'reminders and documents, plus interview scripts, using bulk inserts. The same '
+        'seed, sizes and anchor date always produce the same rows. Brokers are named '
+        '<prefix>-<n> and share one password.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--brokers', type=int, default=10)
+        parser.add_argument('--clients', type=int, default=100, help='Clients per broker.')
+        parser.add_argument('--applications', type=int, default=1, help='Applications per client.')
+        parser.add_argument('--tasks', type=int, default=2, help='Tasks per client.')
+        parser.add_argument('--reminders', type=int, default=2, help='Reminders per client.')
+        parser.add_argument('--documents', type=int, default=2, help='Documents per client.')
+        parser.add_argument('--scripts', type=int, default=5)
+        parser.add_argument('--sections', type=int, default=6, help='Sections per script.')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--anchor', help='Date the timestamps are spread around (YYYY-MM-DD), default today.')
+        parser.add_argument('--prefix', default='synthetic')
+        parser.add_argument('--flush', action='store_true', help='Delete earlier data with the same prefix first.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, prefix, flush, anchor, seed, batch_size, **sizes):
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size
+        anchor = datetime.fromisoformat(anchor).date() if anchor else timezone.localdate()
+        self.anchor = timezone.make_aware(datetime.combine(anchor, day_start()))
+        brokers = User.objects.filter(username__startswith=f'{prefix}-')
+        scripts = InterviewScript.objects.filter(version=prefix)
+        if flush:
+            with transaction.atomic(), signals.suppressed():
+                ScriptSection.objects.filter(scripts__in=scripts).delete()
+                scripts.delete()
+                brokers.delete()
+        elif brokers.exists():
+            raise CommandError(f'Brokers named {prefix}-* already exist; pass --flush to replace them.')
+
+        start = time.perf_counter()
+        with transaction.atomic():
+            counts = self.generate(prefix, sizes)
+        script_cache.invalidate()
+        counts['seconds'] = round(time.perf_counter() - start, 2)
+        self.stdout.write(json.dumps(counts, indent=2))
+
+    def when(self, days_before, days_after):
+        offset = self.rng.uniform(-days_before, days_after)
+        return self.anchor + timedelta(days=offset)
+
+    def generate(self, prefix, sizes):
+        rng, batch_size = self.rng, self.batch_size
+        password = make_password(PASSWORD)
+        brokers = bulk_insert(User, [
+            User(username=f'{prefix}-{b}', email=f'{prefix}-{b}@example.com', password=password,
+                 first_name=rng.choice(FIRST_NAMES).title(), last_name=rng.choice(LAST_NAMES).title(),
+                 date_joined=self.anchor)
+            for b in range(sizes['brokers'])
+        ], User.objects.filter(username__startswith=f'{prefix}-'), batch_size)
+        broker_ids = [broker.pk for broker in brokers]
+
+        clients = []
+        for broker in brokers:
+            for c in range(sizes['clients']):
+                client = Client(
+                    broker_id=broker.pk,
+                    first_name=rng.choice(FIRST_NAMES).title(),
+                    last_name=rng.choice(LAST_NAMES).title(),
+                    email=f'{broker.username}-{c}@example.com',
+                    phone=f'04{rng.randrange(10 ** 8):08d}',
+                    address=f'{rng.randint(1, 300)} {rng.choice(STREETS)}',
+                    created_at=self.when(365, 0),
+                )
+                client.update_search_fields()
+                clients.append(client)
+        bulk_insert(Client, clients, Client.objects.filter(broker_id__in=broker_ids), batch_size)
+
+        applications, documents = [], []
+        document_types = [choice for choice, _ in Document.DOCUMENT_TYPES]
+        statuses = [choice for choice, _ in Application.STATUS_CHOICES]
+        for client in clients:
+            for _ in range(sizes['applications']):
+                value = rng.randrange(200_000, 2_000_000, 1000)
+                applications.append(Application(
+                    client_id=client.pk, broker_id=client.broker_id, status=rng.choice(statuses),
+                    property_value=Decimal(value), loan_amount=Decimal(value * rng.randint(50, 95) // 100),
+                    created_at=max(client.created_at, self.when(180, 0)),
+                ))
+            for d in range(sizes['documents']):
+                documents.append(Document(
+                    client_id=client.pk, title=f'Document {d + 1}', document_type=rng.choice(document_types),
+                    file=f'documents/{client.email}-{d}.pdf', size=rng.randrange(20_000, 5_000_000),
+                    uploaded_at=max(client.created_at, self.when(180, 0)),
+                ))
+        bulk_insert(Application, applications, Application.objects.filter(broker_id__in=broker_ids), batch_size)
+        Document.objects.bulk_create(documents, batch_size=batch_size)
+
+        by_client = {}
+        for application in applications:
+            by_client.setdefault(application.client_id, []).append(application.pk)
+        tasks, reminders = [], []
+        priorities = [choice for choice, _ in Task.PRIORITY_CHOICES]
+        task_statuses = [choice for choice, _ in Task.STATUS_CHOICES]
+        for client in clients:
+            client_applications = by_client.get(client.pk) or [None]
+            for t in range(sizes['tasks']):
+                tasks.append(Task(
+                    title=f'Follow up {client.last_name} #{t + 1}', description='Synthetic task',
+                    broker_id=client.broker_id, client_id=client.pk,
+                    application_id=rng.choice(client_applications), due_date=self.when(14, 60),
+                    priority=rng.choice(priorities), status=rng.choice(task_statuses),
+                    created_at=client.created_at,
+                ))
+            for r in range(sizes['reminders']):
+                reminders.append(Reminder(
+                    title=f'Call {client.first_name} {client.last_name} #{r + 1}', description='Synthetic reminder',
+                    broker_id=client.broker_id, client_id=client.pk,
+                    application_id=rng.choice(client_applications), due_date=self.when(14, 60),
+                    is_completed=rng.random() < 0.3, created_at=client.created_at,
+                ))
+        Task.objects.bulk_create(tasks, batch_size=batch_size)
+        Reminder.objects.bulk_create(reminders, batch_size=batch_size)
+
+        section_count = self.generate_scripts(prefix, sizes['scripts'], sizes['sections'])
+
+        # Bulk inserts skip the signals that keep the counters current.
+        BrokerStats.objects.bulk_create(
+            [BrokerStats(broker_id=broker_id, **counts) for broker_id, counts in count_for_brokers(broker_ids).items()],
+            batch_size=batch_size,
+        )
+        return {
+            'brokers': len(brokers),
+            'clients': len(clients),
+            'applications': len(applications),
+            'documents': len(documents),
+            'tasks': len(tasks),
+            'reminders': len(reminders),
+            'scripts': sizes['scripts'],
+            'script_sections': section_count,
+        }
+
+    def generate_scripts(self, prefix, script_count, section_count):
+        rng, batch_size = self.rng, self.batch_size
+        script_types = [choice for choice, _ in InterviewScript.SCRIPT_TYPES]
+        sections = bulk_insert(ScriptSection, [
+            ScriptSection(
+                title=f'Section {s + 1}', duration_seconds=rng.randrange(60, 900, 30),
+                content=' '.join(rng.choice(LAST_NAMES) for _ in range(60)), order=s + 1,
+                key_notes=f'Note {i}-{s}',
+            )
+            for i in range(script_count) for s in range(section_count)
+        ], ScriptSection.objects.all(), batch_size)
+        scripts = []
+        for i in range(script_count):
+            own = sections[i * section_count:(i + 1) * section_count]
+            scripts.append(InterviewScript(
+                title=f'{rng.choice(script_types).replace("_", " ").title()} script {i + 1}',
+                description='Synthetic interview script', script_type=rng.choice(script_types),
+                version=prefix, total_duration=sum(section.duration_seconds for section in own),
+                created_at=self.when(365, 0),
+            ))
+        bulk_insert(InterviewScript, scripts, InterviewScript.objects.filter(version=prefix), batch_size)
+        through = InterviewScript.sections.through
+        through.objects.bulk_create([
+            through(interviewscript_id=script.pk, scriptsection_id=section.pk)
+            for i, script in enumerate(scripts)
+            for section in sections[i * section_count:(i + 1) * section_count]
+        ], batch_size=batch_size)
+        return len(sections)
@@ -0,0 +1,34 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from broker_operations.client_import import detect_format, import_clients
+
+
+class Command(BaseCommand):
+    help = 'Upsert a broker\'s clients from a CSV or NDJSON file, matched on email.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--broker', required=True, help='Username of the owning broker.')
+        parser.add_argument('--format', dest='file_format', choices=['csv', 'ndjson'],
+                            help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=None)
+
+    def handle(self, *args, path, broker, file_format=None, batch_size=None, **options):
+        try:
+            broker = User.objects.get(username=broker)
+        except User.DoesNotExist:
+            raise CommandError(f'Unknown broker {broker!r}')
+        file_format = file_format or detect_format(path)
+        if file_format is None:
+            raise CommandError('Cannot tell the file format; pass --format.')
+        with open(path, 'rb') as stream:
+            result = import_clients(broker, stream, file_format, batch_size)
+        for error in result['errors']:
+            self.stderr.write(f'line {error["line"]}: {json.dumps(error["errors"])}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{result["rows"]} rows: {result["created"]} created, {result["updated"]} updated, '
+            f'{result["error_count"]} rejected'
+        ))
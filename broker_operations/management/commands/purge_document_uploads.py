@@ -0,0 +1,16 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from broker_operations.documents import purge_stale_uploads
+
+
+class Command(BaseCommand):
+    help = 'Discard resumable document uploads that have stopped receiving chunks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=24, help='Idle time before an upload is discarded.')
+
+    def handle(self, *args, hours=24, **options):
+        count = purge_stale_uploads(timedelta(hours=hours))
+        self.stdout.write(self.style.SUCCESS(f'{count} stale uploads discarded'))
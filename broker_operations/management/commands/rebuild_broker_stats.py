@@ -0,0 +1,61 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from broker_operations.dashboard import invalidate_summary
+from broker_operations.models import BrokerStats
+from broker_operations.stats import COUNTER_FIELDS, count_for_brokers
+
+
+class Command(BaseCommand):
+    help = 'Recompute BrokerStats counters from the base tables and report drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--broker', type=int, action='append', dest='brokers',
+                            help='Only rebuild the given broker id (repeatable).')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report drift without writing any counters.')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, brokers=None, dry_run=False, batch_size=500, **options):
+        broker_ids = brokers or list(User.objects.values_list('id', flat=True))
+        expected = count_for_brokers(brokers)
+        existing = BrokerStats.objects.all()
+        if brokers:
+            existing = existing.filter(broker_id__in=brokers)
+        existing = {stats.broker_id: stats for stats in existing}
+
+        to_create, to_update, drifted = [], [], 0
+        for broker_id in broker_ids:
+            counts = expected.get(broker_id) or dict.fromkeys(COUNTER_FIELDS, 0)
+            stats = existing.get(broker_id)
+            if stats is None:
+                to_create.append(BrokerStats(broker_id=broker_id, **counts))
+                continue
+            drift = {
+                field: (getattr(stats, field), counts[field])
+                for field in COUNTER_FIELDS
+                if getattr(stats, field) != counts[field]
+            }
+            if drift:
+                drifted += 1
+                self.stdout.write(self.style.WARNING(
+                    f'Broker {broker_id} drifted: ' + ', '.join(
+                        f'{field} {old} -> {new}' for field, (old, new) in drift.items()
+                    )
+                ))
+                for field, (_, new) in drift.items():
+                    setattr(stats, field, new)
+                to_update.append(stats)
+
+        if not dry_run:
+            with transaction.atomic():
+                BrokerStats.objects.bulk_create(to_create, batch_size=batch_size, ignore_conflicts=True)
+                BrokerStats.objects.bulk_update(to_update, COUNTER_FIELDS, batch_size=batch_size)
+            for stats in to_create + to_update:
+                invalidate_summary(stats.broker_id)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(broker_ids)} brokers checked, {drifted} drifted, {len(to_create)} missing'
+            + (' (dry run)' if dry_run else '')
+        ))
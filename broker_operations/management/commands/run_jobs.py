@@ -0,0 +1,67 @@
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from broker_operations.jobs import Worker, queue_stats
+
+
+class Command(BaseCommand):
+    help = 'Run background jobs from the database queue.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1, help='Worker processes to fork.')
+        parser.add_argument('--batch-size', type=int, default=10, help='Jobs claimed per query.')
+        parser.add_argument('--poll-interval', type=float, default=1.0)
+        parser.add_argument('--metrics-interval', type=float, default=60.0,
+                            help='Seconds between throughput log lines.')
+        parser.add_argument('--max-jobs', type=int, help='Exit after this many jobs per process.')
+        parser.add_argument('--until-empty', action='store_true', help='Exit once no job is due.')
+        parser.add_argument('--stats', action='store_true', help='Print queue statistics and exit.')
+
+    def handle(self, *args, processes=1, stats=False, **options):
+        if stats:
+            self.stdout.write(json.dumps(queue_stats(), indent=2))
+            return
+        if processes <= 1:
+            self.work(**options)
+            return
+        # Children must open their own database connections.
+        connections.close_all()
+        children = [multiprocessing.Process(target=self.work, kwargs=options) for _ in range(processes)]
+        for child in children:
+            child.start()
+        try:
+            for child in children:
+                child.join()
+        except KeyboardInterrupt:
+            for child in children:
+                child.terminate()
+
+    def work(self, batch_size=10, poll_interval=1.0, metrics_interval=60.0, max_jobs=None,
+             until_empty=False, **options):
+        worker = Worker(f'{socket.gethostname()}:{os.getpid()}', batch_size)
+
+        def stop(signum, frame):
+            worker.stopping = True
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        last_report = time.monotonic()
+        while not worker.stopping:
+            claimed = worker.run_once()
+            if time.monotonic() - last_report >= metrics_interval:
+                self.stdout.write(json.dumps(worker.metrics()))
+                last_report = time.monotonic()
+            if max_jobs is not None and worker.succeeded + worker.failed >= max_jobs:
+                break
+            if not claimed:
+                if until_empty:
+                    break
+                time.sleep(poll_interval)
+        self.stdout.write(json.dumps(worker.metrics()))
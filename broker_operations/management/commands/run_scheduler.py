@@ -0,0 +1,20 @@
+import asyncio
+import signal
+
+from django.core.management.base import BaseCommand
+
+from broker_operations.scheduler import DueScheduler
+
+
+class Command(BaseCommand):
+    help = 'Push reminder and task due events to connected brokers as items come due.'
+
+    def handle(self, *args, **options):
+        asyncio.run(self.serve(DueScheduler()))
+
+    async def serve(self, scheduler):
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, lambda: setattr(scheduler, 'stopping', True))
+        await scheduler.run()
+        self.stdout.write(f'Scheduler stopped after firing {scheduler.fired} items')
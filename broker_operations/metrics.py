@@ -0,0 +1,168 @@
+"""
+In-process request metrics.
+
+``PerformanceMiddleware`` opens a ``RequestStats`` for each request; the
+database wrapper below and ``serializing()`` blocks (``TimedModelSerializer``
+and the fast read path) add to it, and at the end of the request the
+totals go into histograms labelled with the resolved URL name. ``render()`` writes every histogram in the Prometheus text
+format for the ``metrics`` endpoint. Each process has its own registry, so
+scrape every worker (or sum across them).
+
+The database wrapper is installed on every connection as it opens, so
+queries run from ``sync_to_async`` threads count towards the request that
+awaited them. Queries slower than ``PERF_SLOW_QUERY_MS`` are logged to
+``broker_operations.slow_queries`` with their SQL and stack.
+"""
+import bisect
+import logging
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+slow_query_logger = logging.getLogger('broker_operations.slow_queries')
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+current_stats = ContextVar('request_stats', default=None)
+
+
+class RequestStats:
+    __slots__ = ('view', 'queries', 'query_seconds', 'serializer_seconds', 'serializing')
+
+    def __init__(self):
+        self.view = None
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.serializer_seconds = 0.0
+        self.serializing = False
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # name -> (help, buckets, {labels: Histogram})
+        self.metrics = {}
+
+    def histogram(self, name, help_text, buckets):
+        self.metrics.setdefault(name, (help_text, buckets, {}))
+
+    def observe(self, name, labels, value):
+        _, buckets, series = self.metrics[name]
+        with self.lock:
+            histogram = series.get(labels)
+            if histogram is None:
+                histogram = series[labels] = Histogram(buckets)
+            histogram.observe(value)
+
+    def clear(self):
+        with self.lock:
+            for _, _, series in self.metrics.values():
+                series.clear()
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for name, (help_text, buckets, series) in self.metrics.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for labels, histogram in sorted(series.items()):
+                    label_text = ','.join(f'{key}="{_escape(value)}"' for key, value in labels)
+                    prefix = f'{label_text},' if label_text else ''
+                    cumulative = 0
+                    for bound, count in zip(buckets + (float('inf'),), histogram.counts):
+                        cumulative += count
+                        le = '+Inf' if bound == float('inf') else repr(float(bound))
+                        lines.append(f'{name}_bucket{{{prefix}le="{le}"}} {cumulative}')
+                    lines.append(f'{name}_sum{{{label_text}}} {histogram.sum!r}')
+                    lines.append(f'{name}_count{{{label_text}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = Registry()
+registry.histogram('http_request_duration_seconds', 'Wall time per request.', DURATION_BUCKETS)
+registry.histogram('http_response_size_bytes', 'Response body size.', SIZE_BUCKETS)
+registry.histogram('db_queries_per_request', 'Database queries per request.', QUERY_COUNT_BUCKETS)
+registry.histogram('db_query_duration_seconds', 'Database time per request.', DURATION_BUCKETS)
+registry.histogram('serializer_duration_seconds', 'Serializer time per request.', DURATION_BUCKETS)
+
+
+def record(stats, method, status_code, seconds, size):
+    view = stats.view or 'unresolved'
+    registry.observe('http_request_duration_seconds', (('method', method), ('status', str(status_code)),
+                                                       ('view', view)), seconds)
+    labels = (('view', view),)
+    if size is not None:
+        registry.observe('http_response_size_bytes', labels, size)
+    registry.observe('db_queries_per_request', labels, stats.queries)
+    registry.observe('db_query_duration_seconds', labels, stats.query_seconds)
+    registry.observe('serializer_duration_seconds', labels, stats.serializer_seconds)
+
+
+def count_queries(execute, sql, params, many, context):
+    stats = current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        stats.queries += 1
+        stats.query_seconds += elapsed
+        threshold = getattr(settings, 'PERF_SLOW_QUERY_MS', None)
+        if threshold is not None and elapsed * 1000 >= threshold:
+            slow_query_logger.warning(
+                'Slow query (%.1f ms) in %s: %s\n%s', elapsed * 1000, stats.view, sql,
+                ''.join(traceback.format_stack(limit=getattr(settings, 'PERF_SLOW_QUERY_STACK_DEPTH', 20))),
+            )
+
+
+@receiver(connection_created)
+def install_query_counter(sender, connection, **kwargs):
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+@contextmanager
+def serializing():
+    """
+    Count the time inside towards the request's serializer time, unless an
+    enclosing block already does.
+    """
+    stats = current_stats.get()
+    if stats is None or stats.serializing:
+        yield
+        return
+    stats.serializing = True
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.serializer_seconds += time.perf_counter() - start
+        stats.serializing = False
+
@@ -0,0 +1,60 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from . import metrics
+
+
+class PerformanceMiddleware:
+    """
+    Record wall time, database queries, serializer time and response size
+    for each request, by resolved URL name. See ``metrics``.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats = metrics.RequestStats()
+        token = metrics.current_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.current_stats.reset(token)
+        self.record(request, response, stats, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        stats = metrics.RequestStats()
+        token = metrics.current_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.current_stats.reset(token)
+        self.record(request, response, stats, time.perf_counter() - start)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        stats = metrics.current_stats.get()
+        if stats is not None:
+            stats.view = request.resolver_match.view_name
+        return None
+
+    def record(self, request, response, stats, seconds):
+        if stats.view is None and request.resolver_match is not None:
+            stats.view = request.resolver_match.view_name
+        if response.streaming:
+            # The body is produced after we return; only a declared length is known.
+            size = int(response['Content-Length']) if response.has_header('Content-Length') else None
+        else:
+            size = len(response.content)
+        metrics.record(stats, request.method, response.status_code, seconds, size)
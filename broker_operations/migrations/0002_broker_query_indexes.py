@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('broker_operations', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='application',
+            index=models.Index(fields=['broker', 'status'], name='app_broker_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='application',
+            index=models.Index(fields=['broker', '-created_at'], name='app_broker_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['broker', '-created_at'], name='client_broker_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reminder',
+            index=models.Index(fields=['broker', 'is_completed', 'due_date'], name='reminder_broker_done_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reminder',
+            index=models.Index(condition=models.Q(('is_completed', False)), fields=['broker', 'due_date'], name='reminder_open_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['broker', 'status', 'due_date'], name='task_broker_status_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['broker', '-created_at'], name='task_broker_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('status__in', ['pending', 'in_progress'])), fields=['broker', 'due_date'], name='task_open_due_idx'),
+        ),
+    ]
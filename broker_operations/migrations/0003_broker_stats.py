@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:06
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('broker_operations', '0002_broker_query_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BrokerStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_clients', models.IntegerField(default=0)),
+                ('active_applications', models.IntegerField(default=0)),
+                ('pending_tasks', models.IntegerField(default=0)),
+                ('open_reminders', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('broker', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'broker stats',
+            },
+        ),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:16
+
+import unicodedata
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Copies of broker_operations.search as of this migration, so later changes
+# there cannot alter what it writes.
+def normalize_text(value):
+    value = unicodedata.normalize('NFKD', value or '')
+    value = ''.join(char for char in value if not unicodedata.combining(char))
+    return ' '.join(value.lower().split())
+
+
+def normalize_phone(value):
+    return ''.join(char for char in value or '' if char.isdigit())
+
+
+def client_search_text(first_name, last_name, email):
+    return normalize_text(f'{first_name} {last_name} {email}')
+
+
+def populate_search_fields(apps, schema_editor):
+    Client = apps.get_model('broker_operations', 'Client')
+    batch = []
+    for client in Client.objects.only('id', 'first_name', 'last_name', 'email', 'phone').iterator(chunk_size=1000):
+        client.search_text = client_search_text(client.first_name, client.last_name, client.email)
+        client.phone_digits = normalize_phone(client.phone)
+        batch.append(client)
+        if len(batch) == 1000:
+            Client.objects.bulk_update(batch, ['search_text', 'phone_digits'])
+            batch = []
+    Client.objects.bulk_update(batch, ['search_text', 'phone_digits'])
+
+
+def create_text_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        schema_editor.execute(
+            'CREATE INDEX client_search_trgm_idx ON broker_operations_client '
+            'USING gin (search_text gin_trgm_ops)'
+        )
+    elif vendor == 'mysql':
+        schema_editor.execute(
+            'CREATE FULLTEXT INDEX client_search_ft_idx ON broker_operations_client (search_text)'
+        )
+
+
+def drop_text_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS client_search_trgm_idx')
+    elif vendor == 'mysql':
+        schema_editor.execute('DROP INDEX client_search_ft_idx ON broker_operations_client')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('broker_operations', '0003_broker_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='client',
+            name='phone_digits',
+            field=models.CharField(blank=True, default='', editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='client',
+            name='search_text',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['broker', 'phone_digits'], name='client_broker_phone_idx'),
+        ),
+        migrations.RunPython(populate_search_fields, migrations.RunPython.noop),
+        migrations.RunPython(create_text_index, drop_text_index),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:27
+
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('broker_operations', '0004_client_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=200)),
+                ('document_type', models.CharField(choices=[('id', 'Identification'), ('income', 'Income Proof'), ('bank', 'Bank Statement'), ('property', 'Property Documents'), ('other', 'Other')], max_length=20)),
+                ('notes', models.TextField(blank=True, null=True)),
+                ('filename', models.CharField(max_length=255)),
+                ('size', models.BigIntegerField()),
+                ('offset', models.BigIntegerField(default=0)),
+                ('sha256', models.CharField(blank=True, default='', max_length=64)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='sha256',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='size',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['client', 'sha256'], name='document_client_sha_idx'),
+        ),
+        migrations.AddField(
+            model_name='documentupload',
+            name='client',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='document_uploads', to='broker_operations.client'),
+        ),
+    ]
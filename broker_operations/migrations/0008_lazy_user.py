@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:41
+
+import django.contrib.auth.models
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('broker_operations', '0007_scheduler_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LazyUser',
+            fields=[
+            ],
+            options={
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('auth.user',),
+            managers=[
+                ('objects', django.contrib.auth.models.UserManager()),
+            ],
+        ),
+    ]
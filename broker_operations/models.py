@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
@@ -51,13 +53,32 @@ class Client(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     broker = models.ForeignKey(User, on_delete=models.CASCADE, related_name='clients')
     notes = models.TextField(blank=True, null=True)
+    # Denormalized search columns, see broker_operations.search.
+    search_text = models.TextField(blank=True, default='', editable=False)
+    phone_digits = models.CharField(max_length=20, blank=True, default='', editable=False)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['broker', '-created_at'], name='client_broker_created_idx'),
+            models.Index(fields=['broker', 'phone_digits'], name='client_broker_phone_idx'),
+        ]
 
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
 
+    def update_search_fields(self):
+        from .search import client_search_text, normalize_phone
+        self.search_text = client_search_text(self.first_name, self.last_name, self.email)
+        self.phone_digits = normalize_phone(self.phone)
+
+    def save(self, *args, **kwargs):
+        self.update_search_fields()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {'search_text', 'phone_digits'}
+        super().save(*args, **kwargs)
+
 class Document(models.Model):
     DOCUMENT_TYPES = [
         ('id', 'Identification'),
@@ -73,13 +94,39 @@ class Document(models.Model):
     document_type = models.CharField(max_length=20, choices=DOCUMENT_TYPES)
     uploaded_at = models.DateTimeField(default=timezone.now)
     notes = models.TextField(blank=True, null=True)
+    sha256 = models.CharField(max_length=64, blank=True, default='', editable=False)
+    size = models.BigIntegerField(null=True, blank=True, editable=False)
+    page_count = models.IntegerField(null=True, blank=True, editable=False)
+    processed_at = models.DateTimeField(null=True, blank=True, editable=False)
 
     class Meta:
         ordering = ['-uploaded_at']
+        indexes = [
+            models.Index(fields=['client', 'sha256'], name='document_client_sha_idx'),
+        ]
 
     def __str__(self):
         return f"{self.title} - {self.client}"
 
+class DocumentUpload(models.Model):
+    """
+    A resumable upload in progress; becomes a Document once complete.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='document_uploads')
+    title = models.CharField(max_length=200)
+    document_type = models.CharField(max_length=20, choices=Document.DOCUMENT_TYPES)
+    notes = models.TextField(blank=True, null=True)
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True, default='')
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size})"
+
 class Application(models.Model):
     STATUS_CHOICES = [
         ('draft', 'Draft'),
@@ -89,6 +136,7 @@ class Application(models.Model):
         ('rejected', 'Rejected'),
         ('completed', 'Completed'),
     ]
+    ACTIVE_STATUSES = ['submitted', 'under_review']
 
     client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='applications')
     broker = models.ForeignKey(User, on_delete=models.CASCADE, related_name='applications')
@@ -101,6 +149,10 @@ class Application(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['broker', 'status'], name='app_broker_status_idx'),
+            models.Index(fields=['broker', '-created_at'], name='app_broker_created_idx'),
+        ]
 
     def __str__(self):
         return f"Application {self.id} - {self.client}"
@@ -117,6 +169,7 @@ class Task(models.Model):
         ('in_progress', 'In Progress'),
         ('completed', 'Completed'),
     ]
+    OPEN_STATUSES = ['pending', 'in_progress']
 
     title = models.CharField(max_length=200)
     description = models.TextField()
@@ -131,6 +184,20 @@ class Task(models.Model):
 
     class Meta:
         ordering = ['due_date']
+        indexes = [
+            models.Index(fields=['broker', 'status', 'due_date'], name='task_broker_status_due_idx'),
+            models.Index(fields=['broker', '-created_at'], name='task_broker_created_idx'),
+            # Range scans of the due-date scheduler.
+            models.Index(fields=['due_date'], name='task_due_idx'),
+            models.Index(fields=['updated_at'], name='task_updated_idx'),
+            # Partial index over open tasks; skipped on backends without
+            # partial index support (MySQL), where the index above is used.
+            models.Index(
+                fields=['broker', 'due_date'],
+                name='task_open_due_idx',
+                condition=models.Q(status__in=['pending', 'in_progress']),
+            ),
+        ]
 
     def __str__(self):
         return self.title
@@ -148,6 +215,98 @@ class Reminder(models.Model):
 
     class Meta:
         ordering = ['due_date']
+        indexes = [
+            models.Index(fields=['broker', 'is_completed', 'due_date'], name='reminder_broker_done_due_idx'),
+            models.Index(fields=['due_date'], name='reminder_due_idx'),
+            models.Index(fields=['updated_at'], name='reminder_updated_idx'),
+            models.Index(
+                fields=['broker', 'due_date'],
+                name='reminder_open_due_idx',
+                condition=models.Q(is_completed=False),
+            ),
+        ]
 
     def __str__(self):
         return self.title
+
+class BrokerStats(models.Model):
+    broker = models.OneToOneField(User, on_delete=models.CASCADE, related_name='stats')
+    total_clients = models.IntegerField(default=0)
+    active_applications = models.IntegerField(default=0)
+    pending_tasks = models.IntegerField(default=0)
+    open_reminders = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'broker stats'
+
+    def __str__(self):
+        return f"Stats for {self.broker}"
+
+class Job(models.Model):
+    """
+    A unit of background work, claimed and run by the run_jobs worker.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True, default='')
+    locked_at = models.DateTimeField(null=True, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='job_status_run_at_idx'),
+            models.Index(fields=['status', 'finished_at'], name='job_status_finished_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
+class RevokedToken(models.Model):
+    """
+    A refresh token revoked before it expired, kept until it expires.
+    """
+    jti = models.CharField(max_length=255, unique=True)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['expires_at'], name='revoked_token_expires_idx'),
+        ]
+
+    def __str__(self):
+        return self.jti
+
+class LazyUser(User):
+    """
+    A user known only by id, as authenticated from an access token. Reading
+    any other field loads the whole row in one query.
+    """
+
+    class Meta:
+        proxy = True
+
+    @classmethod
+    def from_id(cls, pk, using='default'):
+        return cls.from_db(using, ['id'], [pk])
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        deferred = self.get_deferred_fields()
+        if fields and deferred.issuperset(fields):
+            fields = list(deferred)
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
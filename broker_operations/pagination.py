@@ -0,0 +1,95 @@
+import json
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, _reverse_ordering
+
+
+class BrokerCursorPagination(CursorPagination):
+    """
+    Keyset pagination for per-broker lists. Pages cost the same at any depth
+    since there is no COUNT(*) and no OFFSET.
+
+    DRF's cursor holds only the first ordering field and skips rows that
+    tie on it by offset. Here the cursor holds every ordering field, and
+    each page starts with a row-value comparison on all of them. The
+    trailing id makes positions unique, so ties never need an offset.
+    """
+    page_size = getattr(settings, 'REST_FRAMEWORK', {}).get('PAGE_SIZE', 10)
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'API_MAX_PAGE_SIZE', 100)
+    ordering = ('-created_at', '-id')
+
+    def _get_position_from_instance(self, instance, ordering):
+        if isinstance(instance, dict):
+            values = [instance[order.lstrip('-')] for order in ordering]
+        else:
+            values = [getattr(instance, order.lstrip('-')) for order in ordering]
+        return json.dumps([str(value) for value in values], separators=(',', ':'))
+
+    def _after(self, position, reverse):
+        """
+        Rows after `position` in the page direction: the first field past
+        it, or equal to it and the next field past it, and so on.
+        """
+        try:
+            values = json.loads(position)
+        except ValueError:
+            values = None
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        condition, equal = Q(), {}
+        for order, value in zip(self.ordering, values):
+            name = order.lstrip('-')
+            lookup = 'lt' if order.startswith('-') != reverse else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        offset, reverse, current_position = (0, False, None) if self.cursor is None else self.cursor
+
+        queryset = queryset.order_by(*(_reverse_ordering(self.ordering) if reverse else self.ordering))
+        if current_position is not None:
+            queryset = queryset.filter(self._after(current_position, reverse))
+
+        # Positions are unique, so the links built below always have offset
+        # 0; a hand-made cursor's offset is still honoured (and capped).
+        results = list(queryset[offset:offset + self.page_size + 1])
+        self.page = results[:self.page_size]
+        following_position = (
+            self._get_position_from_instance(results[-1], self.ordering) if len(results) > len(self.page) else None
+        )
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = current_position is not None or offset > 0
+            self.has_previous = following_position is not None
+            self.next_position = current_position
+            self.previous_position = following_position
+        else:
+            self.has_next = following_position is not None
+            self.has_previous = current_position is not None or offset > 0
+            self.next_position = following_position
+            self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+
+class UploadedCursorPagination(BrokerCursorPagination):
+    ordering = ('-uploaded_at', '-id')
+
+
+class DueDateCursorPagination(BrokerCursorPagination):
+    ordering = ('due_date', 'id')
@@ -0,0 +1,107 @@
+"""
+Password checks off the request workers.
+
+PBKDF2 at Django's default iteration count costs tens of milliseconds of
+CPU per check. ``check_user_password`` runs it in a pool of
+``LOGIN_HASH_WORKERS`` processes (per request-worker process), with at most
+``LOGIN_HASH_MAX_PENDING`` checks admitted at once; further logins get a 503
+rather than queueing behind a burst. ``LOGIN_HASH_WORKERS = 0`` hashes in
+the request thread.
+
+Unknown users cost one hash too, so response times do not reveal which
+usernames exist.
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+_lock = threading.Lock()
+_executor = None
+_slots = None
+
+
+class LoginBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many logins in progress, try again shortly.'
+    default_code = 'login_busy'
+
+
+def _init_worker():
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+
+
+def _check(password, encoded):
+    """
+    `(valid, new_encoded)`; `new_encoded` is the password hashed with the
+    preferred hasher when the stored hash is outdated.
+    """
+    from django.contrib.auth import hashers
+    if encoded is None or not hashers.is_password_usable(encoded):
+        hashers.make_password(password)
+        return False, None
+    if not hashers.check_password(password, encoded):
+        return False, None
+    preferred = hashers.get_hasher('default')
+    hasher = hashers.identify_hasher(encoded)
+    if hasher.algorithm != preferred.algorithm or preferred.must_update(encoded):
+        return True, hashers.make_password(password)
+    return True, None
+
+
+def _pool():
+    global _executor, _slots
+    with _lock:
+        if _executor is None:
+            workers = getattr(settings, 'LOGIN_HASH_WORKERS', 2)
+            _slots = threading.BoundedSemaphore(getattr(settings, 'LOGIN_HASH_MAX_PENDING', workers * 8))
+            # Not fork: request workers may be running threads.
+            context = multiprocessing.get_context(getattr(settings, 'LOGIN_HASH_START_METHOD', 'spawn'))
+            _executor = ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker)
+        return _executor, _slots
+
+
+def shutdown():
+    global _executor
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def check_encoded(password, encoded):
+    if not getattr(settings, 'LOGIN_HASH_WORKERS', 2):
+        return _check(password, encoded)
+    executor, slots = _pool()
+    if not slots.acquire(blocking=False):
+        raise LoginBusy()
+    try:
+        future = executor.submit(_check, password, encoded)
+        return future.result(timeout=getattr(settings, 'LOGIN_HASH_TIMEOUT', 10))
+    except TimeoutError:
+        raise LoginBusy()
+    except BrokenProcessPool:
+        # A worker died; start a fresh pool for the next login.
+        shutdown()
+        raise LoginBusy()
+    finally:
+        slots.release()
+
+
+def check_user_password(user, password):
+    """
+    Check `password` for `user` (None for an unknown username), upgrading an
+    outdated stored hash like ``User.check_password`` does.
+    """
+    valid, new_encoded = check_encoded(password, user.password if user is not None else None)
+    if valid and new_encoded:
+        user.password = new_encoded
+        user.save(update_fields=['password'])
+    return valid
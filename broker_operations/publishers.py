@@ -0,0 +1,268 @@
+import logging
+import threading
+import uuid
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Application, Task, Reminder
+from .serializers import ApplicationSerializer, TaskSerializer, ReminderSerializer
+
+logger = logging.getLogger(__name__)
+
+# Per model: the consumer handler that receives the event, the subscription
+# group suffix used by BrokerConsumer.handle_subscription, and the serializer
+# that defines the wire format of each row.
+PUBLISHED_MODELS = {
+    Application: ('application_update', 'applications', ApplicationSerializer),
+    Task: ('task_update', 'tasks', TaskSerializer),
+    Reminder: ('reminder_update', 'reminders', ReminderSerializer),
+}
+
+SNAPSHOT_ATTR = '_push_snapshot'
+
+REPLAY_LOG_SIZE = getattr(settings, 'BROKER_PUSH_REPLAY_LOG_SIZE', 1000)
+REPLAY_LOG_TIMEOUT = getattr(settings, 'BROKER_PUSH_REPLAY_LOG_TIMEOUT', 60 * 60)
+
+
+def group_name(broker_id, suffix):
+    return f'broker_{broker_id}_{suffix}'
+
+
+def _sequence_key(broker_id):
+    return f'broker_push_seq:{broker_id}'
+
+
+def _event_key(broker_id, seq):
+    return f'broker_push_event:{broker_id}:{seq}'
+
+
+def _listeners_key(broker_id):
+    return f'broker_push_listeners:{broker_id}'
+
+
+def _recent_listener_key(broker_id):
+    return f'broker_push_recent_listener:{broker_id}'
+
+
+def listener_connected(broker_id):
+    key = _listeners_key(broker_id)
+    cache.add(key, 0, timeout=None)
+    cache.incr(key)
+
+
+def listener_disconnected(broker_id):
+    """
+    The broker stays listening for as long as the replay log is kept, so a
+    client that reconnects can still resume from its last sequence number.
+    """
+    cache.set(_recent_listener_key(broker_id), True, REPLAY_LOG_TIMEOUT)
+    try:
+        cache.decr(_listeners_key(broker_id))
+    except ValueError:
+        pass
+
+
+def listening(broker_id):
+    """
+    Whether any consumer of the broker is connected or may resume. Changes
+    made while nobody listens are not serialized; each only takes a
+    sequence number with no event behind it (see ``skip_on_commit``).
+    """
+    found = cache.get_many([_listeners_key(broker_id), _recent_listener_key(broker_id)])
+    return found.get(_listeners_key(broker_id), 0) > 0 or _recent_listener_key(broker_id) in found
+
+
+def current_sequence(broker_id):
+    return cache.get(_sequence_key(broker_id), 0)
+
+
+def next_sequence(broker_id):
+    """
+    Allocate the next event number for a broker. Numbers are shared across
+    workers as long as the cache backend is.
+    """
+    key = _sequence_key(broker_id)
+    cache.add(key, 0, timeout=None)
+    return cache.incr(key)
+
+
+def record_event(broker_id, event):
+    """
+    Add an event to the broker's replay log. Each event has its own key, so
+    concurrent workers never overwrite each other's appends.
+    """
+    cache.set(_event_key(broker_id, event['seq']), event, REPLAY_LOG_TIMEOUT)
+
+
+def events_since(broker_id, since, event_types=None):
+    """
+    Events with a sequence number above ``since``, oldest first, optionally
+    limited to ``event_types``. Returns ``None`` when the replay log no
+    longer reaches back to ``since``, in which case the client needs a fresh
+    snapshot. Only the last ``REPLAY_LOG_SIZE`` events are replayed, and any
+    missing one (expired, evicted, or not yet recorded) also returns
+    ``None`` rather than a stream with a gap in it. So does a ``since``
+    ahead of the counter, which means the counter was lost and restarted.
+    """
+    current = current_sequence(broker_id)
+    if since > current:
+        return None
+    if since == current:
+        return []
+    if current - since > REPLAY_LOG_SIZE:
+        return None
+    keys = [_event_key(broker_id, seq) for seq in range(since + 1, current + 1)]
+    found = cache.get_many(keys)
+    if len(found) < len(keys):
+        return None
+    events = (found[key] for key in keys)
+    return [event for event in events if event_types is None or event['type'] in event_types]
+
+
+def remember(instance):
+    """
+    Keep the loaded column values of an instance so a later save can be
+    published as a diff of the fields that actually changed.
+    """
+    if instance.pk is None:
+        return
+    values = instance.__dict__
+    setattr(instance, SNAPSHOT_ATTR, {
+        field.attname: values[field.attname]
+        for field in instance._meta.concrete_fields
+        if field.attname in values
+    })
+
+
+def diff_for_save(instance, created):
+    _, _, serializer_class = PUBLISHED_MODELS[type(instance)]
+    data = serializer_class(instance).data
+    snapshot = None if created else getattr(instance, SNAPSHOT_ATTR, None)
+    remember(instance)
+    if snapshot is None:
+        return {'op': 'created' if created else 'updated', 'id': instance.pk, 'fields': dict(data)}
+    changed = {
+        field.name
+        for field in instance._meta.concrete_fields
+        if field.attname in snapshot and snapshot[field.attname] != getattr(instance, field.attname)
+    }
+    return {
+        'op': 'updated',
+        'id': instance.pk,
+        'fields': {name: data[name] for name in data if name in changed},
+    }
+
+
+def _merge(previous, diff):
+    if diff['op'] == 'deleted':
+        return diff
+    if previous['op'] == 'deleted':
+        return diff
+    return dict(previous, fields=dict(previous['fields'], **diff['fields']))
+
+
+def send_rows(broker_id, suffix, event_type, rows):
+    """
+    Send one event to a broker's subscription group now, numbered and kept
+    in the replay log like every other push.
+    """
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    group = group_name(broker_id, suffix)
+    try:
+        event = {
+            'type': event_type,
+            'seq': next_sequence(broker_id),
+            'event_id': uuid.uuid4().hex,
+            'data': rows,
+        }
+        record_event(broker_id, event)
+        async_to_sync(channel_layer.group_send)(group, event)
+    except Exception:
+        logger.exception('Failed to push %s to %s', event_type, group)
+
+
+class Publisher:
+    """
+    Buffers row diffs per channel-layer group and sends each group one batched
+    message per coalescing window (``BROKER_PUSH_COALESCE_WINDOW`` seconds).
+    Successive diffs for the same row are merged. Each message gets the
+    broker's next sequence number and is kept in the replay log.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._timer = None
+
+    def publish(self, broker_id, suffix, event_type, diffs):
+        with self._lock:
+            rows = self._pending.setdefault((broker_id, suffix, event_type), {})
+            for diff in diffs:
+                previous = rows.get(diff['id'])
+                rows[diff['id']] = diff if previous is None else _merge(previous, diff)
+            window = getattr(settings, 'BROKER_PUSH_COALESCE_WINDOW', 0.05)
+            if window and self._timer is None:
+                self._timer = threading.Timer(window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if not window:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not pending:
+            return
+        for (broker_id, suffix, event_type), rows in pending.items():
+            send_rows(broker_id, suffix, event_type, list(rows.values()))
+
+
+publisher = Publisher()
+
+
+def skip_on_commit(broker_id):
+    """
+    Number a change nobody is listening for without logging an event. The
+    gap it leaves makes ``events_since`` return ``None``, so a client that
+    resumes from before it takes a snapshot instead of missing the change.
+    """
+    transaction.on_commit(lambda: next_sequence(broker_id))
+
+
+def _publish_on_commit(broker_id, model, diffs):
+    if not listening(broker_id):
+        skip_on_commit(broker_id)
+        return
+    event_type, suffix, _ = PUBLISHED_MODELS[model]
+    transaction.on_commit(lambda: publisher.publish(broker_id, suffix, event_type, diffs))
+
+
+def publish_save(instance, created):
+    if not listening(instance.broker_id):
+        remember(instance)
+        skip_on_commit(instance.broker_id)
+        return
+    diff = diff_for_save(instance, created)
+    if diff['fields']:
+        _publish_on_commit(instance.broker_id, type(instance), [diff])
+
+
+def publish_delete(instance):
+    _publish_on_commit(instance.broker_id, type(instance), [{'op': 'deleted', 'id': instance.pk, 'fields': {}}])
+
+
+def publish_batch(model, broker_id, diffs):
+    """
+    Publish the row diffs of one batch write as a single event.
+    """
+    if diffs:
+        _publish_on_commit(broker_id, model, diffs)
@@ -0,0 +1,92 @@
+"""
+Token buckets for failed logins.
+
+Each username and each client IP has a bucket of ``capacity`` tokens that
+refills evenly over ``period`` seconds. A failed login takes a token; a
+login attempt whose username or IP bucket is empty is rejected with 429
+before any database read or password hash. Buckets live in the cache, so
+they are shared between processes when the cache is; concurrent failures
+may read the same state and overshoot a bucket by a token or two.
+
+The client IP is ``REMOTE_ADDR`` unless ``REST_FRAMEWORK['NUM_PROXIES']``
+says how many trusted proxies append to ``X-Forwarded-For``; the header is
+otherwise ignored, since a client can send any value in it.
+"""
+import hashlib
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.exceptions import Throttled
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+DEFAULT_BUCKETS = {
+    'username': (5, 5 * 60),
+    'ip': (50, 5 * 60),
+}
+
+
+class TokenBucket:
+    def __init__(self, key, capacity, period):
+        self.key = key
+        self.capacity = capacity
+        self.rate = capacity / period
+
+    def _level(self, now):
+        state = cache.get(self.key)
+        if state is None:
+            return self.capacity
+        tokens, updated = state
+        return min(self.capacity, tokens + (now - updated) * self.rate)
+
+    def wait(self, now=None):
+        """
+        Seconds until the bucket holds a whole token; 0 when it does now.
+        """
+        now = time.time() if now is None else now
+        missing = 1 - self._level(now)
+        return missing / self.rate if missing > 0 else 0
+
+    def take(self, now=None):
+        now = time.time() if now is None else now
+        tokens = max(self._level(now) - 1, 0)
+        # Kept until it would have refilled anyway.
+        timeout = math.ceil((self.capacity - tokens) / self.rate) + 1
+        cache.set(self.key, (tokens, now), timeout)
+
+
+def _digest(value):
+    return hashlib.sha256(value.encode()).hexdigest()[:32]
+
+
+def client_ip(request):
+    if api_settings.NUM_PROXIES is None:
+        return request.META.get('REMOTE_ADDR', '')
+    return BaseThrottle().get_ident(request)
+
+
+def login_buckets(request, username):
+    limits = getattr(settings, 'LOGIN_RATE_LIMITS', DEFAULT_BUCKETS)
+    idents = {
+        # Usernames differing only in case share a bucket.
+        'username': str(username or '').casefold(),
+        'ip': client_ip(request),
+    }
+    return [
+        TokenBucket(f'login_bucket:{name}:{_digest(ident)}', *limits[name])
+        for name, ident in idents.items() if name in limits
+    ]
+
+
+def check_login_allowed(buckets):
+    wait = max((bucket.wait() for bucket in buckets), default=0)
+    if wait:
+        raise Throttled(wait=math.ceil(wait))
+
+
+def record_login_failure(buckets):
+    now = time.time()
+    for bucket in buckets:
+        bucket.take(now)
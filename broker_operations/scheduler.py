@@ -0,0 +1,220 @@
+"""
+Due-date scheduler for reminders and tasks.
+
+Open items due before a moving horizon (``SCHEDULER_WINDOW`` seconds ahead)
+are kept in a min-heap, loaded with keyset range queries on the
+``due_date`` index, at most ``SCHEDULER_MAX_LOADED`` at a time. Inserts and
+edits are picked up by polling the ``updated_at`` index. Deletions are not
+seen directly; every item is re-read before it fires. When an item comes
+due, its broker's subscription group gets a ``reminder_update`` or
+``task_update`` event with ``op: 'due'`` and the serialized row.
+
+Everything due up to the last run is considered fired: an item edited to
+a due time that has already passed does not fire. That time is kept in the
+cache, so a restarted scheduler fires what came due while it was down (no
+further back than ``SCHEDULER_CATCH_UP`` seconds).
+"""
+import asyncio
+import heapq
+import logging
+import sys
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.utils import timezone
+
+from . import publishers
+from .models import Reminder, Task
+
+logger = logging.getLogger(__name__)
+
+FIRED_UNTIL_KEY = 'due_scheduler:fired_until'
+
+# Per kind: the model, the filter for open rows and a test for a loaded row.
+KINDS = {
+    'reminder': (Reminder, {'is_completed': False}, lambda row: not row['is_completed']),
+    'task': (Task, {'status__in': Task.OPEN_STATUSES}, lambda row: row['status'] in Task.OPEN_STATUSES),
+}
+STATE_FIELDS = ['pk', 'broker_id', 'due_date', 'is_completed', 'status']
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class DueScheduler:
+    def __init__(self):
+        self.window = timedelta(seconds=_setting('SCHEDULER_WINDOW', 15 * 60))
+        self.poll_interval = _setting('SCHEDULER_POLL_INTERVAL', 1.0)
+        self.batch_size = _setting('SCHEDULER_LOAD_BATCH', 1000)
+        self.max_loaded = _setting('SCHEDULER_MAX_LOADED', 100000)
+        self.heap = []
+        # (kind, pk) -> due_date of the live heap entry; older entries for
+        # the same key are skipped when popped.
+        self.entries = {}
+        # Keyset position up to which each kind has been loaded.
+        self.loaded_until = {}
+        self.last_poll = None
+        self.fired_until = None
+        self.stopping = False
+        self.fired = 0
+
+    def _fields(self, model):
+        return [name for name in STATE_FIELDS if name in {'pk', 'broker_id'} or hasattr(model, name)]
+
+    def _add(self, kind, pk, due_date):
+        if self.entries.get((kind, pk)) == due_date:
+            return
+        self.entries[(kind, pk)] = due_date
+        heapq.heappush(self.heap, (due_date, kind, pk))
+
+    def compact(self):
+        """
+        Rebuild the heap from the live entries once stale ones, left behind
+        by edited or closed items, make up more than half of it.
+        """
+        if len(self.heap) > 2 * len(self.entries) + 64:
+            self.heap = [(due_date, kind, pk) for (kind, pk), due_date in self.entries.items()]
+            heapq.heapify(self.heap)
+
+    def _track(self, kind, row):
+        """
+        Apply the current state of one row: schedule it when open and
+        inside the loaded range, forget it otherwise.
+        """
+        _, _, is_open = KINDS[kind]
+        cursor = self.loaded_until[kind]
+        if is_open(row) and self.fired_until < row['due_date'] and (row['due_date'], row['pk']) <= cursor:
+            self._add(kind, row['pk'], row['due_date'])
+        else:
+            self.entries.pop((kind, row['pk']), None)
+
+    def start(self, now):
+        """
+        Position every kind just after the last fired due time.
+        """
+        fired_until = cache.get(FIRED_UNTIL_KEY)
+        earliest = now - timedelta(seconds=_setting('SCHEDULER_CATCH_UP', 24 * 60 * 60))
+        self.fired_until = max(fired_until, earliest) if fired_until else now
+        for kind in KINDS:
+            self.loaded_until[kind] = (self.fired_until, sys.maxsize)
+        self.last_poll = now
+        self.load(now)
+
+    def load(self, now):
+        """
+        Extend each kind's loaded range towards `now + window` in keyset
+        batches, stopping early when the heap is full.
+        """
+        horizon = now + self.window
+        for kind, (model, open_filter, _) in KINDS.items():
+            due_date, pk = self.loaded_until[kind]
+            while len(self.entries) < self.max_loaded:
+                rows = list(
+                    model.objects.filter(**open_filter)
+                    .filter(due_date__lte=horizon)
+                    .filter(due_date__gte=due_date)
+                    .exclude(due_date=due_date, pk__lte=pk)
+                    .order_by('due_date', 'pk')
+                    .values(*self._fields(model))[:min(self.batch_size, self.max_loaded - len(self.entries))]
+                )
+                for row in rows:
+                    self._add(kind, row['pk'], row['due_date'])
+                if rows:
+                    due_date, pk = rows[-1]['due_date'], rows[-1]['pk']
+                if len(rows) < self.batch_size:
+                    if len(self.entries) < self.max_loaded:
+                        due_date, pk = max((due_date, pk), (horizon, sys.maxsize))
+                    break
+            self.loaded_until[kind] = (due_date, pk)
+
+    def poll(self, now):
+        """
+        Re-read rows changed since the previous poll. The overlap covers
+        transactions that committed after a later one was already seen.
+        """
+        since = self.last_poll - timedelta(seconds=_setting('SCHEDULER_POLL_OVERLAP', 5))
+        self.last_poll = now
+        for kind, (model, _, _) in KINDS.items():
+            changed = model.objects.filter(updated_at__gte=since).order_by().values(*self._fields(model))
+            for row in changed.iterator():
+                self._track(kind, row)
+
+    def pop_due(self, now):
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            due_date, kind, pk = heapq.heappop(self.heap)
+            if self.entries.get((kind, pk)) == due_date:
+                del self.entries[(kind, pk)]
+                due.append((kind, pk, due_date))
+        return due
+
+    def fire(self, due):
+        """
+        Re-read the popped items and push the ones still open and due at
+        the same time, one event per broker and kind. Every kind is read
+        before anything is sent, so a failed read sends nothing.
+        """
+        events = []
+        for kind, (model, open_filter, _) in KINDS.items():
+            expected = {pk: due_date for item_kind, pk, due_date in due if item_kind == kind}
+            if not expected:
+                continue
+            event_type, suffix, serializer_class = publishers.PUBLISHED_MODELS[model]
+            current = model.objects.filter(pk__in=list(expected), **open_filter)
+            by_broker = {}
+            for instance in current:
+                if instance.due_date == expected[instance.pk]:
+                    by_broker.setdefault(instance.broker_id, []).append(instance)
+            for broker_id, instances in by_broker.items():
+                rows = [
+                    {'op': 'due', 'id': row['id'], 'fields': dict(row)}
+                    for row in serializer_class(instances, many=True).data
+                ]
+                events.append((broker_id, suffix, event_type, rows))
+        for broker_id, suffix, event_type, rows in events:
+            publishers.send_rows(broker_id, suffix, event_type, rows)
+            self.fired += len(rows)
+
+    def next_wake(self, now):
+        wake = self.last_poll + timedelta(seconds=self.poll_interval)
+        if self.heap:
+            wake = min(wake, self.heap[0][0])
+        return max((wake - now).total_seconds(), 0)
+
+    def step(self, now):
+        self.poll(now)
+        if any(cursor[0] < now + self.window / 2 for cursor in self.loaded_until.values()):
+            self.load(now)
+        due = self.pop_due(now)
+        if due:
+            try:
+                self.fire(due)
+            except Exception:
+                # Put them back for the next step; nothing was sent.
+                for kind, pk, due_date in due:
+                    self._add(kind, pk, due_date)
+                raise
+        self.fired_until = max(self.fired_until, now)
+        self.compact()
+        cache.set(FIRED_UNTIL_KEY, self.fired_until, None)
+
+    def _run_sync(self, method, *args):
+        close_old_connections()
+        try:
+            return method(*args)
+        finally:
+            close_old_connections()
+
+    async def run(self):
+        await sync_to_async(self._run_sync)(self.start, timezone.now())
+        logger.info('Scheduler started with %s items loaded', len(self.entries))
+        while not self.stopping:
+            try:
+                await sync_to_async(self._run_sync)(self.step, timezone.now())
+            except Exception:
+                logger.exception('Scheduler step failed')
+            await asyncio.sleep(min(self.next_wake(timezone.now()), self.poll_interval))
@@ -0,0 +1,108 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date, parse_http_date_safe, parse_etags
+
+from .fast_read import FastJSONRenderer
+
+CACHE_TIMEOUT = getattr(settings, 'INTERVIEW_SCRIPT_CACHE_TIMEOUT', 60 * 60)
+GENERATION_KEY = 'interview_scripts:generation'
+
+
+def _digest(*parts):
+    return hashlib.sha256(':'.join(str(part) for part in parts).encode()).hexdigest()[:32]
+
+
+def generation():
+    """
+    Current cache generation. Every script or section write bumps it, which
+    orphans all list entries and retrieve pointers at once. A lost counter
+    restarts from the clock rather than 1, so it never returns to a
+    generation whose entries may still be cached.
+    """
+    value = cache.get(GENERATION_KEY)
+    if value is None:
+        cache.add(GENERATION_KEY, time.time_ns(), timeout=None)
+        value = cache.get(GENERATION_KEY)
+    return value
+
+
+def invalidate():
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.add(GENERATION_KEY, time.time_ns(), timeout=None)
+
+
+def request_variant(request):
+    """
+    Identify the representation a request asks for: query parameters select
+    fields and pages, and the host appears in pagination links.
+    """
+    params = sorted((key, tuple(values)) for key, values in request.query_params.lists())
+    return _digest(request.get_host(), request.path, params)
+
+
+def list_key(request):
+    return f'interview_scripts:list:{generation()}:{request_variant(request)}'
+
+
+def pointer_key(request, pk):
+    return f'interview_script:{pk}:{generation()}:{request_variant(request)}'
+
+
+def body_key(request, pk, version, updated_at):
+    """
+    Serialized bytes of one script. The key pins the script's version and
+    updated_at, so the entry never goes stale and needs no invalidation.
+    """
+    return f'interview_script:{pk}:{_digest(version, updated_at.timestamp(), request_variant(request))}'
+
+
+def render(data):
+    return FastJSONRenderer().render(data)
+
+
+def make_entry(body, last_modified=None):
+    """
+    Validators for a rendered body. The ETag hashes the bytes themselves,
+    so it only matches a client's copy when the content is the same.
+    """
+    return {
+        'etag': f'"{hashlib.sha256(body).hexdigest()[:32]}"',
+        'last_modified': int(last_modified.timestamp()) if last_modified else None,
+    }
+
+
+def not_modified(request, entry):
+    """
+    Evaluate If-None-Match (or, failing that, If-Modified-Since) against a
+    cached entry.
+    """
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        return '*' in etags or entry['etag'] in etags
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return (
+        if_modified_since is not None
+        and entry['last_modified'] is not None
+        and entry['last_modified'] <= if_modified_since
+    )
+
+
+def _set_validators(response, entry):
+    response['ETag'] = entry['etag']
+    if entry['last_modified'] is not None:
+        response['Last-Modified'] = http_date(entry['last_modified'])
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def respond(request, entry, body):
+    if not_modified(request, entry):
+        return _set_validators(HttpResponseNotModified(), entry)
+    return _set_validators(HttpResponse(body, content_type='application/json'), entry)
@@ -0,0 +1,310 @@
+"""
+Client search.
+
+Each client carries two denormalized columns maintained on save:
+``search_text`` (accent-folded, lowercased names and email) and
+``phone_digits`` (the phone number reduced to digits). Queries are
+normalized the same way and every query word must match. Matching and
+ranking use the best facility of the database in use:
+
+* PostgreSQL: ``pg_trgm`` GIN index, ranked by trigram similarity.
+* MySQL: FULLTEXT index in boolean mode with prefix terms, ranked by
+  relevance.
+* Anything else (SQLite): substring filters on the normalized columns,
+  with the matches ranked in Python. ``CLIENT_SEARCH_BACKEND = 'ngram'``
+  selects an in-process trigram index per broker instead.
+
+Results are only ranked when the caller asks for the best ``limit``
+matches; without a limit every match is returned for the caller to order.
+"""
+import heapq
+import re
+import threading
+import unicodedata
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, Count, IntegerField, Max, Q, When
+from django.db.models.expressions import RawSQL
+from rest_framework import filters
+
+MIN_PHONE_DIGITS = 3
+WORD_RE = re.compile(r'\w+')
+
+
+def normalize_text(value):
+    value = unicodedata.normalize('NFKD', value or '')
+    value = ''.join(char for char in value if not unicodedata.combining(char))
+    return ' '.join(value.lower().split())
+
+
+def normalize_phone(value):
+    return ''.join(char for char in value or '' if char.isdigit())
+
+
+def client_search_text(first_name, last_name, email):
+    return normalize_text(f'{first_name} {last_name} {email}')
+
+
+def parse_query(query):
+    """
+    Split a raw query into normalized words and, when it contains enough
+    digits to be a phone fragment, its digits.
+    """
+    terms = normalize_text(query).split()
+    digits = normalize_phone(query)
+    return terms, digits if len(digits) >= MIN_PHONE_DIGITS else ''
+
+
+def score(text, phone_digits, terms, digits, words=None):
+    """
+    Rank a match: whole-word hits beat word-prefix hits, which beat
+    substring hits; a phone prefix beats a phone substring.
+    """
+    if words is None:
+        words = WORD_RE.findall(text)
+    total = 0
+    for term in terms:
+        if term in words:
+            total += 3
+        elif any(word.startswith(term) for word in words):
+            total += 2
+        elif term in text:
+            total += 1
+    if digits:
+        if phone_digits.startswith(digits):
+            total += 3
+        elif digits in phone_digits:
+            total += 1
+    return total
+
+
+def _text_and_phone_filter(terms, digits):
+    text = Q()
+    for term in terms:
+        text &= Q(search_text__contains=term)
+    condition = text if terms else Q(pk__in=[])
+    if digits:
+        condition |= Q(phone_digits__contains=digits)
+    return condition
+
+
+def rank(ids, rows, terms, digits, limit=None):
+    """
+    Order matching ids best first (ties by newest id). `rows` maps an id to
+    `(text, phone_digits, words)`. With a limit only the top entries are
+    selected instead of sorting every match.
+    """
+    def key(pk):
+        text, phone_digits, words = rows[pk]
+        return (-score(text, phone_digits, terms, digits, words), -pk)
+    if limit is not None:
+        return heapq.nsmallest(limit, ids, key=key)
+    return sorted(ids, key=key)
+
+
+def _order_by_ids(queryset, ids):
+    if not ids:
+        return queryset.none()
+    ranking = Case(*[When(pk=pk, then=position) for position, pk in enumerate(ids)], output_field=IntegerField())
+    return queryset.filter(pk__in=ids).order_by(ranking)
+
+
+class TrigramSearchBackend:
+    """
+    PostgreSQL: LIKE '%term%' is served by the pg_trgm GIN index on
+    search_text; results are ranked by similarity to the whole query.
+    """
+
+    def search(self, queryset, query, broker_id=None, limit=None):
+        from django.contrib.postgres.search import TrigramSimilarity
+
+        terms, digits = parse_query(query)
+        queryset = queryset.filter(_text_and_phone_filter(terms, digits))
+        if limit is None:
+            return queryset
+        return (
+            queryset.annotate(rank=TrigramSimilarity('search_text', ' '.join(terms)))
+            .order_by('-rank', '-id')[:limit]
+        )
+
+
+class FulltextSearchBackend:
+    """
+    MySQL: FULLTEXT in boolean mode with every word as a required prefix
+    term. Words shorter than InnoDB's minimum token size fall back to LIKE.
+    """
+    min_token_size = 3
+
+    def search(self, queryset, query, broker_id=None, limit=None):
+        terms, digits = parse_query(query)
+        words = [word for term in terms for word in WORD_RE.findall(term)]
+        long_words = [word for word in words if len(word) >= self.min_token_size]
+        short_words = [word for word in words if len(word) < self.min_token_size]
+
+        table = queryset.model._meta.db_table
+        text = Q()
+        for word in short_words:
+            text &= Q(search_text__contains=word)
+        if long_words:
+            match = ' '.join(f'+{word}*' for word in long_words)
+            queryset = queryset.annotate(rank=RawSQL(
+                f'MATCH({table}.search_text) AGAINST (%s IN BOOLEAN MODE)', [match]
+            ))
+            text &= Q(rank__gt=0)
+        else:
+            queryset = queryset.annotate(rank=RawSQL('0', []))
+        condition = text if words else Q(pk__in=[])
+        if digits:
+            condition |= Q(phone_digits__contains=digits)
+        queryset = queryset.filter(condition)
+        if limit is None:
+            return queryset
+        return queryset.order_by('-rank', '-id')[:limit]
+
+
+class ContainsSearchBackend:
+    """
+    Any other database: substring filters on search_text and phone_digits.
+    Ranking reads the matching rows' search columns and scores them in
+    Python.
+    """
+
+    def search(self, queryset, query, broker_id=None, limit=None):
+        terms, digits = parse_query(query)
+        queryset = queryset.filter(_text_and_phone_filter(terms, digits))
+        if limit is None:
+            return queryset
+        rows = {
+            pk: (text, phone_digits, tuple(WORD_RE.findall(text)))
+            for pk, text, phone_digits in queryset.values_list('pk', 'search_text', 'phone_digits')
+        }
+        return _order_by_ids(queryset, rank(rows, rows, terms, digits, limit))
+
+
+class NgramIndex:
+    """
+    Trigram postings for one broker's clients, used where the database has
+    no usable text index.
+    """
+
+    def __init__(self, rows):
+        self.rows = {}
+        self.postings = {}
+        for pk, text, phone_digits in rows:
+            self.rows[pk] = (text, phone_digits, tuple(WORD_RE.findall(text)))
+            for gram in self.grams(text):
+                self.postings.setdefault(gram, set()).add(pk)
+            for gram in self.grams(phone_digits, prefix='#'):
+                self.postings.setdefault(gram, set()).add(pk)
+
+    @staticmethod
+    def grams(value, prefix=''):
+        return {prefix + value[i:i + 3] for i in range(len(value) - 2)}
+
+    def _candidates(self, value, prefix=''):
+        if len(value) < 3:
+            return set(self.rows)
+        postings = [self.postings.get(gram, set()) for gram in self.grams(value, prefix)]
+        return set.intersection(*postings) if postings else set()
+
+    def search(self, terms, digits, limit=None):
+        matches = set()
+        if terms:
+            candidates = None
+            for term in terms:
+                found = self._candidates(term)
+                candidates = found if candidates is None else candidates & found
+            matches |= {pk for pk in candidates if all(term in self.rows[pk][0] for term in terms)}
+        if digits:
+            matches |= {pk for pk in self._candidates(digits, '#') if digits in self.rows[pk][1]}
+        return rank(matches, self.rows, terms, digits, limit)
+
+
+class NgramSearchBackend:
+    """
+    In-process trigram index per broker, built lazily and used for ranked
+    searches. Each one checks the broker's client count and latest
+    updated_at, so an index built by another worker's stale view is rebuilt
+    rather than trusted. Writes drop the broker's index, so this only pays
+    off for brokers searched far more often than their clients change.
+    """
+
+    def __init__(self):
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def invalidate(self, broker_id):
+        with self._lock:
+            self._indexes.pop(broker_id, None)
+
+    def get_index(self, broker_id):
+        from .models import Client
+
+        queryset = Client.objects.filter(broker_id=broker_id).order_by()
+        version = queryset.aggregate(count=Count('pk'), latest=Max('updated_at'))
+        version = (version['count'], version['latest'])
+        with self._lock:
+            cached = self._indexes.get(broker_id)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        rows = queryset.values_list('pk', 'search_text', 'phone_digits').iterator()
+        index = NgramIndex(rows)
+        with self._lock:
+            self._indexes[broker_id] = (version, index)
+        return index
+
+    def search(self, queryset, query, broker_id=None, limit=None):
+        terms, digits = parse_query(query)
+        if broker_id is None or limit is None:
+            return queryset.filter(_text_and_phone_filter(terms, digits))
+        ids = self.get_index(broker_id).search(terms, digits, limit)
+        return _order_by_ids(queryset, ids)
+
+
+BACKENDS = {
+    'trigram': TrigramSearchBackend,
+    'fulltext': FulltextSearchBackend,
+    'contains': ContainsSearchBackend,
+    'ngram': NgramSearchBackend,
+}
+VENDOR_BACKENDS = {
+    'postgresql': 'trigram',
+    'mysql': 'fulltext',
+}
+_backends = {}
+
+
+def get_backend():
+    name = getattr(settings, 'CLIENT_SEARCH_BACKEND', None) or VENDOR_BACKENDS.get(connection.vendor, 'contains')
+    if name not in _backends:
+        _backends[name] = BACKENDS[name]()
+    return _backends[name]
+
+
+def search_clients(queryset, query, broker_id=None, limit=None):
+    """
+    Filter `queryset` (a broker's clients) to those matching `query`. With a
+    `limit`, only the best `limit` matches, best first.
+    """
+    return get_backend().search(queryset, query, broker_id, limit)
+
+
+def invalidate_broker(broker_id):
+    for backend in _backends.values():
+        if hasattr(backend, 'invalidate'):
+            backend.invalidate(broker_id)
+
+
+class ClientSearchFilter(filters.SearchFilter):
+    """
+    `?search=` for ClientViewSet, backed by the client search columns
+    instead of OR-ed icontains lookups. Matches are left unranked, since
+    the paginator orders them.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '')
+        if not query.strip():
+            return queryset
+        return search_clients(queryset, query, request.user.id)
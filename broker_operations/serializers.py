@@ -1,18 +1,88 @@
+import os
+
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import InterviewScript, ScriptSection, Client, Document, Application, Task, Reminder
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from .blacklist import RevocableRefreshToken
+from .bulk import bulk_insert
+from .documents import max_file_size
+from .models import InterviewScript, ScriptSection, Client, Document, DocumentUpload, Application, Task, Reminder
+from . import metrics
+
+class TimedListSerializer(serializers.ListSerializer):
+    """
+    The `list_serializer_class` of TimedModelSerializer subclasses.
+    """
+    @property
+    def data(self):
+        with metrics.serializing():
+            return super().data
+
+class TimedModelSerializer(serializers.ModelSerializer):
+    """
+    A ModelSerializer whose `data` counts towards the request's serializer
+    time (see `metrics`). Subclasses set `list_serializer_class` in their
+    Meta so lists are timed too; nested serializers run inside the outer
+    one and are not counted twice.
+    """
+    @property
+    def data(self):
+        with metrics.serializing():
+            return super().data
+
+class DynamicFieldsModelSerializer(TimedModelSerializer):
+    """
+    A ModelSerializer that takes an additional `fields` argument that
+    controls which fields should be displayed.
+    """
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
+class BrokerOwnedField(serializers.PrimaryKeyRelatedField):
+    """
+    Primary key of a row owned by the requesting broker. Batch writes put the
+    referenced rows in the `related_rows` context up front, so they are not
+    fetched once per item.
+    """
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        request = self.context.get('request')
+        if request is not None:
+            queryset = queryset.filter(broker=request.user)
+        return queryset
 
-class UserSerializer(serializers.ModelSerializer):
+    def to_internal_value(self, data):
+        model = self.queryset.model
+        rows = self.context.get('related_rows', {}).get(model)
+        if rows is None or isinstance(data, bool):
+            return super().to_internal_value(data)
+        try:
+            pk = model._meta.pk.to_python(data)
+        except DjangoValidationError:
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if pk not in rows:
+            self.fail('does_not_exist', pk_value=data)
+        return rows[pk]
+
+class UserSerializer(TimedModelSerializer):
     class Meta:
         model = User
+        list_serializer_class = TimedListSerializer
         fields = ['id', 'username', 'email', 'first_name', 'last_name']
         read_only_fields = ['id']
 
-class UserCreateSerializer(serializers.ModelSerializer):
+class UserCreateSerializer(TimedModelSerializer):
     password = serializers.CharField(write_only=True)
 
     class Meta:
         model = User
+        list_serializer_class = TimedListSerializer
         fields = ['username', 'email', 'password', 'first_name', 'last_name']
 
     def create(self, validated_data):
@@ -25,53 +95,101 @@ class UserCreateSerializer(serializers.ModelSerializer):
         )
         return user
 
-class ClientSerializer(serializers.ModelSerializer):
+class ClientSerializer(TimedModelSerializer):
     class Meta:
         model = Client
+        list_serializer_class = TimedListSerializer
         fields = ['id', 'first_name', 'last_name', 'email', 'phone', 'address', 
                  'created_at', 'updated_at', 'notes']
         read_only_fields = ['id', 'created_at', 'updated_at']
 
-class DocumentSerializer(serializers.ModelSerializer):
+class ClientImportSerializer(ClientSerializer):
+    """
+    Row validation for bulk imports. Email uniqueness is left to the upsert
+    instead of a query per row.
+    """
+    class Meta(ClientSerializer.Meta):
+        extra_kwargs = {'email': {'validators': []}}
+
+class DocumentSerializer(TimedModelSerializer):
+    client = BrokerOwnedField(queryset=Client.objects.all())
+
     class Meta:
         model = Document
+        list_serializer_class = TimedListSerializer
         fields = ['id', 'client', 'title', 'file', 'document_type', 
-                 'uploaded_at', 'notes']
-        read_only_fields = ['id', 'uploaded_at']
+                 'uploaded_at', 'notes', 'sha256', 'size']
+        read_only_fields = ['id', 'uploaded_at', 'sha256', 'size']
+
+class DocumentUploadSerializer(TimedModelSerializer):
+    client = BrokerOwnedField(queryset=Client.objects.all())
+    sha256 = serializers.RegexField(r'^[0-9a-fA-F]{64}$', required=False, allow_blank=True)
 
-class ApplicationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DocumentUpload
+        list_serializer_class = TimedListSerializer
+        fields = ['id', 'client', 'title', 'document_type', 'notes', 'filename',
+                 'size', 'offset', 'sha256', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'offset', 'created_at', 'updated_at']
+
+    def validate_filename(self, value):
+        value = os.path.basename(value.replace('\\', '/'))
+        if not value:
+            raise serializers.ValidationError('A file name is required.')
+        return value
+
+    def validate_size(self, value):
+        if value < 0 or value > max_file_size():
+            raise serializers.ValidationError(f'Size must be between 0 and {max_file_size()} bytes.')
+        return value
+
+    def validate_sha256(self, value):
+        return value.lower()
+
+class ApplicationSerializer(TimedModelSerializer):
     class Meta:
         model = Application
+        list_serializer_class = TimedListSerializer
         fields = ['id', 'client', 'broker', 'status', 'created_at', 
                  'updated_at', 'loan_amount', 'property_value', 'notes']
         read_only_fields = ['id', 'created_at', 'updated_at']
 
-class TaskSerializer(serializers.ModelSerializer):
+class TaskSerializer(TimedModelSerializer):
+    client = BrokerOwnedField(queryset=Client.objects.all(), required=False, allow_null=True)
+    application = BrokerOwnedField(queryset=Application.objects.all(), required=False, allow_null=True)
+
     class Meta:
         model = Task
+        list_serializer_class = TimedListSerializer
         fields = ['id', 'title', 'description', 'broker', 'client', 
                  'application', 'due_date', 'priority', 'status', 
                  'created_at', 'updated_at']
-        read_only_fields = ['id', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'broker', 'created_at', 'updated_at']
+
+class ReminderSerializer(TimedModelSerializer):
+    client = BrokerOwnedField(queryset=Client.objects.all(), required=False, allow_null=True)
+    application = BrokerOwnedField(queryset=Application.objects.all(), required=False, allow_null=True)
 
-class ReminderSerializer(serializers.ModelSerializer):
     class Meta:
         model = Reminder
+        list_serializer_class = TimedListSerializer
         fields = ['id', 'title', 'description', 'broker', 'client', 
                  'application', 'due_date', 'is_completed', 
                  'created_at', 'updated_at']
-        read_only_fields = ['id', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'broker', 'created_at', 'updated_at']
 
-class ScriptSectionSerializer(serializers.ModelSerializer):
+class ScriptSectionSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = ScriptSection
+        list_serializer_class = TimedListSerializer
         fields = ['id', 'title', 'duration_seconds', 'content', 'order', 'key_notes']
 
-class InterviewScriptSerializer(serializers.ModelSerializer):
+class InterviewScriptSerializer(DynamicFieldsModelSerializer):
     sections = ScriptSectionSerializer(many=True, read_only=True)
     
     class Meta:
         model = InterviewScript
+        list_serializer_class = TimedListSerializer
         fields = [
             'id', 'title', 'description', 'script_type', 'version',
             'is_active', 'created_at', 'updated_at', 'total_duration',
@@ -79,22 +197,133 @@ class InterviewScriptSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['created_at', 'updated_at']
 
-class InterviewScriptCreateSerializer(serializers.ModelSerializer):
-    sections = ScriptSectionSerializer(many=True)
+    def __init__(self, *args, **kwargs):
+        section_fields = kwargs.pop('section_fields', None)
+        super().__init__(*args, **kwargs)
+        if section_fields is not None and 'sections' in self.fields:
+            self.fields['sections'] = ScriptSectionSerializer(
+                many=True, read_only=True, fields=section_fields
+            )
+
+class ScriptSectionWriteSerializer(ScriptSectionSerializer):
+    id = serializers.IntegerField(required=False)
+
+class InterviewScriptCreateSerializer(TimedModelSerializer):
+    """
+    Writes a script and its sections in one transaction, using bulk inserts
+    for the sections and the M2M through table. `total_duration` is derived
+    from the section durations.
+    """
+    sections = ScriptSectionWriteSerializer(many=True)
 
     class Meta:
         model = InterviewScript
+        list_serializer_class = TimedListSerializer
         fields = [
             'title', 'description', 'script_type', 'version',
             'is_active', 'total_duration', 'general_notes', 'sections'
         ]
+        read_only_fields = ['total_duration']
+
+    SECTION_FIELDS = ['title', 'duration_seconds', 'content', 'order', 'key_notes']
+
+    def to_representation(self, instance):
+        return InterviewScriptSerializer(instance, context=self.context).data
+
+    def validate_sections(self, sections):
+        """
+        A PATCH validates the section items partially too. Items naming one
+        of the script's sections keep its stored values for fields left
+        out; new items must still give every required field.
+        """
+        if not self.partial:
+            return sections
+        ids = [data['id'] for data in sections if 'id' in data]
+        existing = {section.pk: section for section in self.instance.sections.filter(pk__in=ids)} if ids else {}
+        child = self.fields['sections'].child
+        required = [name for name, field in child.fields.items() if field.required and not field.read_only]
+        errors = []
+        for data in sections:
+            section = existing.get(data.get('id'))
+            if section is not None:
+                for name in self.SECTION_FIELDS:
+                    data.setdefault(name, getattr(section, name))
+                errors.append({})
+                continue
+            errors.append({
+                name: [child.fields[name].error_messages['required']] for name in required if name not in data
+            })
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return sections
+
+    def _create_sections(self, sections_data):
+        # The through rows need the section keys.
+        return bulk_insert(ScriptSection, [ScriptSection(**section_data) for section_data in sections_data])
+
+    def _link_sections(self, script, sections):
+        through = InterviewScript.sections.through
+        through.objects.bulk_create([
+            through(interviewscript_id=script.pk, scriptsection_id=section.pk)
+            for section in sections
+        ])
 
     def create(self, validated_data):
         sections_data = validated_data.pop('sections')
-        script = InterviewScript.objects.create(**validated_data)
-        
         for section_data in sections_data:
-            section = ScriptSection.objects.create(**section_data)
-            script.sections.add(section)
-        
-        return script 
\ No newline at end of file
+            section_data.pop('id', None)
+        validated_data['total_duration'] = sum(data['duration_seconds'] for data in sections_data)
+
+        with transaction.atomic():
+            script = InterviewScript.objects.create(**validated_data)
+            self._link_sections(script, self._create_sections(sections_data))
+        return script
+
+    def update(self, instance, validated_data):
+        """
+        Re-version a script. Sections carrying an `id` already attached to the
+        script are updated in place, or copied when other scripts link them
+        too, so those scripts are unchanged. New ones are created, and
+        sections left out of the payload are detached (and deleted when no
+        other script uses them).
+        """
+        sections_data = validated_data.pop('sections', None)
+        with transaction.atomic():
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+            if sections_data is not None:
+                instance.total_duration = sum(data['duration_seconds'] for data in sections_data)
+                self._replace_sections(instance, sections_data)
+            instance.save()
+        return instance
+
+    def _replace_sections(self, script, sections_data):
+        through = InterviewScript.sections.through
+        existing = {section.pk: section for section in script.sections.all()}
+        shared = set(
+            through.objects.filter(scriptsection_id__in=existing)
+            .exclude(interviewscript_id=script.pk)
+            .values_list('scriptsection_id', flat=True)
+        )
+        to_update, to_create = [], []
+        for section_data in sections_data:
+            section = existing.get(section_data.pop('id', None))
+            if section is None or section.pk in shared:
+                # Copy on write: other scripts keep the shared section.
+                to_create.append(section_data)
+                continue
+            for attr, value in section_data.items():
+                setattr(section, attr, value)
+            to_update.append(section)
+
+        ScriptSection.objects.bulk_update(to_update, self.SECTION_FIELDS)
+        removed = set(existing) - {section.pk for section in to_update}
+        if removed:
+            through.objects.filter(interviewscript_id=script.pk, scriptsection_id__in=removed).delete()
+            ScriptSection.objects.filter(pk__in=removed, scripts__isnull=True).delete()
+        if to_create:
+            self._link_sections(script, self._create_sections(to_create))
+
+
+class RevocableTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = RevocableRefreshToken
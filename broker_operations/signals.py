@@ -0,0 +1,98 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_init, pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from . import authentication, publishers, search, stats, typeahead
+from .dashboard import invalidate_summary
+from .models import Client, Application, Task, Reminder, LazyUser
+
+_suppressed = ContextVar('broker_signals_suppressed', default=False)
+
+
+@contextmanager
+def suppressed():
+    """
+    Skip the per-row bookkeeping below, for batch writes that update the
+    stats, caches and push events once for the whole batch.
+    """
+    token = _suppressed.set(True)
+    try:
+        yield
+    finally:
+        _suppressed.reset(token)
+
+
+@receiver(post_init, sender=Client)
+@receiver(post_init, sender=Application)
+@receiver(post_init, sender=Task)
+@receiver(post_init, sender=Reminder)
+def remember_loaded_state(sender, instance, **kwargs):
+    stats.remember_state(instance)
+    if sender in publishers.PUBLISHED_MODELS:
+        publishers.remember(instance)
+
+
+@receiver(pre_save, sender=Client)
+@receiver(pre_save, sender=Application)
+@receiver(pre_save, sender=Task)
+@receiver(pre_save, sender=Reminder)
+def load_broker_stats_state(sender, instance, raw=False, **kwargs):
+    if not raw and not _suppressed.get():
+        stats.load_state(instance)
+
+
+@receiver(post_save, sender=Client)
+@receiver(post_save, sender=Application)
+@receiver(post_save, sender=Task)
+@receiver(post_save, sender=Reminder)
+def broker_row_saved(sender, instance, created, raw=False, **kwargs):
+    if raw or _suppressed.get():
+        return
+    previous_state = getattr(instance, stats.STATE_ATTR, None)
+    stats.record_save(instance, created)
+    invalidate_summary(instance.broker_id)
+    if sender in publishers.PUBLISHED_MODELS:
+        publishers.publish_save(instance, created)
+    if sender is Client:
+        search.invalidate_broker(instance.broker_id)
+        if typeahead.enabled():
+            previous_broker_id = previous_state[0] if previous_state and not created else None
+            row = (instance.pk, instance.broker_id, instance.search_text, instance.phone_digits)
+            transaction.on_commit(lambda: typeahead.registry.client_saved(*row, previous_broker_id))
+
+
+@receiver(post_delete, sender=Client)
+@receiver(post_delete, sender=Application)
+@receiver(post_delete, sender=Task)
+@receiver(post_delete, sender=Reminder)
+def broker_row_deleted(sender, instance, **kwargs):
+    if _suppressed.get():
+        return
+    stats.record_delete(instance)
+    invalidate_summary(instance.broker_id)
+    if sender in publishers.PUBLISHED_MODELS:
+        publishers.publish_delete(instance)
+    if sender is Client:
+        search.invalidate_broker(instance.broker_id)
+        if typeahead.enabled():
+            pk, broker_id = instance.pk, instance.broker_id
+            transaction.on_commit(lambda: typeahead.registry.client_deleted(pk, broker_id))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=LazyUser)
+def user_saved(sender, instance, **kwargs):
+    if 'is_active' not in instance.get_deferred_fields() and not instance.is_active:
+        pk = instance.pk
+        transaction.on_commit(lambda: authentication.forget_user(pk))
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=LazyUser)
+def user_deleted(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: authentication.forget_user(pk))
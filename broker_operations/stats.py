@@ -0,0 +1,145 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from .models import Client, Application, Task, Reminder, BrokerStats
+
+COUNTER_FIELDS = ['total_clients', 'active_applications', 'pending_tasks', 'open_reminders']
+
+# Per model: the counter it feeds, the field that decides whether a row is
+# counted, and the predicate over that field's value.
+TRACKED_MODELS = {
+    Client: ('total_clients', None, lambda value: True),
+    Application: ('active_applications', 'status', lambda value: value in Application.ACTIVE_STATUSES),
+    Task: ('pending_tasks', 'status', lambda value: value == 'pending'),
+    Reminder: ('open_reminders', 'is_completed', lambda value: not value),
+}
+
+STATE_ATTR = '_broker_stats_state'
+
+
+def _tracked_attnames(model):
+    _, field, _ = TRACKED_MODELS[model]
+    return ['broker_id'] + ([field] if field else [])
+
+
+def _state_from_values(model, values):
+    """
+    ``(broker_id, counted)`` for a row given its tracked attribute values.
+    """
+    _, field, predicate = TRACKED_MODELS[model]
+    return values['broker_id'], predicate(values[field] if field else None)
+
+
+def current_state(instance):
+    model = type(instance)
+    return _state_from_values(model, {name: getattr(instance, name) for name in _tracked_attnames(model)})
+
+
+def remember_state(instance):
+    """
+    Snapshot the tracked fields of a freshly loaded instance, so a later save
+    can compute a delta without re-reading the row. Deferred fields are left
+    alone to avoid triggering a query per instance.
+    """
+    model = type(instance)
+    names = _tracked_attnames(model)
+    if instance.pk is None or any(name not in instance.__dict__ for name in names):
+        return
+    setattr(instance, STATE_ATTR, current_state(instance))
+
+
+def load_state(instance):
+    """
+    Make sure an existing instance has a snapshot before it is saved.
+    """
+    if instance._state.adding or hasattr(instance, STATE_ATTR):
+        return
+    model = type(instance)
+    values = model._default_manager.filter(pk=instance.pk).values(*_tracked_attnames(model)).first()
+    if values is not None:
+        setattr(instance, STATE_ATTR, _state_from_values(model, values))
+
+
+def apply_delta(broker_id, counter, delta, create=True):
+    """
+    Atomically add ``delta`` to one counter. When the broker has no stats row
+    yet and ``create`` is set, the row is built from a recount instead.
+    """
+    if not delta or broker_id is None:
+        return
+    updated = BrokerStats.objects.filter(broker_id=broker_id).update(**{counter: F(counter) + delta})
+    if updated or not create:
+        return
+    try:
+        with transaction.atomic():
+            BrokerStats.objects.create(broker_id=broker_id, **count_for_brokers([broker_id])[broker_id])
+    except IntegrityError:
+        # Another writer created the row between our update and insert.
+        BrokerStats.objects.filter(broker_id=broker_id).update(**{counter: F(counter) + delta})
+
+
+def record_save(instance, created):
+    model = type(instance)
+    counter = TRACKED_MODELS[model][0]
+    new_broker, new_counted = current_state(instance)
+    old = None if created else getattr(instance, STATE_ATTR, None)
+    if old is not None:
+        old_broker, old_counted = old
+        if (old_broker, old_counted) == (new_broker, new_counted):
+            return
+        if old_counted:
+            apply_delta(old_broker, counter, -1)
+    elif not created:
+        # No snapshot of the previous state; leave the counters to
+        # rebuild_broker_stats rather than guess.
+        setattr(instance, STATE_ATTR, (new_broker, new_counted))
+        return
+    if new_counted:
+        apply_delta(new_broker, counter, 1)
+    setattr(instance, STATE_ATTR, (new_broker, new_counted))
+
+
+def record_changes(model, changes):
+    """
+    Apply a batch of ``(old_state, new_state)`` pairs, either side ``None``
+    for created or deleted rows, with one counter update per broker.
+    """
+    counter = TRACKED_MODELS[model][0]
+    deltas = {}
+    for old, new in changes:
+        if old is not None and old[1]:
+            deltas[old[0]] = deltas.get(old[0], 0) - 1
+        if new is not None and new[1]:
+            deltas[new[0]] = deltas.get(new[0], 0) + 1
+    for broker_id, delta in deltas.items():
+        apply_delta(broker_id, counter, delta)
+
+
+def record_delete(instance):
+    counter = TRACKED_MODELS[type(instance)][0]
+    broker_id, counted = getattr(instance, STATE_ATTR, None) or current_state(instance)
+    if counted:
+        # Never create a row here: the broker itself may be mid-deletion.
+        apply_delta(broker_id, counter, -1, create=False)
+
+
+def count_for_brokers(broker_ids=None):
+    """
+    Recount every counter with one grouped query per table. Returns a dict of
+    ``{broker_id: {counter: value}}``; brokers with no rows are included when
+    ``broker_ids`` is given.
+    """
+    querysets = {
+        'total_clients': Client.objects.all(),
+        'active_applications': Application.objects.filter(status__in=Application.ACTIVE_STATUSES),
+        'pending_tasks': Task.objects.filter(status='pending'),
+        'open_reminders': Reminder.objects.filter(is_completed=False),
+    }
+    counts = {broker_id: dict.fromkeys(COUNTER_FIELDS, 0) for broker_id in broker_ids or []}
+    for counter, queryset in querysets.items():
+        if broker_ids is not None:
+            queryset = queryset.filter(broker_id__in=broker_ids)
+        rows = queryset.order_by().values('broker_id').annotate(count=Count('*'))
+        for row in rows:
+            counts.setdefault(row['broker_id'], dict.fromkeys(COUNTER_FIELDS, 0))[counter] = row['count']
+    return counts
@@ -0,0 +1,132 @@
+import csv
+import io
+import json
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework import renderers
+from rest_framework.utils import encoders
+
+EXPORT_CHUNK_SIZE = getattr(settings, 'NDJSON_EXPORT_CHUNK_SIZE', 500)
+
+
+def _dumps(data):
+    return json.dumps(data, cls=encoders.JSONEncoder, separators=(',', ':'))
+
+
+def _chunks(queryset, chunk_size):
+    chunk = []
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(obj)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def ndjson_lines(queryset, serializer_class, context=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Serialize `queryset` one chunk at a time, yielding encoded NDJSON.
+    """
+    for chunk in _chunks(queryset, chunk_size):
+        data = serializer_class(chunk, many=True, context=context or {}).data
+        yield ''.join(_dumps(row) + '\n' for row in data).encode()
+
+
+def csv_lines(queryset, serializer_class, context=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Like `ndjson_lines`, as CSV with a header row of the serializer's fields.
+    """
+    columns = list(serializer_class(context=context or {}).fields)
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction='ignore')
+    writer.writeheader()
+    for chunk in _chunks(queryset, chunk_size):
+        writer.writerows(serializer_class(chunk, many=True, context=context or {}).data)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class NDJSONRenderer(renderers.BaseRenderer):
+    """
+    Newline-delimited JSON. List views stream through
+    `NDJSONExportMixin`; this renderer only handles the small, non-streamed
+    responses such as errors.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        rows = data if isinstance(data, list) else [data]
+        return ''.join(_dumps(row) + '\n' for row in rows).encode()
+
+
+class CSVRenderer(renderers.BaseRenderer):
+    """
+    CSV for the non-streamed responses of `CSVExportMixin` views.
+    """
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        rows = data if isinstance(data, list) else [data]
+        buffer = io.StringIO()
+        columns = list(dict.fromkeys(column for row in rows for column in row))
+        writer = csv.DictWriter(buffer, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+        return buffer.getvalue().encode()
+
+
+class NDJSONExportMixin:
+    """
+    Adds `?format=ndjson` to a viewset's list action: every row of the
+    filtered queryset is streamed, one JSON object per line, without
+    pagination and without holding the whole result in memory.
+    """
+    export_chunk_size = EXPORT_CHUNK_SIZE
+
+    def get_renderers(self):
+        return super().get_renderers() + [NDJSONRenderer()]
+
+    def list(self, request, *args, **kwargs):
+        if getattr(request.accepted_renderer, 'format', None) == NDJSONRenderer.format:
+            return self.stream_ndjson(self.filter_queryset(self.get_queryset()))
+        return super().list(request, *args, **kwargs)
+
+    def stream_ndjson(self, queryset):
+        lines = ndjson_lines(
+            queryset, self.get_serializer_class(), self.get_serializer_context(), self.export_chunk_size
+        )
+        return StreamingHttpResponse(lines, content_type=NDJSONRenderer.media_type)
+
+
+class CSVExportMixin:
+    """
+    `?format=csv` counterpart of `NDJSONExportMixin`.
+    """
+    export_chunk_size = EXPORT_CHUNK_SIZE
+
+    def get_renderers(self):
+        return super().get_renderers() + [CSVRenderer()]
+
+    def list(self, request, *args, **kwargs):
+        if getattr(request.accepted_renderer, 'format', None) == CSVRenderer.format:
+            return self.stream_csv(self.filter_queryset(self.get_queryset()))
+        return super().list(request, *args, **kwargs)
+
+    def stream_csv(self, queryset):
+        lines = csv_lines(
+            queryset, self.get_serializer_class(), self.get_serializer_context(), self.export_chunk_size
+        )
+        return StreamingHttpResponse(lines, content_type='text/csv; charset=utf-8')
@@ -1,3 +1,1749 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import io
+import json
+import os
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+
+from .consumers import BrokerConsumer
+from .encodings import ENCODINGS, from_columns, negotiate, to_columns
+from .serializers import ApplicationSerializer, ClientSerializer, ReminderSerializer, TaskSerializer
+from . import async_views, blacklist, checks, fast_read, jobs, metrics, passwords, publishers
+from .documents import OffsetConflict, append_chunk, count_pdf_pages, partial_path
+from .scheduler import DueScheduler
+from .publishers import publisher
+from .pagination import BrokerCursorPagination
+from .typeahead import PrefixIndex, registry as typeahead_registry
+from .models import (
+    InterviewScript, ScriptSection, Client, Document, DocumentUpload, Application, Task, Reminder, BrokerStats, Job,
+    LazyUser, RevokedToken,
+)
+
+
+def make_broker(username='broker', **kwargs):
+    return User.objects.create_user(username=username, password='secret-pass-123', **kwargs)
+
+
+def make_client(broker, email='client@example.com', **kwargs):
+    fields = {
+        'first_name': 'Jane',
+        'last_name': 'Doe',
+        'phone': '0400 000 000',
+        'address': '1 Example St',
+    }
+    fields.update(kwargs)
+    return Client.objects.create(broker=broker, email=email, **fields)
+
+
+class DashboardIndexTests(TestCase):
+    """
+    The dashboard queries should be served by the composite broker indexes
+    rather than a scan of the broker FK index followed by a sort.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.broker = make_broker()
+        other = make_broker('other')
+        client = make_client(cls.broker)
+        due = timezone.now() + timedelta(days=1)
+        for owner in (cls.broker, other):
+            for i in range(20):
+                Application.objects.create(
+                    client=client, broker=owner, loan_amount='400000.00', property_value='500000.00',
+                    status=[choice for choice, _ in Application.STATUS_CHOICES][i % 6],
+                )
+                Task.objects.create(
+                    title=f'Task {i}', description='', broker=owner, client=client,
+                    due_date=due + timedelta(hours=i),
+                    status=['pending', 'in_progress', 'completed'][i % 3],
+                )
+                Reminder.objects.create(
+                    title=f'Reminder {i}', description='', broker=owner, client=client,
+                    due_date=due + timedelta(hours=i), is_completed=bool(i % 2),
+                )
+        with connection.cursor() as cursor:
+            if connection.vendor in ('sqlite', 'postgresql'):
+                cursor.execute('ANALYZE')
+
+    def explain(self, queryset):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+    def assertUsesIndex(self, queryset, model, name=None):
+        plan = self.explain(queryset)
+        names = [name] if name else [index.name for index in model._meta.indexes]
+        self.assertTrue(any(name in plan for name in names), plan)
+
+    def test_dashboard_tasks_uses_index(self):
+        queryset = Task.objects.filter(
+            broker=self.broker, status__in=['pending', 'in_progress']
+        ).order_by('due_date')
+        self.assertUsesIndex(queryset, Task)
+
+    def test_dashboard_reminders_uses_index(self):
+        queryset = Reminder.objects.filter(
+            broker=self.broker, is_completed=False, due_date__gte=timezone.now()
+        ).order_by('due_date')
+        self.assertUsesIndex(queryset, Reminder)
+
+    def test_summary_counts_use_index(self):
+        # count() drops the default ordering, so explain the unordered query.
+        self.assertUsesIndex(
+            Application.objects.filter(
+                broker=self.broker, status__in=['submitted', 'under_review']
+            ).order_by(),
+            Application,
+            'app_broker_status_idx',
+        )
+        self.assertUsesIndex(Task.objects.filter(broker=self.broker, status='pending').order_by(), Task)
+
+
+class DashboardSummaryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.broker = make_broker()
+        self.client_obj = make_client(self.broker)
+        Application.objects.create(
+            client=self.client_obj, broker=self.broker, status='submitted',
+            loan_amount='400000.00', property_value='500000.00',
+        )
+        Task.objects.create(
+            title='Call', description='', broker=self.broker, due_date=timezone.now(),
+        )
+        self.api = APIClient()
+        self.api.force_authenticate(self.broker)
+        self.url = reverse('dashboard-summary')
+
+    def test_summary_is_one_query_then_cached(self):
+        cache.clear()
+        with self.assertNumQueries(1):
+            response = self.api.get(self.url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data, {
+            'total_clients': 1,
+            'active_applications': 1,
+            'pending_tasks': 1,
+            'upcoming_reminders': 0,
+        })
+        with self.assertNumQueries(0):
+            response = self.api.get(self.url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+    def test_save_invalidates_broker_entry(self):
+        self.api.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Reminder.objects.create(
+                title='Follow up', description='', broker=self.broker, due_date=timezone.now(),
+            )
+            # Not before commit: a reader now would cache uncommitted counts.
+            self.assertEqual(self.api.get(self.url)['X-Cache'], 'HIT')
+        response = self.api.get(self.url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['upcoming_reminders'], 1)
+
+    def test_per_process_cache_is_flagged_in_production(self):
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        with override_settings(DEBUG=False, CACHES=locmem):
+            self.assertEqual([warning.id for warning in checks.shared_cache_check(None)], ['broker_operations.W001'])
+        with override_settings(DEBUG=True, CACHES=locmem):
+            self.assertEqual(checks.shared_cache_check(None), [])
+
+
+class AsyncDashboardViewTests(TestCase):
+    """
+    The async dashboard views must answer exactly like the sync ones.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.broker = make_broker()
+        client = make_client(cls.broker)
+        application = Application.objects.create(
+            client=client, broker=cls.broker, status='submitted',
+            loan_amount='400000.00', property_value='500000.00',
+        )
+        due = timezone.now() + timedelta(days=1)
+        for i in range(3):
+            Task.objects.create(
+                title=f'Task {i}', description='', broker=cls.broker, client=client,
+                application=application, due_date=due + timedelta(hours=i),
+            )
+            Reminder.objects.create(
+                title=f'Reminder {i}', description='', broker=cls.broker, client=client,
+                due_date=due + timedelta(hours=i),
+            )
+        cls.token = str(AccessToken.for_user(cls.broker))
+
+    def setUp(self):
+        cache.clear()
+        self.api = APIClient()
+        self.factory = AsyncRequestFactory()
+
+    def call_async(self, name, **headers):
+        view = getattr(async_views, name.replace('-', '_'))
+        return async_to_sync(view)(self.factory.get('/', headers=headers))
+
+    def test_responses_match_sync_views(self):
+        self.api.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        for name in ['dashboard-summary', 'dashboard-activity', 'dashboard-reminders', 'dashboard-tasks']:
+            cache.clear()
+            expected = self.api.get(reverse(name))
+            cache.clear()
+            response = self.call_async(name, authorization=f'Bearer {self.token}')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'application/json')
+            self.assertEqual(response.content, expected.content, name)
+
+    def test_summary_uses_cache(self):
+        first = self.call_async('dashboard-summary', authorization=f'Bearer {self.token}')
+        second = self.call_async('dashboard-summary', authorization=f'Bearer {self.token}')
+        self.assertEqual((first['X-Cache'], second['X-Cache']), ('MISS', 'HIT'))
+        self.assertEqual(json.loads(second.content)['pending_tasks'], 3)
+
+    def test_authentication_errors_match_sync_views(self):
+        for headers in [{}, {'authorization': 'Bearer not-a-token'}]:
+            expected = self.api.get(reverse('dashboard-tasks'), headers=headers)
+            response = self.call_async('dashboard-tasks', **headers)
+            self.assertEqual(response.status_code, 401)
+            self.assertEqual(json.loads(response.content), expected.json())
+            self.assertEqual(response['WWW-Authenticate'], expected['WWW-Authenticate'])
+
+
+class DashboardBootstrapTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.broker = make_broker()
+        self.client_obj = make_client(self.broker)
+        self.task = Task.objects.create(
+            title='Call', description='', broker=self.broker, due_date=timezone.now() + timedelta(days=1),
+        )
+        Reminder.objects.create(
+            title='Follow up', description='', broker=self.broker, due_date=timezone.now() + timedelta(days=1),
+        )
+        self.api = APIClient()
+        self.api.force_authenticate(self.broker)
+        self.url = reverse('dashboard')
+
+    def test_sections_match_separate_endpoints(self):
+        response = self.api.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(list(body), ['summary', 'activity', 'reminders', 'tasks'])
+        for name in body:
+            self.assertEqual(body[name], self.api.get(reverse(f'dashboard-{name}')).json(), name)
+
+        response = self.api.get(self.url, {'sections': 'tasks,summary'})
+        self.assertEqual(list(response.json()), ['summary', 'tasks'])
+        response = self.api.get(self.url, {'sections': 'tasks,calendar'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'sections': ['Unknown section: calendar']})
+
+    def test_conditional_get(self):
+        etag = self.api.get(self.url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.api.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertNotEqual(self.api.get(self.url, {'sections': 'tasks'})['ETag'], etag)
+
+        self.task.title = 'Call back'
+        self.task.save()
+        response = self.api.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        Application.objects.create(
+            client=self.client_obj, broker=self.broker, status='draft',
+            loan_amount='400000.00', property_value='500000.00',
+        ).delete()
+        self.task.delete()
+        response = self.api.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['tasks'], [])
+
+    def test_etag_changes_when_a_reminder_falls_due(self):
+        etag = self.api.get(self.url, {'sections': 'reminders'})['ETag']
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() + timedelta(days=2)):
+            response = self.api.get(self.url, {'sections': 'reminders'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'reminders': []})
+
+
+class FastReadTests(TestCase):
+    """
+    The fast read path must produce the same bytes as the DRF serializers.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.broker = make_broker()
+        now = timezone.now().replace(microsecond=123456)
+        clients = [
+            make_client(self.broker, first_name='Zo\u00eb \u2028"Q" \\', last_name='\U0001f600\x01', notes=None),
+            make_client(self.broker, email='other@example.com', notes='Line\nbreak \u2029'),
+        ]
+        for i, (loan, value) in enumerate([('1234.5', '1000000'), ('0.01', '99999999.99'), ('400000', '500000.10')]):
+            application = Application.objects.create(
+                client=clients[i % 2], broker=self.broker, status='submitted', loan_amount=loan, property_value=value,
+            )
+            Task.objects.create(
+                title=f'Task \u2028{i}', description='', broker=self.broker, client=clients[i % 2] if i else None,
+                application=application if i != 1 else None, due_date=now + timedelta(hours=i),
+                created_at=now - timedelta(seconds=i),
+            )
+            Reminder.objects.create(
+                title=f'Reminder {i}', description='\u00e9', broker=self.broker, client=clients[0],
+                due_date=now + timedelta(days=i + 1, microseconds=i), is_completed=i == 2,
+            )
+        self.api = APIClient()
+        self.api.force_authenticate(self.broker)
+
+    def test_endpoints_match_serializers(self):
+        urls = [
+            reverse('dashboard'), reverse('dashboard-tasks'), reverse('dashboard-reminders'),
+            reverse('dashboard-activity'), reverse('client-list'), reverse('client-list') + '?search=zo',
+            reverse('application-list'), reverse('task-list') + '?page_size=2', reverse('reminder-list'),
+        ]
+        for url in urls:
+            fast = self.api.get(url)
+            with override_settings(FAST_READ_SERIALIZERS=False):
+                slow = self.api.get(url)
+            self.assertEqual(fast.status_code, 200, url)
+            self.assertEqual(fast.content, slow.content, url)
+        next_page = self.api.get(reverse('task-list') + '?page_size=2').json()['next']
+        self.assertEqual(len(self.api.get(next_page).json()['results']), 1)
+
+    def test_reader_matches_serializers_in_other_timezone(self):
+        renderer = fast_read.FastJSONRenderer()
+        with timezone.override('Australia/Adelaide'):
+            for serializer_class, queryset in [
+                (TaskSerializer, Task.objects.all()), (ReminderSerializer, Reminder.objects.all()),
+                (ApplicationSerializer, Application.objects.all()), (ClientSerializer, Client.objects.all()),
+            ]:
+                rows = fast_read.serialize(serializer_class, queryset)
+                self.assertIsInstance(rows, fast_read.FastRows)
+                self.assertEqual(
+                    renderer.render(rows), JSONRenderer().render(serializer_class(queryset, many=True).data),
+                )
+
+    def test_renderer_falls_back_for_other_data(self):
+        for data in [{'value': 1e16}, {'items': [1, 2]}, {'big': 2 ** 70}, None, {'when': timezone.now()}]:
+            self.assertEqual(fast_read.FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+
+class StatelessJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.broker = make_broker(email='broker@example.com')
+        self.api = APIClient()
+        self.api.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.broker)}')
+
+    def test_user_row_is_read_once_per_cache_period(self):
+        url = reverse('dashboard-tasks')
+        with CaptureQueriesContext(connection) as first:
+            self.assertEqual(self.api.get(url).status_code, 200)
+        with CaptureQueriesContext(connection) as second:
+            self.assertEqual(self.api.get(url).status_code, 200)
+        self.assertEqual(len(first), len(second) + 1)
+        self.assertFalse(any('auth_user' in query['sql'] for query in second))
+
+    def test_lazy_user_loads_on_first_non_id_read(self):
+        user = LazyUser.from_id(self.broker.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(user.id, self.broker.pk)
+            list(Task.objects.filter(broker=user).values_list('pk')[:0])
+        with self.assertNumQueries(1):
+            self.assertEqual((user.username, user.email, user.is_staff), ('broker', 'broker@example.com', False))
+
+        self.api.get(reverse('dashboard-tasks'))
+        response = self.api.get(reverse('me'))
+        self.assertEqual(response.json()['username'], 'broker')
+        response = self.api.post(reverse('task-list'), {
+            'title': 'Call', 'description': 'Call back', 'due_date': timezone.now().isoformat(),
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Task.objects.get().broker_id, self.broker.pk)
+
+    def test_deactivation_takes_effect_immediately(self):
+        url = reverse('dashboard-tasks')
+        self.assertEqual(self.api.get(url).status_code, 200)
+        self.broker.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.broker.save()
+        response = self.api.get(url)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['code'], 'user_inactive')
+
+    def test_deleted_user_is_rejected(self):
+        url = reverse('dashboard-tasks')
+        self.assertEqual(self.api.get(url).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.broker.delete()
+        self.assertEqual(self.api.get(url).status_code, 401)
+
+
+@override_settings(LOGIN_HASH_WORKERS=0, LOGIN_RATE_LIMITS={'username': (3, 60), 'ip': (5, 60)})
+class LoginTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.broker = make_broker()
+        self.api = APIClient()
+        self.url = reverse('login')
+
+    def login(self, username='broker', password='secret-pass-123', **extra):
+        return self.api.post(self.url, {'username': username, 'password': password}, format='json', **extra)
+
+    @override_settings(LOGIN_HASH_WORKERS=1)
+    def test_login_hashes_in_process_pool(self):
+        self.addCleanup(passwords.shutdown)
+        response = self.login()
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(passwords._executor)
+        self.assertIn('access', response.json())
+        self.assertEqual(self.login(password='wrong').status_code, 401)
+
+    def test_failures_are_limited_per_username_before_hashing(self):
+        for _ in range(3):
+            self.assertEqual(self.login(password='wrong').status_code, 401)
+        with mock.patch('broker_operations.passwords._check') as check, self.assertNumQueries(0):
+            response = self.login('BROKER')
+        check.assert_not_called()
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        # Another account from the same address still gets through.
+        make_broker('other')
+        self.assertEqual(self.login('other').status_code, 200)
+
+    def test_failures_are_limited_per_address(self):
+        for i in range(5):
+            self.assertEqual(self.login(f'nobody-{i}').status_code, 401)
+        self.assertEqual(self.login().status_code, 429)
+        self.assertEqual(self.login(REMOTE_ADDR='10.0.0.2').status_code, 200)
+
+    def test_spoofed_forwarded_for_does_not_escape_the_address_limit(self):
+        for i in range(5):
+            self.login(f'nobody-{i}', HTTP_X_FORWARDED_FOR=f'203.0.113.{i}')
+        self.assertEqual(self.login(HTTP_X_FORWARDED_FOR='203.0.113.99').status_code, 429)
+
+    def test_forwarded_for_is_trusted_behind_configured_proxies(self):
+        with self.settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1}):
+            for i in range(5):
+                self.login(f'nobody-{i}', HTTP_X_FORWARDED_FOR='198.51.100.1, 203.0.113.1')
+            self.assertEqual(self.login(HTTP_X_FORWARDED_FOR='198.51.100.1, 203.0.113.1').status_code, 429)
+            self.assertEqual(self.login(HTTP_X_FORWARDED_FOR='198.51.100.1, 203.0.113.2').status_code, 200)
+
+    def test_bucket_refills(self):
+        for _ in range(3):
+            self.login(password='wrong')
+        later = time.time() + 21
+        with mock.patch('broker_operations.ratelimit.time.time', return_value=later):
+            self.assertEqual(self.login().status_code, 200)
+            self.assertEqual(self.login(password='wrong').status_code, 401)
+            self.assertEqual(self.login().status_code, 429)
+
+    @override_settings(PASSWORD_HASHERS=[
+        'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+        'django.contrib.auth.hashers.MD5PasswordHasher',
+    ])
+    def test_outdated_hash_is_upgraded(self):
+        from django.contrib.auth.hashers import make_password
+        User.objects.filter(pk=self.broker.pk).update(password=make_password('secret-pass-123', hasher='md5'))
+        self.assertEqual(self.login().status_code, 200)
+        self.broker.refresh_from_db()
+        self.assertTrue(self.broker.password.startswith('pbkdf2_sha256$'))
+
+
+@override_settings(LOGIN_HASH_WORKERS=0)
+class TokenBlacklistTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        blacklist._registry = None
+        self.broker = make_broker()
+        self.api = APIClient()
+        tokens = self.api.post(
+            reverse('login'), {'username': 'broker', 'password': 'secret-pass-123'}, format='json',
+        ).json()
+        self.refresh, self.access = tokens['refresh'], tokens['access']
+
+    def refresh_token(self, refresh):
+        return self.api.post(reverse('token-refresh'), {'refresh': refresh}, format='json')
+
+    def test_logout_revokes_refresh_token(self):
+        self.assertEqual(self.refresh_token(self.refresh).status_code, 200)
+        self.api.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access}')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.api.post(reverse('logout'), {'refresh': self.refresh}, format='json')
+        self.assertEqual(response.status_code, 205)
+        self.assertTrue(RevokedToken.objects.exists())
+        response = self.refresh_token(self.refresh)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['detail'], 'Token is blacklisted')
+
+    def test_check_skips_database_for_unrevoked_tokens(self):
+        self.refresh_token(self.refresh)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.refresh_token(self.refresh).status_code, 200)
+        self.assertFalse(any('revokedtoken' in query['sql'] for query in queries))
+
+    def test_other_processes_see_revocations(self):
+        other = blacklist.TokenBlacklist()
+        token = blacklist.RevocableRefreshToken(self.refresh)
+        jti, exp = token['jti'], token['exp']
+        self.assertFalse(other.is_revoked(jti, exp))
+        with self.captureOnCommitCallbacks(execute=True):
+            token.blacklist()
+        self.assertTrue(other.is_revoked(jti, exp))
+        # Without the cache entry the filter hit is confirmed in the database.
+        cache.delete(blacklist.jti_key(jti))
+        with self.assertNumQueries(1):
+            self.assertTrue(other.is_revoked(jti, exp))
+
+    def test_revocation_is_seen_before_the_next_sync(self):
+        other = blacklist.TokenBlacklist()
+        token = blacklist.RevocableRefreshToken(self.refresh)
+        jti, exp = token['jti'], token['exp']
+        self.assertFalse(other.is_revoked(jti, exp))
+        # Another worker revokes it without the generation reaching this one.
+        with self.captureOnCommitCallbacks(execute=True):
+            blacklist.TokenBlacklist().revoke(jti, exp)
+        other.generation = cache.get(blacklist.GENERATION_KEY)
+        self.assertTrue(other.is_revoked(jti, exp))
+
+    def test_check_does_not_wait_for_a_reload_in_progress(self):
+        registry = blacklist.TokenBlacklist()
+        registry.sync()
+        registry.generation = 'stale'
+        with registry.lock, self.assertNumQueries(0):
+            self.assertFalse(registry.is_revoked('unknown', time.time() + 60))
+        with self.assertNumQueries(1):
+            registry.is_revoked('unknown', time.time() + 60)
+
+    def test_incremental_load_sees_rows_committed_out_of_order(self):
+        registry = blacklist.TokenBlacklist()
+        expires_at = timezone.now() + timedelta(hours=1)
+        RevokedToken.objects.create(pk=100, jti='early', expires_at=expires_at)
+        registry.sync()
+        # Inserted before `early` but committed after it was loaded.
+        RevokedToken.objects.create(pk=50, jti='late', expires_at=expires_at)
+        registry.generation = 'stale'
+        registry.sync()
+        self.assertIn('late', registry.filters[registry._slice(expires_at.timestamp())])
+
+    def test_expired_slices_are_pruned(self):
+        registry = blacklist.TokenBlacklist()
+        now = time.time()
+        registry.revoke('old', now + 60)
+        registry.revoke('new', now + registry.slice_seconds * 3)
+        later = now + registry.slice_seconds * 2
+        registry.sync(later)
+        self.assertEqual(list(RevokedToken.objects.values_list('jti', flat=True)), ['new'])
+        self.assertEqual(list(registry.filters), [registry._slice(now + registry.slice_seconds * 3)])
+
+    def test_bloom_filter(self):
+        bloom = blacklist.BloomFilter(1000)
+        for i in range(1000):
+            bloom.add(f'revoked-{i}')
+        self.assertTrue(all(f'revoked-{i}' in bloom for i in range(1000)))
+        false_positives = sum(f'valid-{i}' in bloom for i in range(10000))
+        self.assertLess(false_positives, 50)
+
+
+class PerformanceMetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.registry.clear()
+        self.broker = make_broker()
+        self.api = APIClient()
+        self.api.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.broker)}')
+
+    def series(self, name, view):
+        return metrics.registry.metrics[name][2][(('view', view),)]
+
+    def test_request_is_recorded_by_view(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.api.get(reverse('dashboard-tasks'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.series('db_queries_per_request', 'dashboard-tasks').sum, len(queries))
+        self.assertEqual(self.series('http_response_size_bytes', 'dashboard-tasks').sum, len(response.content))
+        self.assertGreater(self.series('serializer_duration_seconds', 'dashboard-tasks').sum, 0)
+        duration = metrics.registry.metrics['http_request_duration_seconds'][2]
+        self.assertEqual(duration[(('method', 'GET'), ('status', '200'), ('view', 'dashboard-tasks'))].count, 1)
+
+    def test_serializer_lists_are_timed(self):
+        InterviewScript.objects.create(title='Intro', script_type='initial_call', version='1', total_duration=0)
+        self.assertEqual(self.api.get(reverse('script-list')).status_code, 200)
+        self.assertGreater(self.series('serializer_duration_seconds', 'script-list').sum, 0)
+
+    @override_settings(PERF_METRICS_TOKEN='scrape-token')
+    def test_metrics_endpoint(self):
+        self.api.get(reverse('dashboard-tasks'))
+        client = APIClient()
+        self.assertEqual(client.get(reverse('metrics')).status_code, 401)
+        client.credentials(HTTP_AUTHORIZATION='Bearer scrape-token')
+        response = client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn('# TYPE db_queries_per_request histogram', body)
+        self.assertIn('http_request_duration_seconds_count{method="GET",status="200",view="dashboard-tasks"} 1', body)
+        self.assertIn('db_queries_per_request_bucket{view="dashboard-tasks",le="+Inf"} 1', body)
+
+    def test_metrics_endpoint_disabled_without_token(self):
+        self.assertEqual(self.api.get(reverse('metrics')).status_code, 404)
+
+    @override_settings(PERF_SLOW_QUERY_MS=0)
+    def test_slow_queries_are_logged_with_stack(self):
+        with self.assertLogs('broker_operations.slow_queries', 'WARNING') as logs:
+            self.api.get(reverse('dashboard-tasks'))
+        self.assertIn('in dashboard-tasks: SELECT', logs.output[0])
+        self.assertIn('views.py', logs.output[0])
+
+
+class BrokerStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.broker = make_broker()
+        self.client_obj = make_client(self.broker)
+        self.api = APIClient()
+        self.api.force_authenticate(self.broker)
+
+    def stats(self):
+        return BrokerStats.objects.get(broker=self.broker)
+
+    def test_counters_follow_creates_status_changes_and_deletes(self):
+        application = Application.objects.create(
+            client=self.client_obj, broker=self.broker, status='draft',
+            loan_amount='400000.00', property_value='500000.00',
+        )
+        self.assertEqual(self.stats().total_clients, 1)
+        self.assertEqual(self.stats().active_applications, 0)
+
+        url = reverse('application-update-status', args=[application.pk])
+        self.api.patch(url, {'status': 'submitted'}, format='json')
+        self.assertEqual(self.stats().active_applications, 1)
+        self.api.patch(url, {'status': 'approved'}, format='json')
+        self.assertEqual(self.stats().active_applications, 0)
+
+        reminder = Reminder.objects.create(
+            title='Follow up', description='', broker=self.broker, due_date=timezone.now(),
+        )
+        self.assertEqual(self.stats().open_reminders, 1)
+        reminder = Reminder.objects.get(pk=reminder.pk)
+        reminder.is_completed = True
+        reminder.save()
+        self.assertEqual(self.stats().open_reminders, 0)
+
+        Task.objects.create(title='Call', description='', broker=self.broker, due_date=timezone.now())
+        self.assertEqual(self.stats().pending_tasks, 1)
+        self.client_obj.delete()
+        self.assertEqual(self.stats().total_clients, 0)
+
+    def test_summary_reads_counters(self):
+        Task.objects.create(title='Call', description='', broker=self.broker, due_date=timezone.now())
+        self.stats()
+        with self.assertNumQueries(1):
+            response = self.api.get(reverse('dashboard-summary'))
+        self.assertEqual(response.data['pending_tasks'], 1)
+
+    def test_rebuild_detects_and_fixes_drift(self):
+        Task.objects.create(title='Call', description='', broker=self.broker, due_date=timezone.now())
+        Task.objects.filter(broker=self.broker).update(status='completed')
+        self.assertEqual(self.stats().pending_tasks, 1)
+        out = StringIO()
+        call_command('rebuild_broker_stats', stdout=out)
+        self.assertIn('pending_tasks 1 -> 0', out.getvalue())
+        self.assertEqual(self.stats().pending_tasks, 0)
+
+
+class SyntheticBenchmarkTests(TestCase):
+    def generate(self, *args):
+        out = StringIO()
+        call_command('generate_synthetic_data', '--brokers', '2', '--clients', '3', '--scripts', '2',
+                     '--anchor', '2026-01-15', *args, stdout=out)
+        return json.loads(out.getvalue())
+
+    def test_generated_data_is_deterministic(self):
+        counts = self.generate()
+        self.assertEqual(
+            {key: counts[key] for key in ('brokers', 'clients', 'applications', 'tasks', 'reminders', 'documents')},
+            {'brokers': 2, 'clients': 6, 'applications': 6, 'tasks': 12, 'reminders': 12, 'documents': 12},
+        )
+        rows = list(Task.objects.order_by('title', 'due_date').values_list('title', 'due_date', 'status'))
+        self.generate('--flush')
+        self.assertEqual(list(Task.objects.order_by('title', 'due_date').values_list('title', 'due_date', 'status')), rows)
+        broker = User.objects.get(username='synthetic-0')
+        self.assertEqual(BrokerStats.objects.get(broker=broker).total_clients, 3)
+        self.assertEqual(InterviewScript.objects.first().sections.count(), 6)
+
+    def test_bench_api_reports_every_endpoint(self):
+        self.generate()
+        out = StringIO()
+        call_command('bench_api', '--requests', '2', '--warmup', '1', stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['rows']['Client'], 6)
+        for name, result in report['endpoints'].items():
+            self.assertEqual(result['errors'], 0, name)
+            self.assertGreaterEqual(result['p99_ms'], result['p50_ms'])
+
+
+class InterviewScriptQueryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.broker = make_broker()
+        for i in range(8):
+            script = InterviewScript.objects.create(
+                title=f'Script {i}', description='', script_type='initial_call',
+                version='1', total_duration=300,
+            )
+            for order in range(3, 0, -1):
+                script.sections.add(ScriptSection.objects.create(
+                    title=f'Section {order}', duration_seconds=100,
+                    content='x' * 1000, order=order,
+                ))
+
+    def setUp(self):
+        cache.clear()
+        self.api = APIClient()
+        self.api.force_authenticate(self.broker)
+
+    def test_list_prefetches_sections_in_order(self):
+        # COUNT for the page, the page of scripts, and one prefetch for all sections.
+        with self.assertNumQueries(3):
+            response = self.api.get(reverse('script-list'))
+        scripts = response.json()['results']
+        self.assertEqual(len(scripts), 8)
+        self.assertEqual([section['order'] for section in scripts[0]['sections']], [1, 2, 3])
+
+    def test_retrieve_prefetches_sections(self):
+        script = InterviewScript.objects.first()
+        # Version lookup for the cache key, the script, and its sections.
+        with self.assertNumQueries(3):
+            response = self.api.get(reverse('script-detail', args=[script.pk]))
+        self.assertEqual(len(response.json()['sections']), 3)
+
+    def test_sparse_fields_skip_sections(self):
+        with self.assertNumQueries(2):
+            response = self.api.get(reverse('script-list'), {'fields': 'id,title'})
+        self.assertEqual(set(response.json()['results'][0]), {'id', 'title'})
+
+    def test_sparse_section_fields_skip_content(self):
+        with self.assertNumQueries(3):
+            response = self.api.get(
+                reverse('script-list'), {'fields': 'id,title,sections.title,sections.order'}
+            )
+        section = response.json()['results'][0]['sections'][0]
+        self.assertEqual(set(section), {'title', 'order'})
+
+    def test_expand_sections(self):
+        response = self.api.get(reverse('script-list'), {'fields': 'id', 'expand': 'sections'})
+        self.assertIn('content', response.json()['results'][0]['sections'][0])
+
+
+class InterviewScriptCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.api = APIClient()
+        self.api.force_authenticate(make_broker())
+        response = self.api.post(reverse('script-list'), {
+            'title': 'Initial call', 'description': 'First contact', 'script_type': 'initial_call', 'version': '1',
+            'sections': [{'title': 'Intro', 'duration_seconds': 30, 'content': 'Hello', 'order': 1}],
+        }, format='json')
+        self.script_id = response.data['id']
+        self.section_id = response.data['sections'][0]['id']
+        self.url = reverse('script-detail', args=[self.script_id])
+
+    def test_retrieve_is_cached_and_conditional(self):
+        first = self.api.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        etag = first['ETag']
+        self.assertFalse(etag.startswith('W/'))
+        self.assertIn('Last-Modified', first)
+
+        with self.assertNumQueries(0):
+            cached = self.api.get(self.url)
+        self.assertEqual(cached.content, first.content)
+
+        with self.assertNumQueries(0):
+            response = self.api.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        with self.assertNumQueries(0):
+            response = self.api.get(self.url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_list_is_cached_and_conditional(self):
+        url = reverse('script-list')
+        etag = self.api.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.api.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertNotEqual(self.api.get(url, {'fields': 'id'})['ETag'], etag)
+
+    def test_list_validators_follow_content(self):
+        url = reverse('script-list')
+        first = self.api.get(url)
+        self.assertNotIn('Last-Modified', first)
+        cache.clear()
+        response = self.api.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        self.api.delete(self.url)
+        response = self.api.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [])
+
+    def test_section_write_invalidates(self):
+        etag = self.api.get(self.url)['ETag']
+        self.api.patch(reverse('script-section-detail', args=[self.section_id]), {'content': 'Hi'}, format='json')
+        response = self.api.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['sections'][0]['content'], 'Hi')
+
+    def test_script_write_invalidates(self):
+        etag = self.api.get(reverse('script-list'))['ETag']
+        self.api.patch(self.url, {'title': 'Renamed'}, format='json')
+        response = self.api.get(reverse('script-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['title'], 'Renamed')
+
+
+class InterviewScriptWriteTests(TestCase):
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(make_broker())
+
+    def payload(self, sections):
+        return {
+            'title': 'Initial call', 'description': 'First contact', 'script_type': 'initial_call',
+            'version': '1', 'is_active': True, 'sections': sections,
+        }
+
+    def sections(self, count):
+        return [
+            {'title': f'Section {i}', 'duration_seconds': 30, 'content': 'Say hello', 'order': i}
+            for i in range(count)
+        ]
+
+    def test_create_query_count_does_not_grow_with_sections(self):
+        # SAVEPOINT/RELEASE, script INSERT, section INSERT, through INSERT,
+        # and one read of the sections for the response.
+        with self.assertNumQueries(6):
+            response = self.api.post(reverse('script-list'), self.payload(self.sections(60)), format='json')
+        self.assertEqual(response.status_code, 201)
+        script = InterviewScript.objects.get()
+        self.assertEqual(script.sections.count(), 60)
+        self.assertEqual(script.total_duration, 1800)
+
+    def test_update_reversions_sections_in_bulk(self):
+        response = self.api.post(reverse('script-list'), self.payload(self.sections(3)), format='json')
+        script_id = response.data['id']
+        kept, dropped = response.data['sections'][0], response.data['sections'][1]
+        payload = self.payload([
+            dict(kept, content='Updated', duration_seconds=60),
+            {'title': 'New', 'duration_seconds': 90, 'content': 'New section', 'order': 5},
+        ])
+        payload['version'] = '2'
+        response = self.api.put(reverse('script-detail', args=[script_id]), payload, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        script = InterviewScript.objects.get(pk=script_id)
+        self.assertEqual(script.version, '2')
+        self.assertEqual(script.total_duration, 150)
+        self.assertEqual(
+            [(section.title, section.content) for section in script.sections.all()],
+            [('Section 0', 'Updated'), ('New', 'New section')],
+        )
+        self.assertFalse(ScriptSection.objects.filter(pk=dropped['id']).exists())
+
+    def test_patch_keeps_stored_values_of_omitted_section_fields(self):
+        response = self.api.post(reverse('script-list'), self.payload(self.sections(2)), format='json')
+        url = reverse('script-detail', args=[response.data['id']])
+        kept = response.data['sections'][0]
+
+        response = self.api.patch(url, {'sections': [
+            {'title': 'New', 'content': 'c', 'order': 1},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('duration_seconds', response.data['sections'][0])
+
+        response = self.api.patch(url, {'sections': [
+            {'id': kept['id'], 'content': 'Updated'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_duration'], 30)
+        self.assertEqual(
+            [(section['title'], section['content']) for section in response.data['sections']],
+            [('Section 0', 'Updated')],
+        )
+
+    def test_update_copies_sections_shared_with_other_scripts(self):
+        response = self.api.post(reverse('script-list'), self.payload(self.sections(2)), format='json')
+        script_id = response.data['id']
+        shared, dropped = response.data['sections']
+        other = InterviewScript.objects.create(
+            title='Follow-up', description='Second call', script_type='follow_up', version='1', total_duration=60,
+        )
+        other.sections.add(shared['id'], dropped['id'])
+
+        payload = self.payload([dict(shared, content='Updated')])
+        response = self.api.put(reverse('script-detail', args=[script_id]), payload, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        copy = response.data['sections'][0]
+        self.assertNotEqual(copy['id'], shared['id'])
+        self.assertEqual(copy['content'], 'Updated')
+        self.assertEqual(
+            list(other.sections.values_list('pk', 'content')),
+            [(shared['id'], 'Say hello'), (dropped['id'], 'Say hello')],
+        )
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    BROKER_PUSH_COALESCE_WINDOW=60,
+)
+class PublisherTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.broker = make_broker()
+        self.client_obj = make_client(self.broker)
+        self.layer = get_channel_layer()
+        self.channel = async_to_sync(self.layer.new_channel)()
+        for suffix in ('applications', 'reminders'):
+            async_to_sync(self.layer.group_add)(f'broker_{self.broker.id}_{suffix}', self.channel)
+        publishers.listener_connected(self.broker.id)
+
+    def receive(self):
+        return async_to_sync(self.layer.receive)(self.channel)
+
+    def test_nothing_is_published_while_nobody_listens(self):
+        publishers.listener_disconnected(self.broker.id)
+        cache.delete(f'broker_push_recent_listener:{self.broker.id}')
+        seq = publishers.current_sequence(self.broker.id)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            Reminder.objects.create(title='Unheard', description='', broker=self.broker, due_date=timezone.now())
+        # The summary invalidation and the skipped sequence number.
+        self.assertEqual(len(callbacks), 2)
+        publisher.flush()
+        self.assertEqual(publishers.current_sequence(self.broker.id), seq + 1)
+        self.assertIsNone(publishers.events_since(self.broker.id, seq))
+
+    def test_burst_is_sent_as_one_batch_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(30):
+                Reminder.objects.create(
+                    title=f'Reminder {i}', description='', broker=self.broker, due_date=timezone.now(),
+                )
+        publisher.flush()
+        message = self.receive()
+        self.assertEqual(message['type'], 'reminder_update')
+        self.assertEqual(len(message['data']), 30)
+        self.assertEqual(message['data'][0]['op'], 'created')
+
+    def test_update_sends_only_changed_fields(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            application = Application.objects.create(
+                client=self.client_obj, broker=self.broker, status='draft',
+                loan_amount='400000.00', property_value='500000.00',
+            )
+        publisher.flush()
+        self.receive()
+
+        application = Application.objects.get(pk=application.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            application.status = 'submitted'
+            application.save()
+            application.status = 'under_review'
+            application.save()
+        publisher.flush()
+        message = self.receive()
+        self.assertEqual(len(message['data']), 1)
+        diff = message['data'][0]
+        self.assertEqual(diff['op'], 'updated')
+        self.assertEqual(set(diff['fields']), {'status', 'updated_at'})
+        self.assertEqual(diff['fields']['status'], 'under_review')
+
+    def test_nothing_is_sent_before_commit(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            Reminder.objects.create(title='R', description='', broker=self.broker, due_date=timezone.now())
+        publisher.flush()
+        # The publish and the summary invalidation.
+        self.assertEqual(len(callbacks), 2)
+        self.assertEqual(publisher._pending, {})
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    BROKER_PUSH_COALESCE_WINDOW=60,
+)
+class ConsumerResumeTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.broker = make_broker()
+        for i in range(5):
+            Reminder.objects.create(title=f'R{i}', description='', broker=self.broker, due_date=timezone.now())
+        publisher.flush()
+
+    async def connect(self):
+        communicator = WebsocketCommunicator(BrokerConsumer.as_asgi(), '/ws/')
+        communicator.scope['user'] = self.broker
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def test_subscribe_streams_snapshot_in_chunks(self):
+        communicator = await self.connect()
+        with self.settings(BROKER_SNAPSHOT_CHUNK_SIZE=2):
+            await communicator.send_json_to({'type': 'subscribe', 'subscription_type': 'reminders'})
+            rows = []
+            while True:
+                message = await communicator.receive_json_from()
+                self.assertEqual(message['type'], 'snapshot')
+                rows.extend(message['data'])
+                self.assertLessEqual(len(message['data']), 2)
+                if message['final']:
+                    break
+        self.assertEqual([row['title'] for row in rows], [f'R{i}' for i in range(5)])
+        await communicator.disconnect()
+
+    async def test_resume_replays_only_missed_events(self):
+        # A client was connected earlier and has gone away.
+        await database_sync_to_async(publishers.listener_disconnected)(self.broker.id)
+        seq = await database_sync_to_async(publishers.current_sequence)(self.broker.id)
+
+        def change():
+            reminder = Reminder.objects.get(title='R0')
+            reminder.is_completed = True
+            reminder.save()
+            publisher.flush()
+        await database_sync_to_async(change)()
+
+        communicator = await self.connect()
+        await communicator.send_json_to({
+            'type': 'subscribe', 'subscription_type': 'reminders', 'since': seq,
+        })
+        message = await communicator.receive_json_from()
+        self.assertEqual(message['type'], 'reminder_update')
+        self.assertEqual(message['seq'], seq + 1)
+        self.assertEqual(message['data'][0]['fields']['is_completed'], True)
+        self.assertTrue(await communicator.receive_nothing())
+        await communicator.disconnect()
+
+    async def test_resume_after_unheard_changes_sends_snapshot(self):
+        communicator = await self.connect()
+        await communicator.disconnect()
+        seq = await database_sync_to_async(publishers.current_sequence)(self.broker.id)
+        # The resume window passes, then a reminder changes.
+        await database_sync_to_async(cache.delete)(f'broker_push_recent_listener:{self.broker.id}')
+
+        def change():
+            Reminder.objects.filter(title='R0').get().delete()
+            publisher.flush()
+        await database_sync_to_async(change)()
+
+        communicator = await self.connect()
+        await communicator.send_json_to({
+            'type': 'subscribe', 'subscription_type': 'reminders', 'since': seq,
+        })
+        message = await communicator.receive_json_from()
+        self.assertEqual(message['type'], 'snapshot')
+        self.assertEqual([row['title'] for row in message['data']], [f'R{i}' for i in range(1, 5)])
+        await communicator.disconnect()
+
+    async def test_resume_past_replay_log_falls_back_to_snapshot(self):
+        await database_sync_to_async(cache.set)(f'broker_push_seq:{self.broker.id}', 10, None)
+        communicator = await self.connect()
+        await communicator.send_json_to({'type': 'subscribe', 'subscription_type': 'reminders', 'since': 3})
+        message = await communicator.receive_json_from()
+        self.assertEqual(message['type'], 'snapshot')
+        self.assertEqual(message['seq'], 10)
+        await communicator.disconnect()
+
+    async def test_invalid_since_falls_back_to_snapshot(self):
+        communicator = await self.connect()
+        await communicator.send_json_to({'type': 'subscribe', 'subscription_type': 'reminders', 'since': 'x'})
+        message = await communicator.receive_json_from()
+        self.assertEqual(message['type'], 'snapshot')
+        await communicator.disconnect()
+
+    def test_gap_in_replay_log_needs_a_snapshot(self):
+        publishers.listener_disconnected(self.broker.id)
+        seq = publishers.current_sequence(self.broker.id)
+        for title in ('R0', 'R1'):
+            reminder = Reminder.objects.get(title=title)
+            reminder.is_completed = True
+            reminder.save()
+            publisher.flush()
+        self.assertEqual(len(publishers.events_since(self.broker.id, seq)), 2)
+        cache.delete(f'broker_push_event:{self.broker.id}:{seq + 1}')
+        self.assertIsNone(publishers.events_since(self.broker.id, seq))
+
+    def test_since_ahead_of_a_reset_counter_needs_a_snapshot(self):
+        seq = publishers.current_sequence(self.broker.id)
+        self.assertEqual(publishers.events_since(self.broker.id, seq), [])
+        cache.delete(f'broker_push_seq:{self.broker.id}')
+        self.assertIsNone(publishers.events_since(self.broker.id, seq))
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    BROKER_PUSH_COALESCE_WINDOW=0,
+)
+class BatchWriteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.broker = make_broker()
+        self.other = make_broker('other')
+        self.api = APIClient()
+        self.api.force_authenticate(self.broker)
+        self.layer = get_channel_layer()
+        self.channel = async_to_sync(self.layer.new_channel)()
+        async_to_sync(self.layer.group_add)(f'broker_{self.broker.id}_reminders', self.channel)
+        publishers.listener_connected(self.broker.id)
+
+    def make_reminders(self, count):
+        return Reminder.objects.bulk_create([
+            Reminder(title=f'Reminder {i}', description='', broker=self.broker, due_date=timezone.now())
+            for i in range(count)
+        ])
+
+    def received(self):
+        async def drain():
+            messages = []
+            while True:
+                try:
+                    messages.append(await asyncio.wait_for(self.layer.receive(self.channel), 0.05))
+                except asyncio.TimeoutError:
+                    return messages
+        return async_to_sync(drain)()
+
+    def test_create_list_reports_each_item(self):
+        foreign_client = make_client(self.other, email='foreign@example.com')
+        due = timezone.now().isoformat()
+        items = [{'title': f'Call {i}', 'description': 'Follow up', 'due_date': due} for i in range(3)]
+        items.append({'title': 'No due date', 'description': 'Follow up'})
+        items.append({'title': 'Foreign', 'description': 'Follow up', 'due_date': due, 'client': foreign_client.pk})
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.api.post(reverse('reminder-list'), items, format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([result['status'] for result in response.data['results']], [201, 201, 201, 400, 400])
+        self.assertIn('client', response.data['results'][4]['errors'])
+        self.assertEqual(Reminder.objects.filter(broker=self.broker).count(), 3)
+        self.assertEqual(BrokerStats.objects.get(broker=self.broker).open_reminders, 3)
+        messages = self.received()
+        self.assertEqual(len(messages), 1)
+        self.assertEqual([row['op'] for row in messages[0]['data']], ['created'] * 3)
+
+    def test_partial_update_uses_one_update_statement(self):
+        reminders = self.make_reminders(50)
+        BrokerStats.objects.create(broker=self.broker, open_reminders=50)
+        items = [{'id': reminder.pk, 'is_completed': True} for reminder in reminders]
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as queries:
+            response = self.api.patch(reverse('reminder-batch'), items, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(all(result['data']['is_completed'] for result in response.data['results']))
+        writes = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "broker_operations_reminder"')]
+        self.assertEqual(len(writes), 1)
+        self.assertEqual(Reminder.objects.filter(is_completed=True).count(), 50)
+        self.assertEqual(BrokerStats.objects.get(broker=self.broker).open_reminders, 0)
+        messages = self.received()
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(set(messages[0]['data'][0]['fields']), {'is_completed', 'updated_at'})
+
+    def test_mixed_updates_and_deletes(self):
+        first, second = self.make_reminders(2)
+        foreign = Reminder.objects.create(title='Theirs', description='', broker=self.other, due_date=timezone.now())
+        response = self.api.patch(reverse('reminder-batch'), [
+            {'id': first.pk, 'title': 'Renamed'},
+            {'id': second.pk, 'is_completed': True},
+            {'id': foreign.pk, 'title': 'Hijacked'},
+        ], format='json')
+        self.assertEqual([result['status'] for result in response.data['results']], [200, 200, 404])
+        first.refresh_from_db()
+        self.assertEqual(first.title, 'Renamed')
+        foreign.refresh_from_db()
+        self.assertEqual(foreign.title, 'Theirs')
+
+        response = self.api.delete(reverse('reminder-batch'), {'ids': [first.pk, second.pk, foreign.pk]}, format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertFalse(Reminder.objects.filter(broker=self.broker).exists())
+        self.assertTrue(Reminder.objects.filter(pk=foreign.pk).exists())
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    SCHEDULER_WINDOW=15 * 60,
+)
+class DueSchedulerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.broker = make_broker()
+        self.now = timezone.now()
+        self.layer = get_channel_layer()
+        self.channel = async_to_sync(self.layer.new_channel)()
+        for suffix in ('reminders', 'tasks'):
+            async_to_sync(self.layer.group_add)(f'broker_{self.broker.id}_{suffix}', self.channel)
+
+    def reminder(self, minutes, **kwargs):
+        return Reminder.objects.create(
+            title=f'Due in {minutes}', description='Call back', broker=self.broker,
+            due_date=self.now + timedelta(minutes=minutes), **kwargs,
+        )
+
+    def received(self):
+        async def drain():
+            messages = []
+            while True:
+                try:
+                    messages.append(await asyncio.wait_for(self.layer.receive(self.channel), 0.05))
+                except asyncio.TimeoutError:
+                    return messages
+        return [(message['type'], [row['id'] for row in message['data']]) for message in async_to_sync(drain)()]
+
+    def at(self, minutes):
+        return self.now + timedelta(minutes=minutes)
+
+    def test_items_fire_at_their_due_time_in_windows(self):
+        soon = self.reminder(1)
+        later = self.reminder(30)
+        self.reminder(1, is_completed=True)
+        task = Task.objects.create(
+            title='Send docs', description='Bank statements', broker=self.broker, due_date=self.at(2),
+        )
+        scheduler = DueScheduler()
+        scheduler.start(self.now)
+        self.assertEqual(set(scheduler.entries), {('reminder', soon.pk), ('task', task.pk)})
+
+        scheduler.step(self.at(1.5))
+        self.assertEqual(self.received(), [('reminder_update', [soon.pk])])
+        scheduler.step(self.at(31))
+        self.assertEqual(sorted(self.received()), [('reminder_update', [later.pk]), ('task_update', [task.pk])])
+        scheduler.step(self.at(32))
+        self.assertEqual(self.received(), [])
+
+    @override_settings(SCHEDULER_POLL_OVERLAP=600)
+    def test_inserts_changes_and_deletes_are_picked_up(self):
+        # The overlap covers the simulated clock running ahead of updated_at.
+        scheduler = DueScheduler()
+        scheduler.start(self.now)
+        moved = self.reminder(2)
+        deleted = self.reminder(2)
+        scheduler.step(self.at(0.1))
+        self.assertIn(('reminder', moved.pk), scheduler.entries)
+
+        moved.due_date = self.at(5)
+        moved.save()
+        deleted.delete()
+        scheduler.step(self.at(3))
+        self.assertEqual(self.received(), [])
+        scheduler.step(self.at(6))
+        self.assertEqual(self.received(), [('reminder_update', [moved.pk])])
+
+    def test_items_are_kept_when_firing_fails(self):
+        soon = self.reminder(1)
+        scheduler = DueScheduler()
+        scheduler.start(self.now)
+        with mock.patch.object(DueScheduler, 'fire', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                scheduler.step(self.at(1.5))
+        self.assertEqual(scheduler.fired_until, self.now)
+        self.assertEqual(self.received(), [])
+        scheduler.step(self.at(1.6))
+        self.assertEqual(self.received(), [('reminder_update', [soon.pk])])
+
+    def test_heap_is_rebuilt_when_mostly_stale(self):
+        reminder = self.reminder(10)
+        scheduler = DueScheduler()
+        scheduler.start(self.now)
+        for seconds in range(200):
+            scheduler._add('reminder', reminder.pk, self.at(10) + timedelta(seconds=seconds))
+        scheduler.step(self.at(1))
+        self.assertEqual(scheduler.heap, [(scheduler.entries[('reminder', reminder.pk)], 'reminder', reminder.pk)])
+
+    @override_settings(SCHEDULER_MAX_LOADED=2, SCHEDULER_LOAD_BATCH=2)
+    def test_loaded_items_are_bounded(self):
+        reminders = [self.reminder(1 + i) for i in range(5)]
+        scheduler = DueScheduler()
+        scheduler.start(self.now)
+        self.assertEqual(len(scheduler.entries), 2)
+        fired = []
+        for minute in range(2, 8):
+            scheduler.step(self.at(minute))
+            fired.extend(pk for _, ids in self.received() for pk in ids)
+        self.assertEqual(fired, [reminder.pk for reminder in reminders])
+
+
+class EncodingTests(TestCase):
+    rows = [
+        {'op': 'updated', 'id': 1, 'fields': {'status': 'completed'}},
+        {'op': 'updated', 'id': 2, 'fields': {'status': 'pending'}},
+        {'op': 'deleted', 'id': 3, 'fields': {}},
+    ]
+
+    def test_columnar_round_trip(self):
+        groups = to_columns(self.rows)
+        self.assertEqual(len(groups), 2)
+        self.assertEqual(groups[0]['rows'], [['completed', 'updated', 1], ['pending', 'updated', 2]])
+        self.assertEqual(from_columns(groups)[2], {'op': 'deleted', 'id': 3})
+
+    def test_negotiation(self):
+        encoding, subprotocol = negotiate({'subprotocols': ['other', 'mortgauge.msgpack']})
+        self.assertEqual((encoding.name, subprotocol), ('msgpack', 'mortgauge.msgpack'))
+        encoding, subprotocol = negotiate({'query_string': b'encoding=columnar'})
+        self.assertEqual((encoding.name, subprotocol), ('columnar', None))
+        self.assertEqual(negotiate({})[0].name, 'json')
+
+    def test_compact_encodings_are_smaller(self):
+        event = {'type': 'task_update', 'seq': 1, 'data': [
+            dict(row, fields={'status': 'completed', 'updated_at': '2026-01-01T00:00:00Z'})
+            for row in self.rows[:2] * 50
+        ]}
+        sizes = {name: len(encoding.encode(event)) for name, encoding in ENCODINGS.items()}
+        self.assertLess(sizes['columnar'], sizes['json'])
+        self.assertLess(sizes['msgpack'], sizes['columnar'])
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class ConsumerEncodingTests(TransactionTestCase):
+    async def test_msgpack_subprotocol_sends_binary_frames(self):
+        broker = await database_sync_to_async(make_broker)()
+        communicator = WebsocketCommunicator(
+            BrokerConsumer.as_asgi(), '/ws/', subprotocols=['mortgauge.msgpack']
+        )
+        communicator.scope['user'] = broker
+        connected, subprotocol = await communicator.connect()
+        self.assertEqual(subprotocol, 'mortgauge.msgpack')
+        await communicator.send_json_to({'type': 'subscribe', 'subscription_type': 'tasks'})
+        frame = await communicator.receive_from()
+        message = ENCODINGS['msgpack'].decode(frame)
+        self.assertEqual(message['type'], 'snapshot')
+        self.assertEqual(message['layout'], 'columnar')
+        await communicator.disconnect()
+
+
+class ClientListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.broker = make_broker()
+        created_at = timezone.now()
+        for i in range(25):
+            # Shared timestamps exercise the id tiebreaker.
+            make_client(cls.broker, email=f'client{i}@example.com', created_at=created_at - timedelta(days=i // 5))
+
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(self.broker)
+
+    def test_cursor_pages_cover_every_client_once(self):
+        url, seen = reverse('client-list'), []
+        while url:
+            with self.assertNumQueries(1):
+                response = self.api.get(url, {'page_size': 10} if not seen else None)
+            self.assertNotIn('count', response.data)
+            seen.extend(client['id'] for client in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(len(set(seen)), 25)
+
+    def test_pages_split_inside_timestamp_ties_without_offset(self):
+        url, forward = reverse('client-list'), []
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.api.get(url, {'page_size': 3} if not forward else None)
+            self.assertNotIn('OFFSET', queries[0]['sql'])
+            forward.append([client['id'] for client in response.data['results']])
+            url, previous = response.data['next'], response.data['previous']
+        expected = list(Client.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(sum(forward, []), expected)
+        backward = []
+        while previous:
+            response = self.api.get(previous)
+            backward.insert(0, [client['id'] for client in response.data['results']])
+            previous = response.data['previous']
+        self.assertEqual(backward, forward[:-1])
+
+    def test_page_size_is_capped(self):
+        with mock.patch.object(BrokerCursorPagination, 'max_page_size', 5):
+            response = self.api.get(reverse('client-list'), {'page_size': 10000})
+        self.assertEqual(len(response.data['results']), 5)
+
+    def test_ndjson_export_streams_all_rows(self):
+        response = self.api.get(reverse('client-list'), {'format': 'ndjson'})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 25)
+        self.assertEqual(set(json.loads(lines[0])), {
+            'id', 'first_name', 'last_name', 'email', 'phone', 'address', 'created_at', 'updated_at', 'notes',
+        })
+
+    def test_csv_export_streams_all_rows(self):
+        response = self.api.get(reverse('client-list'), {'format': 'csv'})
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,first_name,last_name,email,phone,address,created_at,updated_at,notes')
+        self.assertEqual(len(lines), 26)
+
+
+class ClientImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.broker = make_broker()
+        cls.other = make_broker('other')
+        make_client(cls.broker, email='existing@example.com')
+        make_client(cls.other, email='taken@example.com')
+
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(self.broker)
+
+    def upload(self, name, content, **data):
+        upload = SimpleUploadedFile(name, content.encode())
+        return self.api.post(reverse('client-import'), {'file': upload, **data}, format='multipart')
+
+    def test_csv_upserts_on_email_and_reports_bad_rows(self):
+        response = self.upload('book.csv', (
+            'first_name,last_name,email,phone,address\n'
+            'Ann,Lee,ann@example.com,0400 123 456,1 Main St\n'
+            'Ex,Isting,existing@example.com,0400 555 555,2 Main St\n'
+            'Bad,Row,not-an-email,0400,3 Main St\n'
+            'Stolen,Row,taken@example.com,0400,4 Main St\n'
+        ))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {key: response.data[key] for key in ('rows', 'created', 'updated', 'error_count')},
+            {'rows': 4, 'created': 1, 'updated': 1, 'error_count': 2},
+        )
+        self.assertEqual([error['line'] for error in response.data['errors']], [4, 5])
+        existing = Client.objects.get(email='existing@example.com')
+        self.assertEqual((existing.first_name, existing.phone_digits), ('Ex', '0400555555'))
+        self.assertEqual(Client.objects.get(email='taken@example.com').broker, self.other)
+        self.assertEqual(Client.objects.get(email='ann@example.com').search_text, 'ann lee ann@example.com')
+        self.assertEqual(BrokerStats.objects.get(broker=self.broker).total_clients, 2)
+
+    def test_reimport_without_a_column_keeps_its_values(self):
+        Client.objects.filter(email='existing@example.com').update(notes='Prefers email')
+        response = self.upload('book.csv', (
+            'first_name,last_name,email,phone,address\n'
+            'Ex,Isting,existing@example.com,0400 555 555,2 Main St\n'
+        ))
+        self.assertEqual(response.data['updated'], 1)
+        existing = Client.objects.get(email='existing@example.com')
+        self.assertEqual((existing.first_name, existing.notes), ('Ex', 'Prefers email'))
+
+    def test_email_inserted_by_another_broker_mid_import_is_not_overwritten(self):
+        # The first read of the owners misses the other broker's row, as if
+        # it was inserted just after.
+        stale = [Client.objects.none(), Client.objects.select_for_update()]
+        with mock.patch.object(Client.objects, 'select_for_update', side_effect=stale):
+            response = self.upload('book.csv', (
+                'first_name,last_name,email,phone,address\n'
+                'Stolen,Row,taken@example.com,0400,4 Main St\n'
+            ))
+        self.assertEqual((response.data['created'], response.data['error_count']), (0, 1))
+        taken = Client.objects.get(email='taken@example.com')
+        self.assertEqual((taken.broker, taken.first_name), (self.other, 'Jane'))
+
+    def test_ndjson_in_batches(self):
+        lines = [json.dumps({
+            'first_name': 'C', 'last_name': str(i), 'email': f'c{i}@example.com', 'phone': '1', 'address': 'x',
+        }) for i in range(5)]
+        lines.insert(2, '{not json')
+        with self.settings(CLIENT_IMPORT_BATCH_SIZE=2):
+            response = self.upload('book.ndjson', '\n'.join(lines) + '\n')
+        self.assertEqual((response.data['created'], response.data['error_count']), (5, 1))
+        self.assertEqual(response.data['errors'][0]['line'], 3)
+
+    def test_management_commands_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'clients.csv')
+            call_command('export_clients', broker='broker', output=path)
+            Client.objects.filter(broker=self.broker).delete()
+            out = StringIO()
+            call_command('import_clients', path, broker='broker', stdout=out)
+        self.assertIn('1 created', out.getvalue())
+        self.assertTrue(Client.objects.filter(email='existing@example.com', broker=self.broker).exists())
+
+
+class DocumentUploadTests(TestCase):
+    def setUp(self):
+        media = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(self.settings(MEDIA_ROOT=media, DOCUMENT_UPLOAD_MAX_CHUNK_SIZE=64 * 1024))
+        self.broker = make_broker()
+        self.client_obj = make_client(self.broker)
+        self.api = APIClient()
+        self.api.force_authenticate(self.broker)
+        self.content = os.urandom(150 * 1024)
+
+    def start(self, **extra):
+        response = self.api.post(reverse('document-upload-list'), {
+            'client': self.client_obj.pk, 'title': 'Statement', 'document_type': 'bank',
+            'filename': 'statement.pdf', 'size': len(self.content), **extra,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return reverse('document-upload-detail', args=[response.data['id']])
+
+    def send(self, url, offset, data):
+        return self.api.patch(url, data, content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset))
+
+    def upload(self, **extra):
+        url = self.start(**extra)
+        for offset in range(0, len(self.content), 64 * 1024):
+            self.assertEqual(self.send(url, offset, self.content[offset:offset + 64 * 1024]).status_code, 200)
+        return self.api.post(url + 'complete/')
+
+    def test_resumable_upload_and_per_client_dedup(self):
+        url = self.start(sha256=hashlib.sha256(self.content).hexdigest())
+        self.assertEqual(self.send(url, 0, self.content[:64 * 1024]).status_code, 200)
+        self.assertEqual(self.send(url, 0, self.content[:64 * 1024]).status_code, 409)
+        self.assertEqual(self.send(url, 64 * 1024, self.content[64 * 1024:]).status_code, 413)
+        response = self.api.get(url)
+        self.assertEqual(response['Upload-Offset'], str(64 * 1024))
+        self.assertEqual(self.send(url, 64 * 1024, self.content[64 * 1024:128 * 1024]).status_code, 200)
+        self.assertEqual(self.send(url, 128 * 1024, self.content[128 * 1024:]).status_code, 200)
+        response = self.api.post(url + 'complete/')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['sha256'], hashlib.sha256(self.content).hexdigest())
+        document = Document.objects.get()
+        with document.file.open('rb') as stored:
+            self.assertEqual(stored.read(), self.content)
+
+        again = self.upload()
+        self.assertEqual((again.status_code, again.data['id']), (200, document.pk))
+        self.assertEqual(Document.objects.count(), 1)
+        self.assertFalse(DocumentUpload.objects.exists())
+
+    def test_racing_chunk_for_a_claimed_offset_writes_nothing(self):
+        pk = self.api.get(self.start()).data['id']
+        first, stale = DocumentUpload.objects.get(pk=pk), DocumentUpload.objects.get(pk=pk)
+        with self.assertRaises(ValidationError):
+            append_chunk(first, 0, io.BytesIO(self.content[:10]), 20)
+        self.assertEqual(DocumentUpload.objects.get(pk=pk).offset, 0)
+
+        append_chunk(first, 0, io.BytesIO(self.content[:20]), 20)
+        with self.assertRaises(OffsetConflict):
+            append_chunk(stale, 0, io.BytesIO(b'x' * 20), 20)
+        with open(partial_path(first), 'rb') as part:
+            self.assertEqual(part.read(), self.content[:20])
+
+    def test_checksum_mismatch_is_rejected(self):
+        response = self.upload(sha256='0' * 64)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Document.objects.exists())
+
+    def test_download_supports_ranges(self):
+        url = reverse('document-download', args=[self.upload().data['id']])
+        response = self.api.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+        response = self.api.get(url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.content)}')
+        self.assertEqual(b''.join(response.streaming_content), self.content[100:200])
+
+        response = self.api.get(url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(b''.join(response.streaming_content), self.content[-10:])
+        self.assertEqual(self.api.get(url, HTTP_RANGE=f'bytes={len(self.content)}-').status_code, 416)
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        self.calls = []
+        self.enterContext(mock.patch.dict(jobs.HANDLERS, {
+            'test.record': lambda value: self.calls.append(value),
+            'test.fail': lambda: 1 / 0,
+        }))
+
+    def test_claimed_jobs_run_once(self):
+        jobs.enqueue('test.record', {'value': 1})
+        jobs.enqueue('test.record', {'value': 2}, run_at=timezone.now() + timedelta(hours=1))
+        claimed = jobs.claim('worker-a')
+        self.assertEqual(len(claimed), 1)
+        self.assertEqual(jobs.claim('worker-b'), [])
+        self.assertTrue(jobs.run(claimed[0]))
+        self.assertEqual(self.calls, [1])
+        self.assertEqual(Job.objects.get(pk=claimed[0].pk).status, 'succeeded')
+
+    @override_settings(JOB_RETRY_BASE_DELAY=10)
+    def test_failures_back_off_then_fail(self):
+        job = jobs.enqueue('test.fail', max_attempts=2)
+        with self.assertLogs('broker_operations.jobs', 'WARNING'):
+            self.assertFalse(jobs.run(jobs.claim('worker')[0]))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('queued', 1))
+        self.assertGreaterEqual(job.run_at, timezone.now() + timedelta(seconds=9))
+        self.assertIn('ZeroDivisionError', job.last_error)
+        self.assertEqual(jobs.claim('worker'), [])
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        with self.assertLogs('broker_operations.jobs', 'WARNING'):
+            self.assertFalse(jobs.run(jobs.claim('worker')[0]))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+        self.assertEqual(jobs.queue_stats()['failed'], 1)
+
+    def test_stale_locks_are_requeued(self):
+        job = jobs.enqueue('test.record', {'value': 1})
+        jobs.claim('dead-worker')
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(jobs.requeue_stale(), 1)
+        self.assertEqual([claimed.pk for claimed in jobs.claim('worker')], [job.pk])
+
+    @override_settings(JOB_RETENTION=60, JOB_FAILED_RETENTION=3600)
+    def test_finished_jobs_are_purged_after_retention(self):
+        old = timezone.now() - timedelta(minutes=5)
+        done, failed, queued = (jobs.enqueue('test.record', {'value': i}) for i in range(3))
+        Job.objects.filter(pk=done.pk).update(status='succeeded', finished_at=old)
+        Job.objects.filter(pk=failed.pk).update(status='failed', finished_at=old)
+        self.assertEqual(jobs.purge_finished(batch_size=1), 1)
+        self.assertEqual(set(Job.objects.values_list('pk', flat=True)), {failed.pk, queued.pk})
+
+    def test_document_upload_enqueues_processing(self):
+        broker = make_broker()
+        client = make_client(broker)
+        api = APIClient()
+        api.force_authenticate(broker)
+        pdf = b'%PDF-1.4\n1 0 obj << /Type /Pages /Count 2 >>\n2 0 obj << /Type /Page >>\n3 0 obj << /Type/Page >>\n'
+        with tempfile.TemporaryDirectory() as media, self.settings(MEDIA_ROOT=media):
+            response = api.post(reverse('document-list'), {
+                'client': client.pk, 'title': 'Contract', 'document_type': 'property',
+                'file': SimpleUploadedFile('contract.pdf', pdf),
+            }, format='multipart')
+            self.assertEqual(response.status_code, 201)
+            document = Document.objects.get()
+            self.assertIsNone(document.processed_at)
+            call_command('run_jobs', until_empty=True, stdout=StringIO())
+        document.refresh_from_db()
+        self.assertEqual(document.sha256, hashlib.sha256(pdf).hexdigest())
+        self.assertEqual((document.size, document.page_count), (len(pdf), 2))
+        self.assertIsNotNone(document.processed_at)
+
+    def test_pdf_page_count_spans_blocks(self):
+        marker = b'/Type /Page '
+        content = b'x' * (64 * 1024 - 5) + marker + b'/Type /Pages' + marker
+        self.assertEqual(count_pdf_pages(io.BytesIO(content)), 2)
+
+
+class ClientSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.broker = make_broker()
+        cls.other = make_broker('other')
+        make_client(cls.broker, email='jose@example.com', first_name='José', last_name='Alvarez', phone='+61 412 345 678')
+        make_client(cls.broker, email='al@example.com', first_name='Al', last_name='Jones', phone='0400 111 222')
+        make_client(cls.broker, email='sally@example.com', first_name='Sally', last_name='Malvern', phone='0400 999 888')
+        make_client(cls.other, email='alvarez@example.com', first_name='Other', last_name='Alvarez')
+
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(self.broker)
+
+    def search(self, query):
+        response = self.api.get(reverse('client-search'), {'q': query})
+        return [client['email'] for client in response.data]
+
+    def test_accent_and_case_insensitive(self):
+        self.assertEqual(self.search('JOSE alv'), ['jose@example.com'])
+
+    def test_phone_digits_match_any_formatting(self):
+        self.assertEqual(self.search('412-345'), ['jose@example.com'])
+        self.assertEqual(self.search('0400'), ['sally@example.com', 'al@example.com'])
+
+    def test_word_prefix_ranks_above_substring(self):
+        # "alv" starts a word for Alvarez but is only inside "Malvern".
+        self.assertEqual(self.search('alv'), ['jose@example.com', 'sally@example.com'])
+
+    def test_search_filter_uses_index_and_scopes_to_broker(self):
+        # One query: the paginator orders the matches, so none are ranked.
+        with self.assertNumQueries(1):
+            response = self.api.get(reverse('client-list'), {'search': 'alvarez'})
+        self.assertEqual([client['email'] for client in response.data['results']], ['jose@example.com'])
+
+    @override_settings(CLIENT_SEARCH_BACKEND='ngram')
+    def test_ngram_index_ranks_like_the_default(self):
+        self.assertEqual(self.search('alv'), ['jose@example.com', 'sally@example.com'])
+        self.assertEqual(self.search('0400'), ['sally@example.com', 'al@example.com'])
+
+    def test_index_follows_client_changes(self):
+        self.assertEqual(self.search('zed'), [])
+        client = Client.objects.get(email='al@example.com')
+        client.last_name = 'Zed'
+        client.save()
+        self.assertEqual(self.search('zed'), ['al@example.com'])
+
+
+@override_settings(CLIENT_TYPEAHEAD_INDEX=True)
+class ClientTypeaheadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.broker = make_broker()
+        cls.other = make_broker('other')
+        make_client(cls.broker, email='jose@example.com', first_name='José', last_name='Alvarez', phone='+61 412 345 678')
+        make_client(cls.broker, email='al@example.com', first_name='Al', last_name='Jones', phone='0400 111 222')
+        make_client(cls.broker, email='sally@example.com', first_name='Sally', last_name='Alvey', phone='0400 999 888')
+        make_client(cls.other, email='alvarez@example.com', first_name='Other', last_name='Alvarez')
+
+    def setUp(self):
+        cache.clear()
+        typeahead_registry.clear()
+        self.api = APIClient()
+        self.api.force_authenticate(self.broker)
+
+    def search(self, query):
+        response = self.api.get(reverse('client-search'), {'q': query})
+        return [client['email'] for client in response.data]
+
+    def test_prefix_search_ranks_exact_words_first(self):
+        self.assertEqual(self.search('al'), ['al@example.com', 'sally@example.com', 'jose@example.com'])
+        self.assertEqual(self.search('jose alv'), ['jose@example.com'])
+        self.assertEqual(self.search('0400'), ['sally@example.com', 'al@example.com'])
+
+    def test_index_is_patched_on_commit(self):
+        self.search('al')
+        index = typeahead_registry.get(self.broker.id)
+        client = Client.objects.get(email='al@example.com')
+        client.last_name = 'Zed'
+        with self.captureOnCommitCallbacks(execute=True):
+            client.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            Client.objects.get(email='sally@example.com').delete()
+        self.assertIs(typeahead_registry.get(self.broker.id), index)
+        self.assertEqual(self.search('zed'), ['al@example.com'])
+        self.assertEqual(self.search('alv'), ['jose@example.com'])
+
+    def test_indexes_are_evicted_over_memory_budget(self):
+        typeahead_registry.get(self.broker.id)
+        with self.settings(CLIENT_TYPEAHEAD_MEMORY_BUDGET=1):
+            typeahead_registry.get(self.other.id)
+        self.assertEqual(typeahead_registry.loaded_brokers(), [self.other.id])
+
+    def test_prefix_index_limit(self):
+        index = PrefixIndex([(pk, f'client{pk} smith', '') for pk in range(1, 101)])
+        self.assertEqual(index.search('smi', 3), [100, 99, 98])
+        self.assertEqual(index.search('client7'), [7, 79, 78, 77, 76, 75, 74, 73, 72, 71, 70])
@@ -0,0 +1,239 @@
+"""
+Optional in-process typeahead index for client search.
+
+Each broker's clients are kept as a sorted list of ``(token, client_id)``
+pairs, where tokens are the words of ``Client.search_text`` and the phone
+digits, so every query word is answered with a bisect over its prefix
+range. Indexes are built on first use, patched by ``Client`` save/delete
+signals, and evicted least-recently-used once the estimated memory of all
+indexes exceeds ``CLIENT_TYPEAHEAD_MEMORY_BUDGET`` bytes.
+
+A per-broker version number kept in the Django cache lets workers notice
+client writes made by other processes; with a per-process cache backend
+only local writes are seen. Enable with ``CLIENT_TYPEAHEAD_INDEX = True``.
+"""
+import bisect
+import heapq
+import sys
+import threading
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .search import WORD_RE, parse_query
+
+PHONE_PREFIX = '#'
+MAX_CHAR = '\U0010ffff'
+# Rough per-entry overhead of a (token, id) tuple and its list slot.
+ENTRY_OVERHEAD = 72
+ROW_OVERHEAD = 200
+
+
+def enabled():
+    return getattr(settings, 'CLIENT_TYPEAHEAD_INDEX', False)
+
+
+def _version_key(broker_id):
+    return f'client_typeahead_version:{broker_id}'
+
+
+def shared_version(broker_id):
+    return cache.get(_version_key(broker_id), 0)
+
+
+def bump_version(broker_id):
+    key = _version_key(broker_id)
+    cache.add(key, 0, timeout=None)
+    return cache.incr(key)
+
+
+def tokens_for(text, phone_digits, words=None):
+    tokens = set(WORD_RE.findall(text) if words is None else words)
+    if phone_digits:
+        tokens.add(PHONE_PREFIX + phone_digits)
+    return tokens
+
+
+class PrefixIndex:
+    def __init__(self, rows, version=0):
+        self.version = version
+        self.rows = {}
+        self.entries = []
+        self.size = 0
+        for pk, text, phone_digits in rows:
+            words = tuple(WORD_RE.findall(text))
+            self.rows[pk] = (text, phone_digits, words)
+            tokens = tokens_for(text, phone_digits, words)
+            self.entries.extend((token, pk) for token in tokens)
+            self.size += ROW_OVERHEAD + sum(sys.getsizeof(token) + ENTRY_OVERHEAD for token in tokens)
+        self.entries.sort()
+
+    def _ids_between(self, low, high):
+        start = bisect.bisect_left(self.entries, low)
+        end = bisect.bisect_left(self.entries, high, start)
+        return {pk for _, pk in self.entries[start:end]}
+
+    def _prefix_ids(self, prefix):
+        return self._ids_between((prefix,), (prefix + MAX_CHAR,))
+
+    def _exact_ids(self, token):
+        return self._ids_between((token,), (token + '\x00',))
+
+    def add(self, pk, text, phone_digits):
+        self.remove(pk)
+        words = tuple(WORD_RE.findall(text))
+        self.rows[pk] = (text, phone_digits, words)
+        for token in tokens_for(text, phone_digits, words):
+            bisect.insort(self.entries, (token, pk))
+            self.size += sys.getsizeof(token) + ENTRY_OVERHEAD
+        self.size += ROW_OVERHEAD
+
+    def remove(self, pk):
+        row = self.rows.pop(pk, None)
+        if row is None:
+            return
+        for token in tokens_for(*row):
+            position = bisect.bisect_left(self.entries, (token, pk))
+            if position < len(self.entries) and self.entries[position] == (token, pk):
+                del self.entries[position]
+            self.size -= sys.getsizeof(token) + ENTRY_OVERHEAD
+        self.size -= ROW_OVERHEAD
+
+    def search(self, query, limit=None):
+        """
+        Client ids whose words start with every query word (or whose phone
+        starts with the query digits), best match first.
+
+        Scoring uses the weights of ``search.score``: every text match has
+        the same word-prefix score, so only exact-word and phone hits need
+        per-row scores. The remaining rows share one bucket and are ordered
+        newest first.
+        """
+        terms, digits = parse_query(query)
+        words = [word for term in terms for word in WORD_RE.findall(term)]
+        text_matches = set()
+        if words:
+            postings = sorted((self._prefix_ids(word) for word in words), key=len)
+            text_matches = postings[0].intersection(*postings[1:])
+        phone_matches = self._prefix_ids(PHONE_PREFIX + digits) if digits else set()
+
+        bonus = Counter()
+        for word in words:
+            bonus.update(self._exact_ids(word) & text_matches)
+        for pk in phone_matches:
+            bonus[pk] += 3
+        base = 2 * len(words)
+        buckets = {}
+        for pk, extra in bonus.items():
+            buckets.setdefault((base if pk in text_matches else 0) + extra, []).append(pk)
+        rest = text_matches.difference(bonus)
+        if rest:
+            buckets.setdefault(base, [])
+
+        ranked = []
+        for score in sorted(buckets, reverse=True):
+            remaining = None if limit is None else limit - len(ranked)
+            if remaining is not None and remaining <= 0:
+                break
+            bucket = buckets[score] + (list(rest) if score == base else [])
+            if remaining is None:
+                ranked.extend(sorted(bucket, reverse=True))
+            else:
+                ranked.extend(heapq.nlargest(remaining, bucket))
+        return ranked
+
+
+class TypeaheadRegistry:
+    def __init__(self):
+        self._indexes = OrderedDict()
+        self._lock = threading.RLock()
+
+    @property
+    def memory_budget(self):
+        return getattr(settings, 'CLIENT_TYPEAHEAD_MEMORY_BUDGET', 64 * 1024 * 1024)
+
+    def memory_used(self):
+        with self._lock:
+            return sum(index.size for index in self._indexes.values())
+
+    def loaded_brokers(self):
+        with self._lock:
+            return list(self._indexes)
+
+    def build(self, broker_id):
+        from .models import Client
+
+        version = shared_version(broker_id)
+        rows = (
+            Client.objects.filter(broker_id=broker_id)
+            .order_by()
+            .values_list('pk', 'search_text', 'phone_digits')
+            .iterator(chunk_size=2000)
+        )
+        return PrefixIndex(rows, version)
+
+    def get(self, broker_id):
+        version = shared_version(broker_id)
+        with self._lock:
+            index = self._indexes.get(broker_id)
+            if index is not None and index.version == version:
+                self._indexes.move_to_end(broker_id)
+                return index
+        index = self.build(broker_id)
+        with self._lock:
+            self._indexes[broker_id] = index
+            self._indexes.move_to_end(broker_id)
+            self._evict()
+        return index
+
+    def _evict(self):
+        budget = self.memory_budget
+        used = sum(index.size for index in self._indexes.values())
+        while used > budget and len(self._indexes) > 1:
+            _, index = self._indexes.popitem(last=False)
+            used -= index.size
+
+    def search(self, broker_id, query, limit=None):
+        return self.get(broker_id).search(query, limit)
+
+    def client_saved(self, pk, broker_id, text, phone_digits, previous_broker_id=None):
+        if previous_broker_id is not None and previous_broker_id != broker_id:
+            self.client_deleted(pk, previous_broker_id)
+        self._apply(broker_id, lambda index: index.add(pk, text, phone_digits))
+
+    def client_deleted(self, pk, broker_id):
+        self._apply(broker_id, lambda index: index.remove(pk))
+
+    def invalidate(self, broker_id):
+        """
+        Drop the broker's index everywhere, e.g. after a bulk write that
+        sent no signals.
+        """
+        bump_version(broker_id)
+        with self._lock:
+            self._indexes.pop(broker_id, None)
+
+    def _apply(self, broker_id, change):
+        """
+        Bump the shared version and patch the local index in place when it
+        was current; otherwise drop it so the next search rebuilds it.
+        """
+        version = bump_version(broker_id)
+        with self._lock:
+            index = self._indexes.get(broker_id)
+            if index is None:
+                return
+            if index.version != version - 1:
+                del self._indexes[broker_id]
+                return
+            change(index)
+            index.version = version
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+
+
+registry = TypeaheadRegistry()
@@ -1,24 +1,38 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from . import views
+from . import async_views, views
 
 router = DefaultRouter()
 router.register(r'clients', views.ClientViewSet, basename='client')
 router.register(r'documents', views.DocumentViewSet, basename='document')
+router.register(r'document-uploads', views.DocumentUploadViewSet, basename='document-upload')
 router.register(r'applications', views.ApplicationViewSet, basename='application')
+router.register(r'tasks', views.TaskViewSet, basename='task')
+router.register(r'reminders', views.ReminderViewSet, basename='reminder')
+router.register(r'scripts', views.InterviewScriptViewSet, basename='script')
+router.register(r'script-sections', views.ScriptSectionViewSet, basename='script-section')
+
+# The async dashboard views avoid a thread per request under ASGI.
+dashboard = async_views if getattr(settings, 'DASHBOARD_ASYNC_VIEWS', False) else views
 
 urlpatterns = [
     # Authentication URLs
     path('auth/register/', views.register, name='register'),
     path('auth/login/', views.login, name='login'),
     path('auth/logout/', views.logout, name='logout'),
+    path('auth/refresh/', views.TokenRefresh.as_view(), name='token-refresh'),
     path('auth/me/', views.me, name='me'),
 
     # Dashboard URLs
-    path('dashboard/summary/', views.dashboard_summary, name='dashboard-summary'),
-    path('dashboard/activity/', views.dashboard_activity, name='dashboard-activity'),
-    path('dashboard/reminders/', views.dashboard_reminders, name='dashboard-reminders'),
-    path('dashboard/tasks/', views.dashboard_tasks, name='dashboard-tasks'),
+    path('dashboard/', views.dashboard_bootstrap, name='dashboard'),
+    path('dashboard/summary/', dashboard.dashboard_summary, name='dashboard-summary'),
+    path('dashboard/summary/cache-stats/', views.dashboard_summary_cache_stats, name='dashboard-summary-cache-stats'),
+    path('dashboard/activity/', dashboard.dashboard_activity, name='dashboard-activity'),
+    path('dashboard/reminders/', dashboard.dashboard_reminders, name='dashboard-reminders'),
+    path('dashboard/tasks/', dashboard.dashboard_tasks, name='dashboard-tasks'),
+
+    path('metrics/', views.metrics_export, name='metrics'),
 
     # Include router URLs
     path('', include(router.urls)),
@@ -1,23 +1,42 @@
+import os
+
 from django.shortcuts import render
-from rest_framework import viewsets, filters, status
-from rest_framework.permissions import IsAuthenticated
+from rest_framework import viewsets, filters, mixins, status
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.decorators import api_view, permission_classes, action
+from rest_framework.parsers import FormParser, MultiPartParser
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.views import TokenRefreshView
 from django.contrib.auth.models import User
-from django.db.models import Q
-from .models import InterviewScript, ScriptSection, Client, Document, Application, Task, Reminder
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Prefetch
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from . import script_cache
+from .batch import BatchWriteMixin
+from .blacklist import RevocableRefreshToken
+from . import dashboard, documents, metrics, passwords, ratelimit
+from .client_import import detect_format, import_clients
+from .fast_read import FastListMixin
+from .dashboard import get_summary, summary_cache_stats
+from .pagination import BrokerCursorPagination, DueDateCursorPagination, UploadedCursorPagination
+from .search import ClientSearchFilter, search_clients
+from . import typeahead
+from .streaming import CSVExportMixin, NDJSONExportMixin
+from .models import InterviewScript, ScriptSection, Client, Document, DocumentUpload, Application, Task, Reminder
 from .serializers import (
     InterviewScriptSerializer,
     InterviewScriptCreateSerializer,
     ScriptSectionSerializer,
     UserSerializer, UserCreateSerializer, ClientSerializer,
-    DocumentSerializer, ApplicationSerializer, TaskSerializer,
-    ReminderSerializer
+    DocumentSerializer, DocumentUploadSerializer, ApplicationSerializer, TaskSerializer,
+    ReminderSerializer, RevocableTokenRefreshSerializer
 )
 from django.utils import timezone
+from django.utils.crypto import constant_time_compare
 
 # Create your views here.
 
@@ -45,10 +64,44 @@ class InterviewScriptViewSet(viewsets.ModelViewSet):
     ordering_fields = ['created_at', 'updated_at', 'total_duration']
 
     def get_serializer_class(self):
-        if self.action == 'create':
+        if self.action in ('create', 'update', 'partial_update'):
             return InterviewScriptCreateSerializer
         return InterviewScriptSerializer
 
+    def get_field_selection(self):
+        """
+        Parse the sparse fieldset parameters for list and retrieve.
+
+        `?fields=id,title,sections.title` limits the script fields and, via
+        dotted names, the section fields. When `fields` is given, sections
+        are only included if named there or requested with `?expand=sections`.
+        Returns `(fields, section_fields)`; `None` means all fields.
+        """
+        if self.action not in ('list', 'retrieve'):
+            return None, None
+        fields_param = self.request.query_params.get('fields')
+        if not fields_param:
+            return None, None
+        expand = self.request.query_params.get('expand', '').split(',')
+        fields, section_fields = [], []
+        for name in filter(None, (part.strip() for part in fields_param.split(','))):
+            if name.startswith('sections.'):
+                section_fields.append(name[len('sections.'):])
+            else:
+                fields.append(name)
+        if section_fields or 'sections' in expand:
+            fields.append('sections')
+        if 'sections' in fields and not section_fields:
+            section_fields = None
+        return fields, section_fields
+
+    def get_serializer(self, *args, **kwargs):
+        fields, section_fields = self.get_field_selection()
+        if fields is not None:
+            kwargs['fields'] = fields
+            kwargs['section_fields'] = section_fields
+        return super().get_serializer(*args, **kwargs)
+
     def get_queryset(self):
         """
         Optionally filter by active status and script type
@@ -61,9 +114,84 @@ class InterviewScriptViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(is_active=True)
         if script_type:
             queryset = queryset.filter(script_type=script_type)
-            
+
+        fields, section_fields = self.get_field_selection()
+        if fields is not None:
+            model_fields = {field.name for field in InterviewScript._meta.concrete_fields}
+            queryset = queryset.only(*(model_fields & set(fields)) | {'id', 'updated_at'})
+        if fields is None or 'sections' in fields:
+            sections = ScriptSection.objects.order_by('order')
+            if section_fields:
+                section_model_fields = {field.name for field in ScriptSection._meta.concrete_fields}
+                sections = sections.only(*(section_model_fields & set(section_fields)) | {'id', 'order'})
+            queryset = queryset.prefetch_related(Prefetch('sections', queryset=sections))
         return queryset
 
+    def list(self, request, *args, **kwargs):
+        """
+        Serve pages from the script cache, answering conditional requests
+        with 304 before any query is made.
+        """
+        key = script_cache.list_key(request)
+        entry = cache.get(key)
+        if entry is None:
+            queryset = self.filter_queryset(self.get_queryset())
+            page = self.paginate_queryset(queryset)
+            scripts = page if page is not None else list(queryset)
+            data = self.get_serializer(scripts, many=True).data
+            if page is not None:
+                data = self.get_paginated_response(data).data
+            body = script_cache.render(data)
+            # No Last-Modified: the newest updated_at does not change when a
+            # script is deleted.
+            entry = dict(script_cache.make_entry(body), body=body)
+            cache.set(key, entry, script_cache.CACHE_TIMEOUT)
+        return script_cache.respond(request, entry, entry['body'])
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        pointer_key = script_cache.pointer_key(request, pk)
+        pointer = cache.get(pointer_key)
+        if pointer is not None:
+            if script_cache.not_modified(request, pointer):
+                return script_cache.respond(request, pointer, None)
+            body = cache.get(pointer['body_key'])
+            if body is not None:
+                return script_cache.respond(request, pointer, body)
+
+        try:
+            row = (
+                self.filter_queryset(self.get_queryset())
+                .prefetch_related(None)
+                .filter(pk=pk)
+                .values('version', 'updated_at')
+                .first()
+            )
+        except (TypeError, ValueError, ValidationError):
+            row = None
+        if row is None:
+            raise Http404
+        key = script_cache.body_key(request, pk, row['version'], row['updated_at'])
+        body = cache.get(key)
+        if body is None:
+            body = script_cache.render(self.get_serializer(self.get_object()).data)
+            cache.set(key, body, script_cache.CACHE_TIMEOUT)
+        pointer = dict(script_cache.make_entry(body, row['updated_at']), body_key=key)
+        cache.set(pointer_key, pointer, script_cache.CACHE_TIMEOUT)
+        return script_cache.respond(request, pointer, body)
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        script_cache.invalidate()
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        script_cache.invalidate()
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        script_cache.invalidate()
+
 class ScriptSectionViewSet(viewsets.ModelViewSet):
     """
     API endpoint for managing script sections.
@@ -74,6 +202,27 @@ class ScriptSectionViewSet(viewsets.ModelViewSet):
     filter_backends = [filters.OrderingFilter]
     ordering_fields = ['order']
 
+    def touch_scripts(self, script_ids):
+        """
+        Bump updated_at on the scripts using a section, so their cached
+        bodies and Last-Modified headers move on, then invalidate.
+        """
+        InterviewScript.objects.filter(pk__in=script_ids).update(updated_at=timezone.now())
+        script_cache.invalidate()
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        script_cache.invalidate()
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        self.touch_scripts(list(serializer.instance.scripts.values_list('pk', flat=True)))
+
+    def perform_destroy(self, instance):
+        script_ids = list(instance.scripts.values_list('pk', flat=True))
+        super().perform_destroy(instance)
+        self.touch_scripts(script_ids)
+
 # Authentication Views
 @api_view(['POST'])
 @permission_classes([AllowAny])
@@ -81,7 +230,7 @@ def register(request):
     serializer = UserCreateSerializer(data=request.data)
     if serializer.is_valid():
         user = serializer.save()
-        refresh = RefreshToken.for_user(user)
+        refresh = RevocableRefreshToken.for_user(user)
         return Response({
             'user': UserSerializer(user).data,
             'refresh': str(refresh),
@@ -94,17 +243,17 @@ def register(request):
 def login(request):
     username = request.data.get('username')
     password = request.data.get('password')
-    try:
-        user = User.objects.get(username=username)
-        if user.check_password(password):
-            refresh = RefreshToken.for_user(user)
-            return Response({
-                'user': UserSerializer(user).data,
-                'refresh': str(refresh),
-                'access': str(refresh.access_token),
-            })
-    except User.DoesNotExist:
-        pass
+    buckets = ratelimit.login_buckets(request, username)
+    ratelimit.check_login_allowed(buckets)
+    user = User.objects.filter(username=username).first()
+    if passwords.check_user_password(user, password):
+        refresh = RevocableRefreshToken.for_user(user)
+        return Response({
+            'user': UserSerializer(user).data,
+            'refresh': str(refresh),
+            'access': str(refresh.access_token),
+        })
+    ratelimit.record_login_failure(buckets)
     return Response({'error': 'Invalid credentials'}, status=status.HTTP_401_UNAUTHORIZED)
 
 @api_view(['POST'])
@@ -112,22 +261,26 @@ def login(request):
 def logout(request):
     try:
         refresh_token = request.data["refresh"]
-        token = RefreshToken(refresh_token)
+        token = RevocableRefreshToken(refresh_token)
         token.blacklist()
         return Response(status=status.HTTP_205_RESET_CONTENT)
     except Exception:
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
+class TokenRefresh(TokenRefreshView):
+    serializer_class = RevocableTokenRefreshSerializer
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def me(request):
     return Response(UserSerializer(request.user).data)
 
 # Client Views
-class ClientViewSet(viewsets.ModelViewSet):
+class ClientViewSet(CSVExportMixin, NDJSONExportMixin, FastListMixin, viewsets.ModelViewSet):
     serializer_class = ClientSerializer
     permission_classes = [IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    pagination_class = BrokerCursorPagination
+    filter_backends = [DjangoFilterBackend, ClientSearchFilter]
     search_fields = ['first_name', 'last_name', 'email', 'phone']
 
     def get_queryset(self):
@@ -138,40 +291,143 @@ class ClientViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'])
     def search(self, request):
+        """
+        Ranked client search over names, email and phone digits.
+        """
         query = request.query_params.get('q', '')
-        clients = self.get_queryset().filter(
-            Q(first_name__icontains=query) |
-            Q(last_name__icontains=query) |
-            Q(email__icontains=query) |
-            Q(phone__icontains=query)
-        )
+        limit = getattr(settings, 'CLIENT_SEARCH_LIMIT', 50)
+        clients = self.get_queryset()
+        if query.strip() and typeahead.enabled():
+            ids = typeahead.registry.search(request.user.id, query, limit)
+            found = clients.in_bulk(ids)
+            clients = [found[pk] for pk in ids if pk in found]
+        elif query.strip():
+            clients = search_clients(clients, query, request.user.id, limit)
+        else:
+            clients = clients[:limit]
         serializer = self.get_serializer(clients, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['post'], url_path='import', url_name='import',
+            parser_classes=[MultiPartParser, FormParser])
+    def bulk_import(self, request):
+        """
+        Upsert clients from an uploaded CSV or NDJSON `file`, matched on
+        email. The format comes from `file_format` or the file extension.
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'file': ['No file was submitted.']}, status=status.HTTP_400_BAD_REQUEST)
+        file_format = request.data.get('file_format') or detect_format(upload.name)
+        if file_format not in ('csv', 'ndjson'):
+            return Response(
+                {'file_format': ['Expected csv or ndjson.']}, status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(import_clients(request.user, upload, file_format))
+
 # Document Views
-class DocumentViewSet(viewsets.ModelViewSet):
+class DocumentViewSet(NDJSONExportMixin, viewsets.ModelViewSet):
     serializer_class = DocumentSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = UploadedCursorPagination
 
     def get_queryset(self):
         return Document.objects.filter(client__broker=self.request.user)
 
-    @action(detail=False, methods=['post'])
-    def upload_client_document(self, request, client_id=None):
+    def perform_create(self, serializer):
+        documents.enqueue_processing(serializer.save())
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """
+        Stream the file, honouring a single-range `Range` header.
+        """
+        document = self.get_object()
+        storage, name = document.file.storage, document.file.name
+        size = document.size if document.size is not None else storage.size(name)
+        etag = f'"{document.sha256}"' if document.sha256 else None
+        range_header = request.headers.get('Range')
+        if_range = request.headers.get('If-Range')
+        if if_range and if_range != etag:
+            range_header = None
         try:
-            client = Client.objects.get(id=client_id, broker=request.user)
-            serializer = self.get_serializer(data=request.data)
-            if serializer.is_valid():
-                serializer.save(client=client)
-                return Response(serializer.data, status=status.HTTP_201_CREATED)
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-        except Client.DoesNotExist:
-            return Response(status=status.HTTP_404_NOT_FOUND)
+            byte_range = documents.parse_range(range_header, size)
+        except ValueError:
+            response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        start, end = byte_range or (0, size - 1)
+        response = StreamingHttpResponse(
+            documents.stream_file(storage.open(name, 'rb'), start, end - start + 1),
+            status=status.HTTP_206_PARTIAL_CONTENT if byte_range else status.HTTP_200_OK,
+            content_type=documents.content_type_for(name),
+        )
+        response['Content-Length'] = str(end - start + 1)
+        response['Accept-Ranges'] = 'bytes'
+        response['Content-Disposition'] = f'attachment; filename="{os.path.basename(name)}"'
+        if byte_range:
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        if etag:
+            response['ETag'] = etag
+        return response
+
+class DocumentUploadViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin,
+                            mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    """
+    Resumable uploads: create with the file's metadata and size, PATCH raw
+    bytes with an `Upload-Offset` header until complete, then POST
+    `complete/`. GET returns the offset to resume from.
+    """
+    serializer_class = DocumentUploadSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return DocumentUpload.objects.filter(client__broker=self.request.user)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        upload = getattr(self, 'upload', None)
+        if upload is not None:
+            response['Upload-Offset'] = str(upload.offset)
+        return response
+
+    def get_object(self):
+        self.upload = super().get_object()
+        return self.upload
+
+    def partial_update(self, request, pk=None):
+        upload = self.get_object()
+        offset = request.headers.get('Upload-Offset', '')
+        length = request.META.get('CONTENT_LENGTH', '')
+        if not length:
+            raise documents.LengthRequired()
+        if not offset.isdigit() or not length.isdigit():
+            return Response(
+                {'detail': 'Upload-Offset and Content-Length must be byte counts.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        # Read the raw request stream; request.data would buffer the body.
+        documents.append_chunk(upload, int(offset), request.stream, int(length))
+        return Response(self.get_serializer(upload).data)
+
+    def perform_destroy(self, instance):
+        documents.discard_upload(instance)
+
+    @action(detail=True, methods=['post'])
+    def complete(self, request, pk=None):
+        upload = self.get_object()
+        document, created = documents.complete_upload(upload)
+        self.upload = None
+        return Response(
+            DocumentSerializer(document, context=self.get_serializer_context()).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
 
 # Application Views
-class ApplicationViewSet(viewsets.ModelViewSet):
+class ApplicationViewSet(NDJSONExportMixin, FastListMixin, viewsets.ModelViewSet):
     serializer_class = ApplicationSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = BrokerCursorPagination
 
     def get_queryset(self):
         return Application.objects.filter(broker=self.request.user)
@@ -185,56 +441,86 @@ class ApplicationViewSet(viewsets.ModelViewSet):
         new_status = request.data.get('status')
         if new_status in dict(Application.STATUS_CHOICES):
             application.status = new_status
-            application.save()
+            # BrokerStats counters are adjusted by the post_save signal.
+            application.save(update_fields=['status', 'updated_at'])
             return Response(self.get_serializer(application).data)
         return Response({'error': 'Invalid status'}, status=status.HTTP_400_BAD_REQUEST)
 
+# Task and Reminder Views
+class TaskViewSet(BatchWriteMixin, FastListMixin, viewsets.ModelViewSet):
+    serializer_class = TaskSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = DueDateCursorPagination
+
+    def get_queryset(self):
+        return Task.objects.filter(broker=self.request.user)
+
+    def perform_create(self, serializer):
+        serializer.save(broker=self.request.user)
+
+class ReminderViewSet(BatchWriteMixin, FastListMixin, viewsets.ModelViewSet):
+    serializer_class = ReminderSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = DueDateCursorPagination
+
+    def get_queryset(self):
+        return Reminder.objects.filter(broker=self.request.user)
+
+    def perform_create(self, serializer):
+        serializer.save(broker=self.request.user)
+
 # Dashboard Views
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def dashboard_summary(request):
-    user = request.user
-    summary = {
-        'total_clients': Client.objects.filter(broker=user).count(),
-        'active_applications': Application.objects.filter(broker=user, status__in=['submitted', 'under_review']).count(),
-        'pending_tasks': Task.objects.filter(broker=user, status='pending').count(),
-        'upcoming_reminders': Reminder.objects.filter(broker=user, is_completed=False).count(),
-    }
-    return Response(summary)
+    summary, hit = get_summary(request.user.id)
+    response = Response(summary)
+    response['X-Cache'] = 'HIT' if hit else 'MISS'
+    return response
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def dashboard_summary_cache_stats(request):
+    return Response(summary_cache_stats())
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def dashboard_activity(request):
-    user = request.user
-    activities = {
-        'recent_applications': ApplicationSerializer(
-            Application.objects.filter(broker=user).order_by('-created_at')[:5],
-            many=True
-        ).data,
-        'recent_tasks': TaskSerializer(
-            Task.objects.filter(broker=user).order_by('-created_at')[:5],
-            many=True
-        ).data,
-    }
-    return Response(activities)
+    return Response(dashboard.activity_section(request.user))
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def dashboard_reminders(request):
-    user = request.user
-    reminders = Reminder.objects.filter(
-        broker=user,
-        is_completed=False,
-        due_date__gte=timezone.now()
-    ).order_by('due_date')
-    return Response(ReminderSerializer(reminders, many=True).data)
+    return Response(dashboard.reminders_section(request.user, timezone.now()))
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def dashboard_tasks(request):
-    user = request.user
-    tasks = Task.objects.filter(
-        broker=user,
-        status__in=['pending', 'in_progress']
-    ).order_by('due_date')
-    return Response(TaskSerializer(tasks, many=True).data)
+    return Response(dashboard.tasks_section(request.user))
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def dashboard_bootstrap(request):
+    """
+    The sections named in `?sections=` (all by default) in one response,
+    answering If-None-Match with 304 after a single version query.
+    """
+    sections = dashboard.parse_sections(request.query_params.get('sections'))
+    now = timezone.now()
+    entry = {'etag': dashboard.dashboard_etag(request.user.id, sections, now), 'last_modified': None}
+    if script_cache.not_modified(request, entry):
+        return script_cache.respond(request, entry, None)
+    data = dashboard.build_dashboard(request.user, sections, now)
+    return script_cache.respond(request, entry, script_cache.render(data))
+
+def metrics_export(request):
+    """
+    Request metrics in the Prometheus text format, for a scraper holding
+    ``PERF_METRICS_TOKEN``. Not served when that setting is unset.
+    """
+    token = getattr(settings, 'PERF_METRICS_TOKEN', None)
+    if not token:
+        raise Http404
+    if not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse(status=401, headers={'WWW-Authenticate': 'Bearer'})
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')